@@ -8,9 +8,12 @@ from extract2df import ebas2df
 from extract2df import milos2df
 # from extract2df import utils
 from convert import milos2vrxa00
-# from df2sqlite import df2sqlite
+from df2sqlite import df2sqlite
+from df2sqlite.ledger import IngestLedger
+from df2sqlite.bulk import BulkLoader
+from df2sqlite import rollup
 
-from jklutils import mchfilebrowser, df2sqlite
+from jklutils import mchfilebrowser
 
 # %%
 # download data from DWH or load from file
@@ -34,23 +37,13 @@ def download_from_ebas():
     SOURCE = "ebas"
     GAWID = "mkn"
 
+    # one file at a time per directory (data type), mappings merged across files
     for dpath, dnames, fnames in os.walk(os.path.join(ROOT, SOURCE)):
-        df = pd.DataFrame()
-        long_names = []
-        for fname in fnames:
-            print(dpath, dnames, fname)
-            file = os.path.join(dpath, fname)
-            tmp = ebas2df.extract_nasa_ames_file(file=file)
-            df = pd.concat([df, tmp['df']])
-        if not df.empty:
-            # upload to sqlite db
-            res = df2sqlite.df2sqlite(df=tmp['mappings'], 
-                db=os.path.join(ROOT, GAWID), 
-                tbl=f"{SOURCE}_mappings_{os.path.basename(dpath)}")
-            # tmp['mappings'].to_sql(name=f"{source}_mappings_{os.path.basename(dpath)}", con=con, if_exists='replace')
-        
-            res = df2sqlite.df2sqlite(df, db=os.path.join(ROOT, GAWID), tbl=f"{SOURCE}_{os.path.basename(dpath)}")
-            # df.to_sql(name=f"{source}_{os.path.basename(dpath)}", con=con, if_exists='replace')
+        if not fnames:
+            continue
+        res = ebas2df.ebas2sqlite(dpath, db=os.path.join(ROOT, GAWID), tbl=f"{SOURCE}_{os.path.basename(dpath)}",
+                                  mappings=f"{SOURCE}_mappings_{os.path.basename(dpath)}")
+        print(dpath, res)
 
 # combine ozone data as DB view
 # qry = "DROP VIEW 'V_O3'; CREATE VIEW 'V_O3' AS select dtm, O3_0 as 'O3_ug_m-3', O3_1 as 'sdO3_ug_m-3' from o3_legacy UNION select dtm, O3_0 as 'O3_ug_m-3', O3_2 as 'sdO3_ug_m-3' from o3"
@@ -63,39 +56,55 @@ def process_meteo_bulletins():
     DB = os.path.join(ROOT, f"{GAWID.lower()}.sqlite")
     OLD_NAMES = "VMSW43"
     NEW_NAMES = "VRXA00"
+    # VRXA00 bulletins supersede VMSW43 bulletins for the same timestamp
+    PRECEDENCE = [NEW_NAMES, OLD_NAMES]
     TARGET = os.path.join(ROOT, NEW_NAMES)
     BASE_URL = f"https://hub.meteoswiss.ch/filebrowser/pay-data/data/pay/Kenya/{GAWID.upper()}/"
     URLS = [f"{BASE_URL}archive/2021/{SOURCE}", 
         f"{BASE_URL}archive/2022/{SOURCE}", 
         f"{BASE_URL}incoming/{SOURCE}"]
 
-    # Download and rename all existing VMSW43 bulletins from MKN
-    for url in URLS:
-        # process bulletins with old names
-        files = mchfilebrowser.get_urls_from_filebrowser(url=url, pattern=rf">({OLD_NAMES}.+.[zip|001])<")
-        msg = 'Downloading and extracting files from %s ...' % url
-        print(msg)
-
-        cnt = 1
-        for file in files:
-            print(f"({cnt}/{len(files)})")
-            df = bulletin2df.extract_bulletin_file(file, pattern=OLD_NAMES, replace=NEW_NAMES, target=TARGET)
-            res = df2sqlite.df2sqlite(df, db=DB, tbl=f"{SOURCE}")
-            cnt += 1
-
-        # process bulletins with new names
-        files = mchfilebrowser.get_urls_from_filebrowser(url=url, pattern=rf">({NEW_NAMES}.+.[zip|001])<")
-        msg = 'Downloading and extracting files from %s ...' % url
-        print(msg)
-
-        cnt = 1
-        for file in files:
-            print(f"({cnt}/{len(files)})")
-            df = bulletin2df.extract_bulletin_file(file, pattern=NEW_NAMES)
-            res = df2sqlite.df2sqlite(df, db=DB, tbl=f"{SOURCE}")
-            cnt += 1
-
-        print('done.')
+    # one bulk-load session for all bulletins, committed every 100 files; rollups updated once at the end
+    loaded = []
+    with BulkLoader(DB, verbose=False) as session:
+        # Download and rename all existing VMSW43 bulletins from MKN
+        for url in URLS:
+            # process bulletins with old names
+            files = mchfilebrowser.get_urls_from_filebrowser(url=url, pattern=rf">({OLD_NAMES}.+.[zip|001])<")
+            msg = 'Downloading and extracting files from %s ...' % url
+            print(msg)
+
+            cnt = 1
+            for file in files:
+                print(f"({cnt}/{len(files)})")
+                df = bulletin2df.extract_bulletin_file(file, pattern=OLD_NAMES, replace=NEW_NAMES, target=TARGET)
+                res = df2sqlite.df2sqlite(df, db=DB, tbl=f"{SOURCE}", upsert=True, precedence=PRECEDENCE,
+                                          session=session)
+                if res is not None:
+                    loaded.append(df.index)
+                session.done()
+                cnt += 1
+
+            # process bulletins with new names
+            files = mchfilebrowser.get_urls_from_filebrowser(url=url, pattern=rf">({NEW_NAMES}.+.[zip|001])<")
+            msg = 'Downloading and extracting files from %s ...' % url
+            print(msg)
+
+            cnt = 1
+            for file in files:
+                print(f"({cnt}/{len(files)})")
+                df = bulletin2df.extract_bulletin_file(file, pattern=NEW_NAMES)
+                res = df2sqlite.df2sqlite(df, db=DB, tbl=f"{SOURCE}", upsert=True, precedence=PRECEDENCE,
+                                          session=session)
+                if res is not None:
+                    loaded.append(df.index)
+                session.done()
+                cnt += 1
+
+            print('done.')
+
+    if loaded:
+        rollup.update_rollups(DB, SOURCE, loaded[0].append(loaded[1:]))
 
 
 # %%
@@ -107,18 +116,43 @@ def process_milos_files():
     TARGET = os.path.join(ROOT, "vrxa00")
 
     # %%
+    ledger = IngestLedger(DB)
     for root, dirs, files in os.walk(os.path.join(ROOT, SOURCE)):
         # print(f"{root}, {dirs}, {files}")
         for file in files:
             fpath = os.path.join(root, file)
+            if ledger.is_loaded(fpath):
+                print(f"{fpath} already loaded, skipped.")
+                continue
             df = milos2df.milos2df(fpath)
 
-            # extract and aggregate ozone values
-            o3 = milos2df.extract_o3(df=df, aggregate="10M")
-            df2sqlite.df2sqlite(df, db=DB, tbl=f"{SOURCE}_o3")
+            # extract and aggregate ozone values to 10-min means
+            o3 = milos2df.extract_o3(df=df, aggregate="10min")
+            df2sqlite.df2sqlite(o3, db=DB, tbl=f"{SOURCE}_o3")
             
-            df2sqlite.df2sqlite(df, db=DB, tbl=SOURCE)
+            res = df2sqlite.df2sqlite(df, db=DB, tbl=SOURCE)
+            if res is not None:
+                ledger.record(fpath, SOURCE, len(df))
+                # recompute the hourly and daily means of the days in this file
+                rollup.update_rollups(DB, SOURCE, df.index)
             milos2vrxa00.df2vrxa00(df, dwh_station_id=DWH_STATION_ID, target=os.path.join(TARGET, f"VRXA00.{file}.001"))
+    ledger.close()
+    print("done.")
+
+# %%
+def rebuild_milos():
+    """Parse the whole MILOS archive in one go and overwrite the MILOS tables with it."""
+    ROOT = "C:/Users/localadmin/Documents/data"
+    DB = os.path.join(ROOT, "mkn.sqlite")
+    SOURCE = "milos"
+
+    df = milos2df.milos_dir2df(os.path.join(ROOT, SOURCE))
+    if df.empty:
+        return
+    o3 = milos2df.extract_o3(df=df, aggregate="10min")
+    df2sqlite.upsert2sqlite(o3, db=DB, tbl=f"{SOURCE}_o3", on_conflict='update')
+    df2sqlite.upsert2sqlite(df, db=DB, tbl=SOURCE, on_conflict='update')
+    rollup.update_rollups(DB, SOURCE)
     print("done.")
 
 # %%
@@ -131,5 +165,6 @@ GAWID = 'MKN'
 DWH = 'KEMKN'
 cfg = dwh2df.get_config(DWH)
 
-df = dwh2df.dwh2df(cfg=cfg, station=DWH, since='202209010000')
-res = df2sqlite.df2sqlite(df, db=os.path.join(ROOT, "".join([GAWID, ".sqlite"])), tbl=f"dwh_{DWH}")
+# fetch only data newer than the last record in dwh_KEMKN, one month per request
+res = dwh2df.jretrieve2sqlite(DWH, cfg, db=os.path.join(ROOT, "".join([GAWID, ".sqlite"])), incremental=True, workers=4,
+                             rollup=True)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Per-file timing of the baseline timestamp construction vs. extract2df.timestamps.
+
+tei49 and bulletins compare the expressions the baseline extractors used with the kernels replacing them, on the
+sample files in data/. WDCGG and MILOS compare the extractors of the baseline tree (commit BASELINE, loaded with
+git) with the current ones, end to end on generated files, since their timestamps were built by read_csv itself;
+the baseline extractors need pandas < 3 (parse_dates dicts, date_parser) and are reported as n/a otherwise.
+
+Run from the repository root: python -m benchmarks.bench_timestamps
+"""
+# %%
+import os
+import ast
+import glob
+import timeit
+import zipfile
+import tempfile
+import functools
+import subprocess
+import pandas as pd
+from extract2df import timestamps
+from extract2df import milos2df
+from extract2df import wdcgg2df
+from benchmarks import generators
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, "data")
+BASELINE = "a6ee1ce"
+WORK = tempfile.mkdtemp(prefix="bench_timestamps_")
+
+
+# %%
+@functools.lru_cache(maxsize=None)
+def baseline(path: str, name: str):
+    """A function of the baseline tree, defined without running the rest of its module (imports and functions only)."""
+    src = subprocess.run(["git", "show", f"{BASELINE}:{path}"], capture_output=True, text=True, check=True,
+                         cwd=ROOT).stdout
+    tree = ast.parse(src)
+    tree.body = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef))]
+    namespace = {}
+    exec(compile(tree, f"{BASELINE}:{path}", "exec"), namespace)
+    return namespace[name]
+
+
+def _tei49(file: str) -> pd.DataFrame:
+    with zipfile.ZipFile(file) as zf:
+        return pd.read_csv(zf.open(zf.namelist()[0]), sep=' +', engine='python')
+
+
+def _bulletin(file: str) -> pd.DataFrame:
+    if file.endswith('.zip'):
+        with zipfile.ZipFile(file) as zf:
+            return pd.read_csv(zf.open(zf.namelist()[0]), skiprows=1, header=1, sep=' ', na_values='/')
+    return pd.read_csv(file, skiprows=1, header=1, sep=' ', na_values='/')
+
+
+def _quiet(func):
+    """The baseline extractors print and return None on errors; None marks the case n/a."""
+    def call(*args):
+        res = func(*args)
+        if res is None:
+            raise RuntimeError(f"{func.__name__} failed")
+        return res
+    return call
+
+
+# case: (inputs, read, baseline, current)
+CASES = {
+    'tei49 (pcdate/pctime, round to 1 min)': (
+        lambda: sorted(glob.glob(os.path.join(DATA, 'tei49*', '*.zip'))), _tei49,
+        # 'T' of the baseline is spelled 'min' since pandas 3
+        lambda df: pd.to_datetime(df['pcdate'] + ' ' + df['pctime']).apply(lambda x: x.round(freq='min')),
+        lambda df: timestamps.round_to(timestamps.from_date_time(df['pcdate'], df['pctime']), '1min')),
+    'bulletin (zzzztttt)': (
+        lambda: sorted(glob.glob(os.path.join(DATA, 'meteo', '*'))), _bulletin,
+        lambda df: pd.to_datetime(df['zzzztttt'], format='%Y%m%d%H%M'),
+        lambda df: timestamps.from_compact(df['zzzztttt'])),
+    'bulletin (zzzztttt, 10000 rows)': (
+        lambda: [None], lambda file: pd.DataFrame({'zzzztttt': pd.date_range('2020-01-01', periods=10000, freq='10min')
+                                                   .strftime('%Y%m%d%H%M').astype('int64')}),
+        lambda df: pd.to_datetime(df['zzzztttt'], format='%Y%m%d%H%M'),
+        lambda df: timestamps.from_compact(df['zzzztttt'])),
+    'wdcgg extractor (1 year hourly)': (
+        lambda: generators.wdcgg(os.path.join(WORK, 'wdcgg'), days=365), lambda file: file,
+        lambda file: _quiet(baseline('extract2df/wdcgg2df.py', 'extract_wdcgg_file'))(file),
+        lambda file: wdcgg2df.extract_wdcgg_file(file)),
+    'milos extractor (1 day, 1-min)': (
+        lambda: generators.milos(os.path.join(WORK, 'milos'), days=7), lambda file: file,
+        lambda file: _quiet(baseline('extract2df/milos2df.py', 'milos2df'))(file),
+        lambda file: milos2df.milos2df(file)),
+}
+
+
+def main(number=20):
+    print(f"pandas {pd.__version__}")
+    print(f"{'layout':40s} {'files':>5s} {'baseline ms/file':>17s} {'current ms/file':>16s} {'speedup':>8s}")
+    for name, (inputs, read, legacy, kernel) in CASES.items():
+        frames = [read(file) for file in inputs()]
+        scale = 1000 / number / len(frames)
+        t_kernel = min(timeit.repeat(lambda: [kernel(df) for df in frames], number=number, repeat=3))
+        try:
+            # untimed first call: loads the baseline function, fails early under pandas 3
+            legacy(frames[0])
+            t_legacy = min(timeit.repeat(lambda: [legacy(df) for df in frames], number=number, repeat=3))
+        except Exception as err:
+            print(f"{name:40s} {len(frames):5d} {'n/a':>17s} {t_kernel * scale:16.3f} {'':8s} ({err})")
+            continue
+        print(f"{name:40s} {len(frames):5d} {t_legacy * scale:17.3f} {t_kernel * scale:16.3f} "
+              f"{t_legacy / t_kernel:7.1f}x")
+
+
+# %%
+if __name__ == '__main__':
+    main()
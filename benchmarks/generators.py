@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""Deterministic synthetic input files for every format the extractors read.
+
+Every generator writes to 'path', covers 'days' days from 'start' at the native resolution of its format
+(so that the same call scales from one file to years of data), and returns the list of files written.
+Values come from np.random.default_rng(seed), hence the same arguments always produce the same bytes.
+
+- bulletins: VMSW43/VRXA00, one bulletin per 10 min, plain or zipped
+- tei49: tei49i/tei49c, one zip with 10 minutes of 1-min data per 10 min
+- milos: MILOS YYMMDD.LOG, one file of 1-min data per day, 10- or 11-column layout
+- wdcgg: WDCGG hourly text, with header or header-less (Empa)
+- shadoz: SHADOZ sfco3 (1-min surface ozone, one file per month) or V06 (one sonde per week)
+- nasa_ames: EBAS NASA Ames 1001, hourly, one file per year
+- dwh: DWH CSV as returned by jretrieve, 10-min, one file
+- kplc: KPLC smart meter load profile CSV, 30-min, newest first, afternoon hours off by 12 h, one file
+- picarro: Picarro G2401 DataLog_User_Sync, 5-s, one zip per hour
+"""
+# %%
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+
+BULLETIN_FIELDS = ["tre200s0", "uor200s0", "prestas0", "fa1010z0", "da1010z0", "rre150z0", "ta1200s0",
+                   "ua1200s0", "pa1stas0", "fkl010z0", "dkl010z0", "ra1150z0", "fkl010z1", "gor000z0",
+                   "ta2200s0", "ua2200s0"]
+TEI49I_COLUMNS = "pcdate pctime time date flags o3 hio3 cellai cellbi bncht lmpt o3lt flowa flowb pres"
+TEI49C_COLUMNS = "pcdate pctime time date o3 flags cellai cellbi bncht lmpt o3lt flowa flowb pres"
+DWH_PARAMETERS = ["tre200s0", "ure200s0", "prestas0", "fkl010z0", "dkl010z0", "gre000z0"]
+KPLC_COLUMNS = ["Meter No", "Time", "Total cumulative energy(T1+T2)(kWh)",
+                "A phase current(A)", "B phase current(A)", "C phase current(A)",
+                "A phase voltage(V)", "B phase voltage(V)", "C phase voltage(V)"]
+PICARRO_COLUMNS = ["DATE", "TIME", "FRAC_DAYS_SINCE_JAN1", "FRAC_HRS_SINCE_JAN1", "JULIAN_DAYS", "EPOCH_TIME",
+                   "ALARM_STATUS", "INST_STATUS", "CavityPressure", "CavityTemp", "DasTemp", "EtalonTemp",
+                   "WarmBoxTemp", "species", "MPVPosition", "OutletValve", "solenoid_valves", "CO_sync", "CO2_sync",
+                   "CO2_dry_sync", "CH4_sync", "CH4_dry_sync", "H2O_sync"]
+
+
+# %%
+def _range(start, days: float, freq: str) -> pd.DatetimeIndex:
+    begin = pd.Timestamp(start)
+    return pd.date_range(begin, begin + pd.Timedelta(days=days), freq=freq, inclusive='left')
+
+
+def _walk(rng, n: int, level: float, scale: float) -> np.ndarray:
+    """Random walk around 'level', so that generated series look like measurements rather than noise."""
+    return level + np.cumsum(rng.normal(0, scale, n)) / np.sqrt(np.arange(1, n + 1))
+
+
+def _zip(file: str, member: str, text: str) -> str:
+    with zipfile.ZipFile(file, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(member, text)
+    return file
+
+
+def _write(file: str, text: str) -> str:
+    with open(file, 'w', newline='\n') as fh:
+        fh.write(text)
+    return file
+
+
+# %%
+def bulletins(path: str, start='2022-01-01', days=1, kind='VMSW43', zipped=None, missing=0.01, seed=0) -> list:
+    """SwissMetNet bulletins VMSW43.YYYYMMDDHHMM.zip (zipped) or VRXA00.YYYYMMDDHHMM (plain), one per 10 min.
+
+    Args:
+        kind (str, optional): 'VMSW43' or 'VRXA00'. Defaults to 'VMSW43'.
+        zipped (bool, optional): Defaults to None, i.e. zipped for VMSW43, plain for VRXA00, as delivered.
+        missing (float, optional): fraction of values reported as '/'. Defaults to 0.01.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    if zipped is None:
+        zipped = kind == 'VMSW43'
+    header = " ".join(["iii", "zzzztttt"] + BULLETIN_FIELDS)
+    dtm = _range(start, days, '10min')
+    values = rng.uniform(0, 999, (len(dtm), len(BULLETIN_FIELDS)))
+    gaps = rng.random(values.shape) < missing
+    files = []
+    for i, ts in enumerate(dtm):
+        row = " ".join("/" if gap else f"{value:05.1f}" for value, gap in zip(values[i], gaps[i]))
+        text = f"{i % 1000:03d}\n{kind} LSSW {ts:%d%H%M}\n\n{header}\n187 {ts:%Y%m%d%H%M} {row}\n"
+        name = f"{kind}.{ts:%Y%m%d%H%M}"
+        if zipped:
+            files.append(_zip(os.path.join(path, f"{name}.zip"), f"{name}.001", text))
+        else:
+            files.append(_write(os.path.join(path, name), text))
+    return files
+
+
+def tei49(path: str, start='2022-01-01', days=1, kind='tei49i', seed=0) -> list:
+    """Thermo 49i/49c ozone analyzer files tei49x-YYYYMMDDHHMM.zip with the preceding 10 min of 1-min data.
+
+    Args:
+        kind (str, optional): 'tei49i' or 'tei49c'. Defaults to 'tei49i'.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtm = _range(start, days, '1min')
+    # the PC clock writes at 0-2 s past the minute
+    pc = dtm + pd.to_timedelta(rng.integers(0, 3, len(dtm)), unit='s')
+    o3 = _walk(rng, len(dtm), 45, 2)
+    cellai = rng.integers(64000, 97000, len(dtm))
+    cellbi = rng.integers(64000, 66000, len(dtm))
+    flowa = rng.normal(0.43, 0.01, len(dtm))
+    files = []
+    for j in range(0, len(dtm), 10):
+        lines = [TEI49I_COLUMNS if kind == 'tei49i' else TEI49C_COLUMNS]
+        for i in range(j, min(j + 10, len(dtm))):
+            ts, t = pc[i], dtm[i]
+            if kind == 'tei49i':
+                lines.append(f"{ts:%Y-%m-%d %H:%M:%S} {t:%H:%M} {t:%m-%d-%y} 0C100400 {o3[i]:.3f} 0.000 "
+                             f"{cellai[i]} {cellbi[i]} 30.8 53.1 0.0 {flowa[i]:.3f} 0.000 492.5")
+            else:
+                lines.append(f"{ts:%Y-%m-%d %H:%M:%S} {t:%H:%M} {t:%m-%d} {round(o3[i] * 100):d}E-2 1c000000 "
+                             f"{cellai[i]} {cellbi[i]} 26.7 55.6 99.9 {flowa[i]:.3f} 0.584 491.7")
+        name = f"{kind}-{dtm[j] + pd.Timedelta(minutes=10):%Y%m%d%H%M}"
+        files.append(_zip(os.path.join(path, f"{name}.zip"), f"{name}.dat", "\n".join(lines) + "\n"))
+    return files
+
+
+def milos(path: str, start='2000-12-17', days=1, surface_ozone=True, missing=0.01, seed=0) -> list:
+    """MILOS 500 daily files YYMMDD.LOG of 1-min data, each starting with 23 59 59 of the previous day.
+
+    Args:
+        surface_ozone (bool, optional): write the 11-column layout with surface ozone in front, else 10 columns.
+            Defaults to True.
+        missing (float, optional): fraction of values reported as '//'. Defaults to 0.01.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n = 11 if surface_ozone else 10
+    files = []
+    for day in pd.date_range(pd.Timestamp(start), periods=days, freq='D'):
+        values = rng.uniform(0, 999, (1440, n))
+        gaps = rng.random(values.shape) < missing
+        lines = [f"MILOS500 {day:%y%m%d}"]
+        for i in range(1440):
+            # minute i of the day is stamped i-1 59
+            h, m = divmod(i - 1, 60) if i else (23, 59)
+            row = " ".join("//" if gap else f"{value:.1f}" for value, gap in zip(values[i], gaps[i]))
+            lines.append(f"{h:02d} {m:02d} 59 {row} 0 0")
+        files.append(_write(os.path.join(path, f"{day:%y%m%d}.LOG"), "\n".join(lines) + "\n"))
+    return files
+
+
+def wdcgg(path: str, start='2020-01-01', days=365, species='co2', header=True, seed=0) -> list:
+    """WDCGG hourly file, with the WDCGG header or header-less as received from Empa (MKN_hourly_co2_...txt).
+
+    Args:
+        species (str, optional): parameter name. Defaults to 'co2'.
+        header (bool, optional): Defaults to True.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtm = _range(start, days, 'h')
+    value = _walk(rng, len(dtm), 410, 0.5)
+    unc = rng.uniform(0.05, 0.3, len(dtm))
+    flag = rng.choice([1, 1, 1, 2, 3], len(dtm))
+    columns = "site_gaw_id year month day hour minute second value value_unc QCflag"
+    rows = [f"MKN {ts:%Y %m %d %H %M %S} {v:.3f} {u:.3f} {f}" for ts, v, u, f in zip(dtm, value, unc, flag)]
+    if header:
+        meta = [f"# site_gaw_id : MKN", f"# dataset_parameter_name_1 : {species}",
+                "# dataset_project : surface-insitu", "# dataset_selection_tag : hourly"]
+        lines = [f"# header_lines : {len(meta) + 2}"] + meta + [f"# {columns}"]
+        name = f"{species}_mkn_surface-insitu_hourly_{dtm[0]:%Y%m%d}.txt"
+    else:
+        lines = [columns]
+        name = f"MKN_hourly_{species}_{dtm[0]:%Y%m%d}.txt"
+    return [_write(os.path.join(path, name), "\n".join(lines + rows) + "\n")]
+
+
+def shadoz(path: str, start='2020-01-01', days=31, kind='sfco3', seed=0) -> list:
+    """SHADOZ Nairobi files: 1-min surface ozone (sfco3, one file per month) or ozone sondes (V06, one per week).
+
+    Args:
+        kind (str, optional): 'sfco3' or 'V06'. Defaults to 'sfco3'.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    files = []
+    if kind == 'sfco3':
+        dtm = _range(start, days, '1min')
+        o3 = _walk(rng, len(dtm), 40, 2)
+        for month in np.unique(dtm.to_period('M')):
+            sel = dtm.to_period('M') == month
+            meta = ["STATION: Nairobi", "INSTRUMENT: TEI 49C", "PI: SHADOZ", "SHADOZ Version: 01",
+                    "Date Time O3"]
+            rows = [f"{ts:%Y%m%d %H:%M:%S} {v:.2f}" for ts, v in zip(dtm[sel], o3[sel])]
+            text = "\n".join([str(len(meta) + 1)] + meta + rows) + "\n"
+            files.append(_write(os.path.join(path, f"nairobi_sfco3_{month.strftime('%Y%m')}.dat"), text))
+    elif kind == 'V06':
+        names = "Time Press Alt Temp RH O3 O3 WDir WSpd T_pump I_O3 GPSLon GPSLat GPSAlt"
+        units = "sec hPa km C % mPa ppmv deg m/s C uA deg deg km"
+        for launch in pd.date_range(pd.Timestamp(start), periods=max(1, days // 7), freq='7D'):
+            launch = launch + pd.Timedelta(hours=8, minutes=int(rng.integers(0, 60)))
+            # 1 s ascent resolution up to ~33 km
+            t = np.arange(0, 6500)
+            alt = t * 0.005
+            press = 640 * np.exp(-alt / 7.5)
+            values = np.column_stack([t, press, alt, 15 - 6.5 * np.minimum(alt, 12), rng.uniform(1, 100, len(t)),
+                                      rng.uniform(0.5, 15, len(t)), rng.uniform(0.01, 10, len(t)),
+                                      rng.uniform(0, 360, len(t)), rng.uniform(0, 30, len(t)),
+                                      rng.uniform(20, 30, len(t)), rng.uniform(0, 5, len(t)),
+                                      36.8 + alt / 100, -1.3 + alt / 100, alt])
+            values[rng.random(values.shape) < 0.01] = 9000.0
+            values[:, 0] = t
+            meta = ["STATION: Nairobi, Kenya", "STATION PRINCIPAL INVESTIGATOR(S): SHADOZ",
+                    "STATION CO-INVESTIGATOR(S): KMD", "SHADOZ Version: 06", "Latitude (deg): -1.27",
+                    "Longitude (deg): 36.80", "Elevation (m): 1795", "Sonde Instrument, SN: ECC6A",
+                    "Background sfc current (uA): 0.05", "Pump flow rate (sec/100ml): 28.5",
+                    "Sonde Total O3 (DU): 260",
+                    f"Launch Date: {launch:%Y%m%d}", f"Launch Time: {launch:%H:%M:%S} GMT",
+                    names, units]
+            rows = [" ".join(f"{x:.3f}" for x in row) for row in values]
+            text = "\n".join([str(len(meta) + 1)] + meta + rows) + "\n"
+            files.append(_write(os.path.join(path, f"nairobi_{launch:%Y%m%d}_V06.dat"), text))
+    else:
+        raise ValueError(f"kind '{kind}' not supported.")
+    return files
+
+
+def nasa_ames(path: str, start='2020-01-01', days=366, seed=0) -> list:
+    """EBAS NASA Ames 1001 hourly ozone files, one per year, short names in the last normal comment line."""
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtm = _range(start, days, 'h')
+    o3 = _walk(rng, len(dtm), 40, 2)
+    o3[rng.random(len(dtm)) < 0.02] = 999.99
+    files = []
+    for year in np.unique(dtm.year):
+        sel = dtm[dtm.year == year]
+        epoch = pd.Timestamp(year=year, month=1, day=1)
+        starttime = (sel - epoch) / pd.Timedelta(days=1)
+        vnames = ["end_time of measurement, days from the file reference point", "ozone, nmol/mol",
+                  "numflag ozone, no unit"]
+        ncom = ["Data definition: EBAS_1.1", "Station code: KE0001R", "Component: ozone",
+                "starttime endtime O3 flag_O3"]
+        header = (["1001", "Synthetic benchmark data", "KE01L, Kenya Meteorological Department",
+                   "Synthetic benchmark data", "GAW-WDCRG", "1 1",
+                   f"{year} 01 01 {year} 01 01", "0.041667", "days from file reference point"]
+                  + [str(len(vnames)), " ".join(["1"] * len(vnames)), "9999.999999 999.99 9.999"]
+                  + vnames + ["0", str(len(ncom))] + ncom)
+        header[0] = f"{len(header)} 1001"
+        rows = [f"{s:.6f} {s + 1 / 24:.6f} {v:.2f} {0.999 if v == 999.99 else 0.0:.3f}"
+                for s, v in zip(starttime, o3[dtm.year == year])]
+        files.append(_write(os.path.join(path, f"KE0001R.{year}0101000000.{year}0101000000.ozone.nas"),
+                            "\n".join(header + rows) + "\n"))
+    return files
+
+
+def dwh(path: str, start='2020-01-01', days=365, station='MKN', seed=0) -> list:
+    """DWH CSV as returned by jretrieve (delimiter ',', placeholder 'None'), 10-min data."""
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtm = _range(start, days, '10min')
+    df = pd.DataFrame({p: _walk(rng, len(dtm), rng.uniform(0, 100), 1).round(1) for p in DWH_PARAMETERS})
+    df = df.mask(rng.random(df.shape) < 0.01)
+    df.insert(0, 'termin', dtm.strftime('%Y-%m-%d %H:%M:%S'))
+    df.insert(0, 'station', station)
+    file = os.path.join(path, f"dwh_{station.lower()}_{dtm[0]:%Y%m%d}.csv")
+    df.to_csv(file, index=False, na_rep='None')
+    return [file]
+
+
+def kplc(path: str, start='2020-06-17', days=365, seed=0) -> list:
+    """KPLC smart meter load profile CSV, 30-min data, newest first, with afternoon hours written as morning hours."""
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtm = _range(start, days, '30min')
+    energy = np.cumsum(rng.uniform(0, 2, len(dtm)))
+    # the meter writes 13:00 as 01:00 etc.
+    time = dtm - pd.to_timedelta(np.where(dtm.hour >= 12, 12, 0), unit='h')
+    df = pd.DataFrame({KPLC_COLUMNS[0]: "2097696", KPLC_COLUMNS[1]: time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       KPLC_COLUMNS[2]: energy.round(2)})
+    for col in KPLC_COLUMNS[3:6]:
+        df[col] = rng.uniform(0, 15, len(dtm)).round(2)
+    for col in KPLC_COLUMNS[6:]:
+        df[col] = rng.normal(240, 5, len(dtm)).round(1)
+    file = os.path.join(path, "load_profile.csv")
+    df.iloc[::-1].to_csv(file, index=False)
+    return [file]
+
+
+def picarro(path: str, start='2022-01-01', days=1, seed=0) -> list:
+    """Picarro G2401 files CFKADS2320-YYYYMMDD-HHMMSSZ-DataLog_User_Sync.zip, 5-s data, one per hour.
+
+    As written by the analyzer, columns are padded to 26 characters and files start some seconds past the hour.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    dtm = _range(start, days, '5s') + pd.Timedelta(seconds=13)
+    n = len(dtm)
+    epoch = (dtm - pd.Timestamp('1970-01-01')).total_seconds().to_numpy() + rng.uniform(0, 0.5, n)
+    jan1 = (dtm - dtm.normalize() + pd.to_timedelta(dtm.dayofyear - 1, unit='D')).total_seconds().to_numpy()
+    co2 = _walk(rng, n, 420, 0.5)
+    ch4 = _walk(rng, n, 1.95, 0.005)
+    co = _walk(rng, n, 0.12, 0.01)
+    h2o = _walk(rng, n, 1.2, 0.05)
+    alarm = (rng.random(n) < 0.001).astype(int)
+    files = []
+    hours = dtm.floor('h')
+    for hour in hours.unique():
+        rows = np.flatnonzero(hours == hour)
+        lines = ["".join(f"{c:<26}" for c in PICARRO_COLUMNS)]
+        for i in rows:
+            ts = dtm[i]
+            values = [f"{ts:%Y-%m-%d}", f"{ts:%H:%M:%S}.{int(epoch[i] % 1 * 1000):03d}", f"{jan1[i] / 86400:.9f}",
+                      f"{jan1[i] / 3600:.9f}", f"{jan1[i] / 86400 + 1:.9f}", f"{epoch[i]:.3f}", f"{alarm[i]}",
+                      "963", "140.0", "45.0", "40.1", "45.2", "45.0", "1.0", "0.0", "21500", "0",
+                      f"{co[i]:.6f}", f"{co2[i]:.6f}", f"{co2[i] / (1 - h2o[i] / 100):.6f}", f"{ch4[i]:.6f}",
+                      f"{ch4[i] / (1 - h2o[i] / 100):.6f}", f"{h2o[i]:.6f}"]
+            lines.append("".join(f"{v:<26}" for v in values))
+        name = f"CFKADS2320-{dtm[rows[0]]:%Y%m%d-%H%M%S}Z-DataLog_User_Sync"
+        files.append(_zip(os.path.join(path, f"{name}.zip"), f"{name}.dat", "\n".join(lines) + "\n"))
+    return files
+
+
+GENERATORS = dict(bulletins=bulletins, tei49=tei49, milos=milos, wdcgg=wdcgg, shadoz=shadoz,
+                  nasa_ames=nasa_ames, dwh=dwh, kplc=kplc, picarro=picarro)
+
+
+# %%
+if __name__ == '__main__':
+    pass
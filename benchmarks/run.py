@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""Time the extractors and loaders on synthetic data from benchmarks.generators.
+
+Every case runs in a fresh interpreter, so that its peak RSS is not inflated by the cases before it. Input files
+are generated once per run (untimed); loader cases extract their input before the clock starts. Cases whose
+imports are missing (e.g. nappy, jklutils, matplotlib) are reported as skipped.
+
+Run from the repository root:
+    python -m benchmarks.run                        # all cases at their default size
+    python -m benchmarks.run --scale 52 tei49i      # a year of tei49i files
+    python -m benchmarks.run --json results.json    # keep results to compare commits
+"""
+# %%
+import os
+import sys
+import io
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+import contextlib
+from benchmarks import generators
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# %% runners: prepare(files, work) is untimed, run(payload, work) is timed and returns the number of rows
+def _etl(work: str):
+    from etl.etl import ETLHandler
+    config = dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=False,
+                  incoming=work, archive=os.path.join(work, 'archive'), database=os.path.join(work, 'bench.sqlite'))
+    ETLHandler(config)
+    return ETLHandler
+
+
+def _rows(res) -> int:
+    if res is None:
+        return 0
+    if isinstance(res, tuple):
+        res = res[-1]
+    if isinstance(res, dict):
+        res = res.get('df', res.get('data'))
+    return 0 if res is None else len(res)
+
+
+def extract_file(files, work):
+    etl = _etl(work)
+    return sum(_rows(etl.extract_file(file)) for file in files)
+
+
+def extract_bulletin_file(files, work):
+    from extract2df import bulletin2df
+    return sum(_rows(bulletin2df.extract_bulletin_file(file, pattern=r'VMSW43|VRXA00', log=False)) for file in files)
+
+
+def extract_bulletin_files(files, work):
+    from extract2df import bulletin2df
+    return _rows(bulletin2df.extract_bulletin_files(files, log=False))
+
+
+def milos2df(files, work):
+    from extract2df import milos2df
+    return sum(_rows(milos2df.milos2df(file)) for file in files)
+
+
+def extract_wdcgg_file(files, work):
+    from extract2df import wdcgg2df
+    return sum(_rows(wdcgg2df.extract_wdcgg_file(file)) for file in files)
+
+
+def extract_shadoz_file(files, work):
+    from extract2df import shadoz2df
+    return sum(_rows(shadoz2df.extract_shadoz_file(file)) for file in files)
+
+
+def extract_nasa_ames_file(files, work):
+    from extract2df import ebas2df
+    return sum(_rows(ebas2df.extract_nasa_ames_file(file)) for file in files)
+
+
+def dwh2df(files, work):
+    from extract2df import dwh2df
+    return sum(_rows(dwh2df.dwh2df(cfg=None, path=file)) for file in files)
+
+
+def read_kplc_smartmeter_load_profile(files, work):
+    from extract2df import kplc2df
+    return sum(_rows(kplc2df.read_kplc_smartmeter_load_profile(file, fix=True, save_csv=False, verbose=False))
+               for file in files)
+
+
+def _frames(files, work):
+    """Untimed: one dataframe per tei49i file, as process_directory hands them to the loaders."""
+    etl = _etl(work)
+    return [etl.extract_file(file) for file in files]
+
+
+def load_file(frames, work, upsert=False):
+    etl = _etl(work)
+    for df in frames:
+        etl.load_file('tei49i', df, upsert=upsert)
+    return sum(len(df) for df in frames)
+
+
+def load_file_upsert(frames, work):
+    return load_file(frames, work, upsert=True)
+
+
+def load_file_bulk(frames, work):
+    from df2sqlite.bulk import BulkLoader
+    etl = _etl(work)
+    etl.bulkloader = BulkLoader(etl.db, verbose=False)
+    try:
+        for df in frames:
+            etl.load_file('tei49i', df)
+            etl.bulkloader.done()
+    finally:
+        etl.bulkloader.close()
+        etl.bulkloader = None
+    return sum(len(df) for df in frames)
+
+
+def df2sqlite(frames, work):
+    from df2sqlite import df2sqlite
+    for df in frames:
+        df2sqlite.df2sqlite(df, db=os.path.join(work, 'bench.sqlite'), tbl='tei49i', verbose=False)
+    return sum(len(df) for df in frames)
+
+
+def append_to_sqlite_db(frames, work):
+    from df2sqlite import df2sqlite
+    for df in frames:
+        df2sqlite.append_to_sqlite_db(df, db=os.path.join(work, 'bench.sqlite'), tbl='tei49i')
+    return sum(len(df) for df in frames)
+
+
+# %% case name: (generator, generator kwargs, default days, prepare, run)
+CASES = {
+    'extract_file[tei49i]': ('tei49', dict(kind='tei49i'), 7, None, extract_file),
+    'extract_file[tei49c]': ('tei49', dict(kind='tei49c'), 7, None, extract_file),
+    'extract_file[VMSW43]': ('bulletins', dict(kind='VMSW43'), 7, None, extract_file),
+    'extract_file[picarro]': ('picarro', dict(), 1, None, extract_file),
+    'extract_bulletin_file[VMSW43]': ('bulletins', dict(kind='VMSW43'), 7, None, extract_bulletin_file),
+    'extract_bulletin_file[VRXA00]': ('bulletins', dict(kind='VRXA00'), 7, None, extract_bulletin_file),
+    'extract_bulletin_files[VMSW43]': ('bulletins', dict(kind='VMSW43'), 7, None, extract_bulletin_files),
+    'milos2df[11 columns]': ('milos', dict(surface_ozone=True), 31, None, milos2df),
+    'milos2df[10 columns]': ('milos', dict(surface_ozone=False), 31, None, milos2df),
+    'extract_wdcgg_file[header]': ('wdcgg', dict(header=True), 365, None, extract_wdcgg_file),
+    'extract_wdcgg_file[header-less]': ('wdcgg', dict(header=False), 365, None, extract_wdcgg_file),
+    'extract_shadoz_file[sfco3]': ('shadoz', dict(kind='sfco3'), 31, None, extract_shadoz_file),
+    'extract_shadoz_file[V06]': ('shadoz', dict(kind='V06'), 91, None, extract_shadoz_file),
+    'extract_nasa_ames_file': ('nasa_ames', dict(), 366, None, extract_nasa_ames_file),
+    'dwh2df[csv]': ('dwh', dict(), 365, None, dwh2df),
+    'read_kplc_smartmeter_load_profile': ('kplc', dict(), 365, None, read_kplc_smartmeter_load_profile),
+    'load_file[tei49i]': ('tei49', dict(kind='tei49i'), 7, _frames, load_file),
+    'load_file[tei49i, upsert]': ('tei49', dict(kind='tei49i'), 7, _frames, load_file_upsert),
+    'load_file[tei49i, bulk]': ('tei49', dict(kind='tei49i'), 7, _frames, load_file_bulk),
+    'df2sqlite[tei49i]': ('tei49', dict(kind='tei49i'), 7, _frames, df2sqlite),
+    'append_to_sqlite_db[tei49i]': ('tei49', dict(kind='tei49i'), 7, _frames, append_to_sqlite_db),
+}
+
+
+# %%
+def peak_rss() -> float:
+    """Peak resident set size of this process in MB, or None where the resource module is not available."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kB elsewhere
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def run_case(name: str, files: list, work: str) -> dict:
+    """Run one case in this process. Called in the child interpreter started by benchmark()."""
+    generator, kwargs, days, prepare, run = CASES[name]
+    res = dict(case=name, files=len(files))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            payload = prepare(files, work) if prepare else files
+            if not tracemalloc.is_tracing() and peak_rss() is None:
+                tracemalloc.start()
+            t0 = time.perf_counter()
+            rows = run(payload, work)
+            seconds = time.perf_counter() - t0
+    except ImportError as err:
+        res['skipped'] = str(err)
+        return res
+    rss = peak_rss()
+    if rss is None:
+        # Python allocations only
+        rss = tracemalloc.get_traced_memory()[1] / 2**20
+    res.update(rows=rows, seconds=seconds, rows_per_s=rows / seconds if seconds else None,
+               files_per_s=len(files) / seconds if seconds else None, peak_rss_mb=rss)
+    if not rows:
+        res['failed'] = "no rows extracted"
+    return res
+
+
+def benchmark(cases=None, scale=1.0, work=None, keep=False, seed=0) -> list:
+    """Generate the input of each case, then run it in a fresh interpreter.
+
+    Args:
+        cases (list, optional): names or name prefixes of cases to run. Defaults to None, i.e. all.
+        scale (float, optional): multiplies the default number of days of every case. Defaults to 1.0.
+        work (str, optional): directory for generated files and DBs. Defaults to None, i.e. a temporary directory.
+        keep (bool, optional): keep the work directory. Defaults to False.
+        seed (int, optional): seed of the generators. Defaults to 0.
+
+    Returns:
+        list: one dict per case with files, rows, seconds, rows_per_s, files_per_s, peak_rss_mb (or skipped/failed)
+    """
+    names = [name for name in CASES if not cases or any(name.startswith(case) for case in cases)]
+    work = work or tempfile.mkdtemp(prefix='gawke2sqlite-bench-')
+    generated = {}
+    results = []
+    try:
+        for name in names:
+            generator, kwargs, days, prepare, run = CASES[name]
+            days = max(1, round(days * scale)) if generator in ('milos', 'shadoz') else days * scale
+            key = json.dumps([generator, kwargs, days, seed], sort_keys=True)
+            if key not in generated:
+                path = os.path.join(work, 'data', str(len(generated)))
+                generated[key] = generators.GENERATORS[generator](path, days=days, seed=seed, **kwargs)
+            files = generated[key]
+
+            case_dir = os.path.join(work, 'cases', str(len(results)))
+            os.makedirs(case_dir, exist_ok=True)
+            with open(os.path.join(case_dir, 'files.json'), 'w') as fh:
+                json.dump(files, fh)
+            proc = subprocess.run([sys.executable, '-m', 'benchmarks.run', '--child', name, '--work', case_dir],
+                                  cwd=ROOT, capture_output=True, text=True)
+            try:
+                res = json.loads(proc.stdout.strip().splitlines()[-1])
+            except (IndexError, ValueError):
+                res = dict(case=name, files=len(files), failed=proc.stderr.strip().splitlines()[-1:])
+            results.append(res)
+            report([res], header=len(results) == 1)
+    finally:
+        if not keep:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
+
+
+def report(results: list, header=True) -> None:
+    if header:
+        print(f"{'case':<36} {'files':>7} {'rows':>9} {'seconds':>8} {'rows/s':>10} {'files/s':>9} {'RSS MB':>7}")
+    for res in results:
+        if 'rows_per_s' in res and 'failed' not in res:
+            print(f"{res['case']:<36} {res['files']:>7} {res['rows']:>9} {res['seconds']:>8.3f} "
+                  f"{res['rows_per_s']:>10.0f} {res['files_per_s']:>9.1f} {res['peak_rss_mb']:>7.0f}")
+        else:
+            print(f"{res['case']:<36} {res['files']:>7} {'skipped: ' + res['skipped'] if 'skipped' in res else 'failed: ' + str(res['failed'])}")
+
+
+# %%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark extractors and loaders on synthetic data.")
+    parser.add_argument('cases', nargs='*', help="names or name prefixes of cases, e.g. 'load_file'. Default: all")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplier of the default number of days")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work', help="directory for generated files and DBs")
+    parser.add_argument('--keep', action='store_true', help="keep generated files and DBs")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        with open(os.path.join(args.work, 'files.json')) as fh:
+            files = json.load(fh)
+        print(json.dumps(run_case(args.child, files, args.work)))
+    else:
+        results = benchmark(args.cases, scale=args.scale, work=args.work, keep=args.keep, seed=args.seed)
+        if args.json:
+            with open(args.json, 'w') as fh:
+                json.dump(results, fh, indent=2)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""Mirror SQLite3 tables to Hive-style Parquet datasets partitioned by station, table and year.
+
+Layout: <root>/<station>/<tbl>/year=<YYYY>/part-0.parquet, station being the name of the DB file (mkn, nrb).
+A small _sync.json per table records the most recent timestamp mirrored, so that a sync only rewrites the
+partitions from that year on, and the partitions of the years a load touched (backfills, upserts of rows stored
+already), which the caller passes in.
+"""
+# %%
+import os
+import json
+import sqlite3
+import pandas as pd
+from df2sqlite import schema
+
+
+# %%
+def _target(root: str, db: str, tbl: str) -> str:
+    station = os.path.splitext(os.path.basename(db))[0]
+    return os.path.join(root, station, tbl)
+
+
+def _read_state(target: str) -> dict:
+    try:
+        with open(os.path.join(target, "_sync.json"), 'r') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def sync_table(db: str, tbl: str, root: str, index="dtm", years=None, verbose=True) -> dict:
+    """Append the rows of a table that are newer than the mirror to its Parquet dataset.
+
+    The year partition holding the previously mirrored timestamp and all later ones are rewritten, as are the
+    partitions of the given years; other partitions are left alone.
+
+    Args:
+        db (str): path to SQLite3 DB
+        tbl (str): name of DB table
+        root (str): root folder of the mirror
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+        years (iterable, optional): years with rows loaded, updated or backfilled since the last sync. Defaults to None.
+
+    Returns:
+        dict: partitions and records written
+    """
+    try:
+        target = _target(root, db, tbl)
+        state = _read_state(target)
+        con = sqlite3.connect(db)
+        try:
+            epoch = schema.is_epoch(con, tbl, index=index)
+            first, latest = con.execute(f'SELECT min({index}), max({index}) FROM "{tbl}"').fetchone()
+            if latest is not None and epoch:
+                first, latest = (str(ts) for ts in schema.to_datetime([first, latest], epoch))
+            todo = set()
+            if latest is not None:
+                first, end = pd.Timestamp(first).year, pd.Timestamp(latest).year
+                if not state or str(latest) > state['dtm']:
+                    todo.update(range(int(state['dtm'][:4]) if state else first, end + 1))
+                todo.update(year for year in (years or ()) if first <= year <= end)
+            if not todo:
+                if verbose:
+                    print(f"Mirror of {tbl} is up to date.")
+                return {"partitions": 0, "records": 0}
+
+            partitions = records = 0
+            for year in sorted(todo):
+                qry = f'SELECT * FROM "{tbl}" WHERE {index} >= ? AND {index} < ? ORDER BY {index}'
+                df = pd.read_sql_query(qry, con, params=(schema.bound(f"{year}-01-01", epoch),
+                                                         schema.bound(f"{year + 1}-01-01", epoch)))
+                if df.empty:
+                    continue
+                df[index] = schema.to_datetime(df[index], epoch)
+                path = os.path.join(target, f"year={year}")
+                os.makedirs(path, exist_ok=True)
+                df.to_parquet(os.path.join(path, "part-0.parquet"), index=False)
+                partitions += 1
+                records += len(df)
+        finally:
+            con.close()
+
+        os.makedirs(target, exist_ok=True)
+        with open(os.path.join(target, "_sync.json"), 'w') as fh:
+            json.dump({"dtm": max(str(latest), state.get('dtm', ''))}, fh)
+        if verbose:
+            print(f"{records} record(s) in {partitions} partition(s) of {tbl} mirrored to {target}.")
+        return {"partitions": partitions, "records": records}
+
+    except Exception as err:
+        print(err)
+
+
+def sync_db(db: str, root: str, tables=None, index="dtm", verbose=True) -> dict:
+    """Mirror all tables of a DB that have a dateTime axis (tables starting with '_' are skipped).
+
+    Args:
+        db (str): path to SQLite3 DB
+        root (str): root folder of the mirror
+        tables (list, optional): names of tables to mirror. Defaults to None, i.e., all tables.
+
+    Returns:
+        dict: result of sync_table per table
+    """
+    con = sqlite3.connect(db)
+    try:
+        if tables is None:
+            tables = [tpl[0] for tpl in con.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                      if not tpl[0].startswith('_')]
+        tables = [tbl for tbl in tables
+                  if index in [tpl[1] for tpl in con.execute(f'pragma table_info("{tbl}")')]]
+    finally:
+        con.close()
+    return {tbl: sync_table(db, tbl, root, index=index, verbose=verbose) for tbl in tables}
+
+
+def read_mirror(root: str, db: str, tbl: str, fields=None, dtm=None, index="dtm") -> pd.DataFrame:
+    """Read a mirrored table, pushing the column selection and date range down to the Parquet reader.
+
+    Args:
+        root (str): root folder of the mirror
+        db (str): path to (or name of) the SQLite3 DB the table was mirrored from
+        tbl (str): name of table
+        fields (list, optional): columns to read besides dtm. Defaults to None, i.e., all columns.
+        dtm (list, optional): [begin] or [begin, end] of period. Defaults to None, i.e., everything.
+
+    Returns:
+        pd.DataFrame: dtm and fields, sorted by dtm
+    """
+    columns = None if not fields else [index] + list(fields)
+    filters = []
+    if dtm:
+        begin = pd.Timestamp(dtm[0])
+        filters += [("year", ">=", begin.year), (index, ">=", begin)]
+        if len(dtm) == 2:
+            end = pd.Timestamp(dtm[1])
+            filters += [("year", "<=", end.year), (index, "<=", end)]
+    df = pd.read_parquet(_target(root, db, tbl), columns=columns, filters=filters or None)
+    if 'year' in df.columns and (columns is None or 'year' not in columns):
+        df = df.drop(columns='year')
+    return df.sort_values(index, ignore_index=True)
+
+
+# %%
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Bulk-load session: one connection and one transaction per batch of files.
+
+The loaders otherwise connect, insert and commit once per file. A BulkLoader opens the DB once with
+journal_mode=WAL, synchronous=NORMAL, temp_store=MEMORY and a larger page cache, inserts as upsert2sqlite does
+(on the UNIQUE natural key of a table) with executemany on statements prepared once per table and columns, and
+commits once every batch_files files or batch_rows rows. Tables loaded without upsert that have no UNIQUE key yet
+are appended to as df2sqlite does, their duplicate rows removed once per batch, before it is committed. Work that must only happen once rows are committed, e.g.
+archiving a file or updating rollups, is deferred to the commit:
+
+    with BulkLoader(db) as session:
+        for file in files:
+            df = extract(file)
+            df2sqlite.df2sqlite(df, db, tbl, session=session)
+            session.defer(archive, file)
+            session.done()
+"""
+# %%
+import sqlite3
+import pandas as pd
+from df2sqlite import sources
+from df2sqlite.df2sqlite import prepare_table, upsert_statement, has_unique_key, remove_duplicate_rows, _records
+from df2sqlite.schema import _quote
+
+
+# %%
+class BulkLoader:
+    """Loads into an SQLite3 DB within batched transactions on a single connection."""
+
+    def __init__(self, db: str, batch_files=100, batch_rows=100000, cache_size=-65536, verbose=True):
+        """Open a DB for bulk loading.
+
+        Args:
+            db (str): path to SQLite3 DB
+            batch_files (int, optional): commit after this many files. Defaults to 100.
+            batch_rows (int, optional): commit after this many rows offered. Defaults to 100000.
+            cache_size (int, optional): pragma cache_size, pages or, if negative, kiB. Defaults to -65536 (64 MiB).
+        """
+        self.db = db
+        self.batch_files = batch_files
+        self.batch_rows = batch_rows
+        self.verbose = verbose
+        # ETLHandler.process_files_parallel loads from its writer thread
+        self.con = sqlite3.connect(db, check_same_thread=False)
+        self.con.execute("pragma journal_mode=WAL")
+        self.con.execute("pragma synchronous=NORMAL")
+        self.con.execute("pragma temp_store=MEMORY")
+        self.con.execute(f"pragma cache_size={int(cache_size)}")
+        # tbl: (columns, keys, epoch) as prepared, keys None for tables appended to
+        self.tables = {}
+        # tables appended to in this batch, to remove duplicate rows from before committing
+        self.dedup = set()
+        # (tbl, columns, on_conflict, precedence): INSERT statement
+        self.statements = {}
+        # path: source_id, cf. sources.intern
+        self.sources = {}
+        self.deferred = []
+        self.files = self.rows = self.changes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(self, df: pd.DataFrame, tbl: str, index="dtm", key=None, on_conflict="nothing", precedence=None,
+             source="source", managed=False, upsert=True, remove_duplicates=True) -> dict:
+        """Insert a dataframe within the current batch, as upsert2sqlite does.
+
+        Without upsert, a table that has no UNIQUE natural key yet (nor is managed) is appended to instead, as
+        df2sqlite does, and unless remove_duplicates is False, its duplicate rows are removed before the batch is
+        committed.
+
+        Args:
+            df (pd.DataFrame): data to load, indexed by dtm
+            tbl (str): name of DB table
+            index (str, optional): name of dateTime axis. Defaults to 'dtm'.
+            key (str, optional): additional column of the natural key. Defaults to None.
+            on_conflict (str, optional): one of 'nothing' or 'update'. Defaults to 'nothing'.
+            precedence (list, optional): substrings of source, highest priority first. Defaults to None.
+            source (str, optional): column holding the provenance of a row. Defaults to 'source'.
+            managed (bool, optional): create the table, if it does not exist, as managed table. Defaults to False.
+            upsert (bool, optional): create the UNIQUE natural key of a table that has none. Defaults to True.
+            remove_duplicates (bool, optional): remove the duplicate rows of tables appended to. Defaults to True.
+
+        Returns:
+            dict: number of records offered and changed (not yet committed)
+        """
+        if on_conflict not in ('nothing', 'update'):
+            raise ValueError("'on_conflict' must be one of 'nothing' or 'update'.")
+        if df.empty:
+            raise ValueError("'df' can't be empty.")
+
+        df = df.reset_index().rename(columns={df.index.name or 'index': index})
+        if source == sources.SOURCE:
+            df = sources.encode(self.con, df, tbl, cache=self.sources)
+        columns = tuple(df.columns)
+        prepared = self.tables.get(tbl)
+        if prepared is None or not set(columns) <= prepared[0]:
+            if prepared is None:
+                unique = upsert or managed or has_unique_key(self.con, tbl, [index] if key is None else [index, key])
+            else:
+                unique = prepared[1] is not None
+            keys, epoch = prepare_table(self.con, tbl, df, index=index, key=key, managed=managed,
+                                        precedence=precedence, unique=unique, verbose=self.verbose)
+            known = set(columns) if prepared is None else prepared[0] | set(columns)
+            prepared = self.tables[tbl] = (known, keys if unique or epoch else None, epoch)
+        known, keys, epoch = prepared
+        if epoch:
+            df = df.dropna(subset=keys)
+
+        # the same statement text reuses the statement the connection has prepared already
+        signature = (tbl, columns, on_conflict if keys else None, tuple(precedence or ()) if keys else ())
+        qry = self.statements.get(signature)
+        if qry is None and keys is None:
+            qry = self.statements[signature] = "insert into %s (%s) values (%s)" % (
+                _quote(tbl), ", ".join(_quote(c) for c in columns), ", ".join('?' * len(columns)))
+        elif qry is None:
+            qry = self.statements[signature] = upsert_statement(tbl, columns, keys, on_conflict=on_conflict,
+                                                                precedence=precedence, source=source)
+        if keys is None and remove_duplicates:
+            self.dedup.add(tbl)
+
+        before = self.con.total_changes
+        self.con.executemany(qry, _records(df, epoch=[index] if epoch else (), fractions=keys is None))
+        changed = self.con.total_changes - before
+        self.rows += len(df)
+        self.changes += changed
+        if self.batch_rows and self.rows >= self.batch_rows:
+            self.commit()
+        return {"records_offered": len(df), "records_changed": changed}
+
+    def defer(self, func, *args, **kwargs) -> None:
+        """Call func(*args, **kwargs) once the rows loaded so far have been committed."""
+        self.deferred.append((func, args, kwargs))
+
+    def done(self, files=1) -> None:
+        """Count files as loaded, committing the batch once it holds batch_files files."""
+        self.files += files
+        if self.batch_files and self.files >= self.batch_files:
+            self.commit()
+
+    def commit(self) -> None:
+        """Commit the current batch, then run the work deferred until then."""
+        for tbl in sorted(self.dedup):
+            res = remove_duplicate_rows(self.con, tbl)
+            if self.verbose and res:
+                print('%s duplicate record(s) removed from table %s.' % (res, tbl))
+        self.dedup.clear()
+        self.con.commit()
+        if self.verbose and (self.files or self.rows):
+            print('%s record(s) added or updated (%s offered, %s file(s)), committed.' % (self.changes, self.rows,
+                                                                                           self.files))
+        self.files = self.rows = self.changes = 0
+        deferred, self.deferred = self.deferred, []
+        for func, args, kwargs in deferred:
+            try:
+                func(*args, **kwargs)
+            except Exception as err:
+                print(err)
+
+    def close(self) -> None:
+        """Commit the last batch and close the connection."""
+        try:
+            self.commit()
+        finally:
+            self.con.close()
+
+
+# %%
+if __name__ == '__main__':
+    pass
@@ -1,17 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import argparse
 import pandas as pd
 import sqlite3
+from df2sqlite import schema
+from df2sqlite import sources
+from df2sqlite.schema import _quote, DuplicateKeyError
 
 
 # %%
-def df2sqlite(df: pd.DataFrame, db, tbl, if_exists="append", index="dtm", remove_duplicates=True, verbose=True):
+def df2sqlite(df: pd.DataFrame, db, tbl, if_exists="append", index="dtm", remove_duplicates=True, verbose=True,
+              upsert=False, key=None, precedence=None, managed=False, session=None):
+    con = None
     try:
         if df.empty:
             raise ValueError("'df' can't be empty.")
 
+        # load within the batch of a bulk-load session (see bulk.BulkLoader)
+        if session is not None:
+            return session.load(df, tbl, index=index, key=key, precedence=precedence, managed=managed, upsert=upsert,
+                                remove_duplicates=remove_duplicates)
+
+        # managed tables have no rowid to dedup on, their primary key rejects duplicates instead
+        if upsert or managed or schema.is_epoch(db, tbl, index=index):
+            return upsert2sqlite(df, db=db, tbl=tbl, index=index, key=key, precedence=precedence, verbose=verbose,
+                                 managed=managed)
+
         # create sqlite3 connection
         con = sqlite3.connect(db)
+        df = sources.encode(con, df, tbl)
 
         # upload to sqlite db
         # tmp['mappings'].to_sql(name='mappings_%s' % os.path.basename(dpath), con=con, if_exists='replace')
@@ -22,44 +39,311 @@ def df2sqlite(df: pd.DataFrame, db, tbl, if_exists="append", index="dtm", remove
             print(msg)
 
         if remove_duplicates:            
-            # collect all field names using pragma, then remove source
-            cursor = con.cursor()
-            cursor.execute(f"pragma table_info({tbl})")
-            res = cursor.fetchall()
-            names = [tpl[1] for tpl in res]
-            if 'source' in names:
-                names.remove('source')
-
-            # identify duplicates on all fields
-            qry = "select count(*) from %s " % tbl
-            qry += "group by %s " % ",".join(names)
-            qry += "having count(*) > 1"
-            cursor.execute(qry)
-            res = cursor.fetchall()
-
-            # remove duplicates
-            if len(res) > 0:
-                qry = f"delete from {tbl} where rowid not in ( "
-                qry += f"select min(rowid) from {tbl} group by {','.join(names)} )"
-                cursor.execute(qry)
+            res = remove_duplicate_rows(con, tbl)
+            if res:
                 con.commit()
 
-                msg = '%s duplicate record(s) removed from table %s.' % (len(res), tbl)
+                msg = '%s duplicate record(s) removed from table %s.' % (res, tbl)
                 if verbose:
                     print(msg)        
 
+        return {"records_inserted": len(df)}
+
     except Exception as err:
         print(err)
+    finally:
+        if con is not None:
+            con.close()
+
+# %%
+def _records(df: pd.DataFrame, epoch=(), fractions=False) -> list:
+    """Convert a dataframe into a list of tuples of native Python values, NaN/NaT replaced by None.
+
+    Datetime columns become text 'YYYY-MM-DD HH:MM:SS', those listed in epoch integer epoch seconds. With fractions,
+    fractions of seconds are kept as DataFrame.to_sql writes them, 'YYYY-MM-DD HH:MM:SS.ffffff' unless zero.
+    """
+    cols = []
+    for column in df:
+        s = df[column]
+        if column in epoch:
+            values = pd.to_datetime(s).to_numpy(dtype='datetime64[s]').astype('int64').tolist()
+        elif pd.api.types.is_datetime64_any_dtype(s) and fractions:
+            values = s.dt.strftime("%Y-%m-%d %H:%M:%S.%f").str.removesuffix(".000000").tolist()
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            values = s.dt.strftime("%Y-%m-%d %H:%M:%S").tolist()
+        else:
+            values = s.tolist()
+        mask = s.isna()
+        if mask.any():
+            values = [None if m else v for v, m in zip(values, mask.tolist())]
+        cols.append(values)
+    return list(zip(*cols))
+
+
+def _precedence_rank(column: str, precedence: list) -> str:
+    """SQL expression ranking a source column by the position of the first matching pattern in precedence."""
+    cases = " ".join("WHEN instr(%s, '%s') > 0 THEN %d" % (column, str(p).replace("'", "''"), i)
+                     for i, p in enumerate(precedence))
+    return "(CASE %s ELSE %d END)" % (cases, len(precedence))
+
+
+def resolve_duplicates(con: sqlite3.Connection, tbl: str, keys: list, precedence=None, keep=None,
+                       verbose=True) -> dict:
+    """Remove the rows of a table that share its natural key, keeping a copy of them in _<tbl>_duplicates.
+
+    Rows identical but for their source are one observation loaded twice, the first is kept, as the legacy
+    dedup did. Of different rows, those whose source ranks lower in precedence are removed. Rows left in
+    conflict are removed but for the first if keep='first', else DuplicateKeyError is raised, and the caller
+    must roll back. Nothing is committed.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        tbl (str): name of DB table (with rowid)
+        keys (list): columns making up the natural key, e.g. ['dtm'] or ['dtm', 'station']
+        precedence (list, optional): substrings of source, highest priority first. Defaults to None.
+        keep (str, optional): None or 'first'. Defaults to None.
+
+    Returns:
+        dict: number of rows removed as identical, by precedence, and as conflicting
+    """
+    if keep not in (None, 'first'):
+        raise ValueError("'keep' must be one of None or 'first'.")
+    t = _quote(tbl)
+    cols = ", ".join(_quote(k) for k in keys)
+    names = [tpl[1] for tpl in con.execute(f"pragma table_info({t})")]
+    values = [n for n in names if n not in (sources.SOURCE, sources.SOURCE_ID)]
+    backup = _quote(f"_{tbl}_duplicates")
+    con.execute(f"create table if not exists {backup} as select * from {t} where 0")
+    saved = [tpl[1] for tpl in con.execute(f"pragma table_info({backup})")]
+    for name in names:
+        if name not in saved:
+            con.execute(f"alter table {backup} add column {_quote(name)}")
+
+    def remove(where: str) -> int:
+        columns = ", ".join(_quote(n) for n in names)
+        con.execute(f"insert into {backup} ({columns}) select {columns} from {t} where {where}")
+        return con.execute(f"delete from {t} where {where}").rowcount
+
+    res = {"identical": remove(f"rowid not in (select min(rowid) from {t} group by "
+                               f"{', '.join(_quote(n) for n in values)})"),
+           "precedence": 0, "conflicting": 0}
+    if precedence and (sources.SOURCE in names or sources.SOURCE_ID in names):
+        def rank(alias):
+            if sources.SOURCE in names:
+                return _precedence_rank(f"{alias}.{sources.SOURCE}", precedence)
+            return _precedence_rank(sources.path_of(f"{alias}.{sources.SOURCE_ID}"), precedence)
+        on = " and ".join(f"a.{_quote(k)} is g.{_quote(k)}" for k in keys)
+        res["precedence"] = remove(f"rowid in (select a.rowid from {t} a join (select {cols}, min({rank('b')}) m "
+                                   f"from {t} b group by {cols} having count(*) > 1) g on {on} "
+                                   f"where {rank('a')} > g.m)")
+    conflicts = con.execute(f"select count(*) from (select 1 from {t} group by {cols} "
+                            f"having count(*) > 1)").fetchone()[0]
+    if conflicts and keep is None:
+        raise DuplicateKeyError(f"{tbl}: {conflicts} key(s) ({cols}) with different rows. Resolve them with "
+                                f"python -m df2sqlite.df2sqlite <db> --tables {tbl} [--precedence ...] --keep first")
+    if conflicts:
+        res["conflicting"] = remove(f"rowid not in (select min(rowid) from {t} group by {cols})")
+
+    if verbose and sum(res.values()):
+        print('%s duplicate record(s) removed from table %s (%s identical, %s by precedence, %s conflicting), '
+              'saved in %s.' % (sum(res.values()), tbl, res["identical"], res["precedence"], res["conflicting"],
+                                backup))
+    return res
+
+
+def remove_duplicate_rows(con: sqlite3.Connection, tbl: str) -> int:
+    """Remove the rows of a legacy table that repeat another row on all columns but the source. Nothing is committed.
+
+    Returns:
+        int: number of rows removed
+    """
+    names = [tpl[1] for tpl in con.execute(f"pragma table_info({_quote(tbl)})")
+             if tpl[1] not in (sources.SOURCE, sources.SOURCE_ID)]
+    cols = ", ".join(_quote(name) for name in names)
+    return con.execute(f"delete from {_quote(tbl)} where rowid not in "
+                       f"(select min(rowid) from {_quote(tbl)} group by {cols})").rowcount
+
+
+def has_unique_key(con: sqlite3.Connection, tbl: str, keys: list) -> bool:
+    """Whether a table has a primary key or UNIQUE index (see ensure_unique_key) on its natural key."""
+    if schema.primary_key(con, tbl) == list(keys):
+        return True
+    idx = "ux_%s_%s" % (tbl, "_".join(keys))
+    return con.execute("select 1 from sqlite_master where type='index' and name=? collate nocase",
+                       (idx,)).fetchone() is not None
+
+
+def ensure_unique_key(con: sqlite3.Connection, tbl: str, keys: list, precedence=None, verbose=True) -> None:
+    """Create a UNIQUE index on the natural key of a table.
+
+    A table loaded with the legacy GROUP BY dedup may hold several rows of a key. They are resolved first
+    (see resolve_duplicates): rows identical but for their source, and rows decided by precedence. If
+    different rows of a key remain, DuplicateKeyError is raised and the table is left as it was. Nothing is
+    committed.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        tbl (str): name of DB table
+        keys (list): columns making up the natural key, e.g. ['dtm'] or ['dtm', 'station']
+        precedence (list, optional): substrings of source, highest priority first. Defaults to None.
+    """
+    if has_unique_key(con, tbl, keys):
+        return
+    idx = "ux_%s_%s" % (tbl, "_".join(keys))
+    cols = ", ".join(_quote(k) for k in keys)
+    # an outermost savepoint would commit on release
+    if con.isolation_level is not None and not con.in_transaction:
+        con.execute("begin")
+    con.execute("savepoint ensure_unique_key")
+    try:
+        if con.execute(f"select 1 from {_quote(tbl)} group by {cols} having count(*) > 1 limit 1").fetchone():
+            resolve_duplicates(con, tbl, keys, precedence=precedence, verbose=verbose)
+        con.execute(f"create unique index {_quote(idx)} on {_quote(tbl)} ({cols})")
+    except Exception:
+        con.execute("rollback to ensure_unique_key")
+        raise
+    finally:
+        con.execute("release ensure_unique_key")
+
+
+def prepare_table(con: sqlite3.Connection, tbl: str, df: pd.DataFrame, index="dtm", key=None, managed=False,
+                  precedence=None, unique=True, verbose=True) -> tuple:
+    """Create a table for a dataframe, or add the columns it lacks, and make sure it has a unique natural key.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        tbl (str): name of DB table
+        df (pd.DataFrame): data to load, with dtm as column
+        index (str, optional): name of dateTime axis. Defaults to 'dtm'.
+        key (str, optional): additional column of the natural key. Defaults to None.
+        managed (bool, optional): create the table, if it does not exist, as managed table. Defaults to False.
+        precedence (list, optional): substrings of source, highest priority first, cf. ensure_unique_key.
+        unique (bool, optional): create the UNIQUE index of the natural key. Defaults to True.
+
+    Returns:
+        tuple: columns of the natural key, and whether the table stores dtm as epoch seconds
+    """
+    keys = [index] if key is None else [index, key]
+    names = [tpl[1] for tpl in con.execute(f"pragma table_info({_quote(tbl)})")]
+    if not names and managed:
+        keys = schema.create_table(con, tbl, df, index=index, key=key)
+    elif not names:
+        df.head(0).to_sql(tbl, con, index=False)
+        if not unique:
+            # the (non-unique) index DataFrame.to_sql creates on the index of a table it appends to
+            con.execute(f"create index if not exists {_quote(f'ix_{tbl}_{index}')} on {_quote(tbl)} ({_quote(index)})")
+    epoch = schema.is_epoch(con, tbl, index=index)
+    if epoch:
+        keys = schema.primary_key(con, tbl)
+    for column in df.columns:
+        if names and column not in names:
+            dtype = f" {schema.column_type(tbl, column, df[column].dtype)}" if epoch else ""
+            con.execute(f"alter table {_quote(tbl)} add column {_quote(column)}{dtype}")
+    if unique:
+        ensure_unique_key(con, tbl, keys, precedence=precedence, verbose=verbose)
+    return keys, epoch
+
+
+def upsert_statement(tbl: str, columns: list, keys: list, on_conflict="nothing", precedence=None,
+                     source="source") -> str:
+    """INSERT ... ON CONFLICT statement of upsert2sqlite for a list of columns."""
+    cols = ", ".join(_quote(c) for c in columns)
+    qry = f"insert into {_quote(tbl)} ({cols}) values ({', '.join('?' * len(columns))}) "
+    qry += f"on conflict({', '.join(_quote(k) for k in keys)}) do "
+    updates = [c for c in columns if c not in keys]
+    if (on_conflict == 'update' or precedence) and updates:
+        qry += "update set " + ", ".join(f"{_quote(c)}=excluded.{_quote(c)}" for c in updates)
+        if precedence and source in columns:
+            qry += " where %s <= %s" % (_precedence_rank(f"excluded.{_quote(source)}", precedence),
+                                        _precedence_rank(f"{_quote(tbl)}.{_quote(source)}", precedence))
+        elif precedence and sources.SOURCE_ID in columns:
+            # rank the paths the source ids stand for
+            qry += " where %s <= %s" % (
+                _precedence_rank(sources.path_of(f"excluded.{sources.SOURCE_ID}"), precedence),
+                _precedence_rank(sources.path_of(f"{_quote(tbl)}.{sources.SOURCE_ID}"), precedence))
+    else:
+        qry += "nothing"
+    return qry
+
+
+def upsert2sqlite(df: pd.DataFrame, db, tbl: str, index="dtm", key=None, on_conflict="nothing",
+                  precedence=None, source="source", verbose=True, managed=False) -> dict:
+    """Insert a dataframe into an SQLite3 table with a UNIQUE index on its natural key.
+
+    Rows whose key already exists are skipped (on_conflict='nothing') or overwrite the stored row
+    (on_conflict='update'). If precedence is given, conflicts are resolved by source instead: an incoming
+    row replaces the stored row only if its source ranks at least as high. A source column is stored as source_id
+    (see sources), precedence then applies to the paths the ids stand for. The cost of a call depends
+    on the size of df, not on the size of the table. Into managed tables (see schema), timestamps are
+    written as epoch seconds and the primary key serves as natural key; rows without timestamp are dropped.
+
+    Args:
+        df (pd.DataFrame): data to load, indexed by dtm
+        db (str): path to SQLite3 DB
+        tbl (str): name of DB table
+        index (str, optional): name of dateTime axis. Defaults to 'dtm'.
+        key (str, optional): additional column of the natural key. Defaults to None.
+        on_conflict (str, optional): one of 'nothing' or 'update'. Defaults to 'nothing'.
+        precedence (list, optional): substrings of source, highest priority first, e.g. ['VRXA00', 'VMSW43'].
+        source (str, optional): column holding the provenance of a row. Defaults to 'source'.
+        managed (bool, optional): create the table, if it does not exist, as managed table. Defaults to False.
+
+    Returns:
+        dict: number of records offered and changed
+    """
+    if on_conflict not in ('nothing', 'update'):
+        raise ValueError("'on_conflict' must be one of 'nothing' or 'update'.")
+    if df.empty:
+        raise ValueError("'df' can't be empty.")
+
+    df = df.reset_index().rename(columns={df.index.name or 'index': index})
+
+    con = sqlite3.connect(db)
+    try:
+        if source == sources.SOURCE:
+            df = sources.encode(con, df, tbl)
+        keys, epoch = prepare_table(con, tbl, df, index=index, key=key, managed=managed, precedence=precedence,
+                                    verbose=verbose)
+        if epoch:
+            df = df.dropna(subset=keys)
+        qry = upsert_statement(tbl, df.columns, keys, on_conflict=on_conflict, precedence=precedence, source=source)
+
+        before = con.total_changes
+        con.executemany(qry, _records(df, epoch=[index] if epoch else ()))
+        con.commit()
+        changed = con.total_changes - before
+    finally:
+        con.close()
+
+    if verbose:
+        print('%s record(s) added or updated in table %s (%s offered).' % (changed, tbl, len(df)))
+    return {"records_offered": len(df), "records_changed": changed}
+
 
 # %%
-def append_to_sqlite_db(df: pd.DataFrame, db: str, tbl: str, remove_duplicates=True) -> dict:
+def append_to_sqlite_db(df: pd.DataFrame, db: str, tbl: str, remove_duplicates=True, session=None) -> dict:
+    con = None
     try:
         if df.empty:
             raise ValueError("DataFrame is empty.")
 
         records_for_insert = len(df)
 
+        if session is not None:
+            res = session.load(df, tbl, index=df.index.name or "dtm", upsert=False,
+                               remove_duplicates=remove_duplicates)
+            # duplicate rows appended are only removed when the session commits the batch (None: not known yet)
+            appended = session.tables[tbl][1] is None
+            return {"records_inserted": records_for_insert,
+                    "duplicate_records": None if appended else records_for_insert - res["records_changed"]}
+
+        if schema.is_epoch(db, tbl, index=df.index.name or "dtm"):
+            res = upsert2sqlite(df, db=db, tbl=tbl, index=df.index.name or "dtm", verbose=False)
+            return {"records_inserted": records_for_insert,
+                    "duplicate_records": records_for_insert - res["records_changed"]}
+
         con = sqlite3.connect(db)
+        df = sources.encode(con, df, tbl)
 
         qry_count_records = f"SELECT count({df.index.name}) from {tbl}"
         try:
@@ -83,13 +367,59 @@ def append_to_sqlite_db(df: pd.DataFrame, db: str, tbl: str, remove_duplicates=T
             con.commit()
             records_after_deduplication = con.execute(qry_count_records).fetchone()[0]
 
-        con.close()
-
         res = {"records_inserted": records_for_insert, \
             "duplicate_records": records_after_insert - records_after_deduplication}
 
         return res
     except Exception as err:
         print(err)
+    finally:
+        if con is not None:
+            con.close()
+
+
+# %%
+def dedup(db: str, tables: list, index="dtm", key=None, precedence=None, keep=None, verbose=True) -> dict:
+    """Resolve the duplicate keys of tables (see resolve_duplicates) and create their UNIQUE index, explicitly.
 
+    Args:
+        db (str): path to SQLite3 DB
+        tables (list): names of tables
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+        key (str, optional): additional column of the natural key. Defaults to None.
+        precedence (list, optional): substrings of source, highest priority first. Defaults to None.
+        keep (str, optional): None, or 'first' to keep the first of the rows left in conflict. Defaults to None.
+
+    Returns:
+        dict: result of resolve_duplicates per table
+    """
+    keys = [index] if key is None else [index, key]
+    con = sqlite3.connect(db)
+    res = {}
+    try:
+        for tbl in tables:
+            try:
+                res[tbl] = resolve_duplicates(con, tbl, keys, precedence=precedence, keep=keep, verbose=verbose)
+                ensure_unique_key(con, tbl, keys, verbose=verbose)
+                con.commit()
+            except Exception as err:
+                con.rollback()
+                print(err)
+    finally:
+        con.close()
+    return res
+
+
+# %%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Resolve duplicate keys of SQLite3 tables loaded with the legacy "
+                                                 "dedup, so that they can be upserted into.")
+    parser.add_argument('db', help="path to SQLite3 DB")
+    parser.add_argument('--tables', nargs='+', required=True, help="names of tables")
+    parser.add_argument('--index', default='dtm', help="name of dateTime axis. Default: dtm")
+    parser.add_argument('--key', help="additional column of the natural key")
+    parser.add_argument('--precedence', nargs='*', help="substrings of source, highest priority first")
+    parser.add_argument('--keep', choices=['first'], help="keep the first of rows left in conflict")
+    args = parser.parse_args()
 
+    dedup(args.db, args.tables, index=args.index, key=args.key, precedence=args.precedence, keep=args.keep)
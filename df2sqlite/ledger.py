@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Ledger of files ingested into an SQLite3 DB.
+
+The table _ingest_ledger records path, size, mtime, content hash, row count, target table and load time
+of every file loaded. Loaders consult it before opening a file, so that a re-run over an unchanged archive
+only stats each file.
+"""
+# %%
+import os
+import hashlib
+import datetime
+import sqlite3
+import threading
+
+LEDGER = "_ingest_ledger"
+# path: (size, mtime_ns, digest) of the files hashed last, so that checking, interning (see sources) and recording
+# a file reads it once
+DIGESTS = 4096
+_digests = {}
+_lock = threading.Lock()
+
+
+# %%
+def file_hash(path: str, blocksize=1 << 20, st=None) -> str:
+    """Return the SHA-1 hex digest of a file's content.
+
+    The digests of the last DIGESTS files hashed are kept, and returned again while a file's size and mtime
+    are unchanged.
+
+    Args:
+        path (str): full path to file
+        st (os.stat_result, optional): stat of the file, if at hand. Defaults to None.
+    """
+    if st is None:
+        st = os.stat(path)
+    with _lock:
+        known = _digests.get(path)
+    if known and known[:2] == (st.st_size, st.st_mtime_ns):
+        return known[2]
+    h = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(blocksize), b''):
+            h.update(block)
+    digest = h.hexdigest()
+    with _lock:
+        _digests.pop(path, None)
+        _digests[path] = (st.st_size, st.st_mtime_ns, digest)
+        while len(_digests) > DIGESTS:
+            del _digests[next(iter(_digests))]
+    return digest
+
+
+class IngestLedger:
+    """Record of files loaded to a DB, held in memory for the duration of a run."""
+
+    def __init__(self, db: str, con=None):
+        """Open (and if necessary create) the ledger of a DB.
+
+        Args:
+            db (str): path to SQLite3 DB
+            con (sqlite3.Connection, optional): connection to share, e.g. of a bulk-load session, which then stays
+                open on close. Defaults to None, i.e. a connection of its own.
+        """
+        self.db = db
+        self.shared = con is not None
+        # the writer thread of ETLHandler.process_files_parallel records files
+        self.con = con if self.shared else sqlite3.connect(db, check_same_thread=False)
+        self.con.execute(f"create table if not exists {LEDGER} (path text primary key, size integer, "
+                         "mtime real, hash text, rows integer, tbl text, loaded_at text)")
+        self.con.execute(f"create index if not exists ix_{LEDGER}_hash on {LEDGER} (hash)")
+        self.con.commit()
+
+        self.files = {}
+        self.hashes = set()
+        for path, size, mtime, digest in self.con.execute(f"select path, size, mtime, hash from {LEDGER}"):
+            self.files[path] = (size, mtime, digest)
+            self.hashes.add((size, digest))
+
+    def is_loaded(self, path: str) -> bool:
+        """Has a file with this content been loaded before?
+
+        Files whose path, size and mtime match the ledger are skipped without being read. Otherwise the
+        content hash is compared, so that touched or moved (e.g. archived) files are recognized as well. The
+        new mtime of a touched file is committed by the owner of the connection (see record, close).
+
+        Args:
+            path (str): full path to file
+
+        Returns:
+            bool: True if the file can be skipped
+        """
+        st = os.stat(path)
+        known = self.files.get(path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime:
+            return True
+        digest = file_hash(path, st=st)
+        if (st.st_size, digest) in self.hashes:
+            if known:
+                # same content, new mtime
+                self.files[path] = (st.st_size, st.st_mtime, digest)
+                self.con.execute(f"update {LEDGER} set mtime=? where path=?", (st.st_mtime, path))
+            return True
+        return False
+
+    def record(self, path: str, tbl: str, rows: int) -> None:
+        """Record a file once its rows have been loaded.
+
+        On a connection of its own, the ledger commits right away. On a shared connection, the file is recorded
+        in the transaction holding its rows, which the owner of the connection commits.
+
+        Args:
+            path (str): full path to file
+            tbl (str): name of DB table the file was loaded to
+            rows (int): number of rows extracted from the file
+        """
+        st = os.stat(path)
+        digest = file_hash(path, st=st)
+        loaded_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.con.execute(f"insert or replace into {LEDGER} (path, size, mtime, hash, rows, tbl, loaded_at) "
+                         "values (?, ?, ?, ?, ?, ?, ?)", (path, st.st_size, st.st_mtime, digest, rows, tbl, loaded_at))
+        if not self.shared:
+            self.con.commit()
+        self.files[path] = (st.st_size, st.st_mtime, digest)
+        self.hashes.add((st.st_size, digest))
+
+    def close(self) -> None:
+        """Commit and close a connection of its own; a shared connection is left to its owner."""
+        if not self.shared:
+            self.con.commit()
+            self.con.close()
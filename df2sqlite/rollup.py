@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Hourly and daily rollups of raw tables, maintained incrementally.
+
+<tbl>_1h and <tbl>_1d hold, per bucket, the number of raw rows (n) and their coverage of the bucket (n times the
+native resolution of the raw table, divided by the bucket width), and for every numeric column its mean (under the
+column's name), <column>_min, <column>_max and <column>_n. Wind directions dkl* are vector-averaged with the
+matching speeds fkl* (dkl010z0 with fkl010z0), which adds the vector mean speed <fkl>_vec.
+
+After a load, update_rollups recomputes only the buckets touched by the new timestamps, in SQL. The rollups of a
+managed table (see schema) are managed tables as well.
+"""
+# %%
+import math
+import sqlite3
+import numpy as np
+import pandas as pd
+from df2sqlite import schema
+from df2sqlite.sources import SOURCE_ID
+from df2sqlite.df2sqlite import _quote, upsert2sqlite
+
+FREQS = {'1h': 3600, '1d': 86400}
+NUMERIC = ('INTEGER', 'REAL', 'FLOAT', 'DOUBLE', 'NUMERIC', 'BIGINT', 'SMALLINT')
+
+
+# %%
+def numeric_columns(con: sqlite3.Connection, tbl: str, index="dtm") -> list:
+    """Columns of a table declared with a numeric type, except the index and source_id."""
+    return [name for cid, name, dtype, *_ in con.execute(f"pragma table_info({_quote(tbl)})")
+            if name not in (index, SOURCE_ID) and dtype.upper() in NUMERIC]
+
+
+def wind_pairs(columns: list) -> list:
+    """(direction, speed) pairs among columns, e.g. ('dkl010z0', 'fkl010z0')."""
+    return [(column, 'fkl' + column[3:]) for column in columns
+            if column.startswith('dkl') and 'fkl' + column[3:] in columns]
+
+
+def _epoch(con: sqlite3.Connection, tbl: str, index="dtm") -> str:
+    """SQL expression of the timestamps of a table in epoch seconds."""
+    if schema.is_epoch(con, tbl, index=index):
+        return _quote(index)
+    return f"cast(strftime('%s', {_quote(index)}) as integer)"
+
+
+def native_resolution(con: sqlite3.Connection, tbl: str, index="dtm", sample=1000) -> int:
+    """Median spacing in seconds of the most recent timestamps of a table."""
+    qry = f"select {_epoch(con, tbl, index)} from {_quote(tbl)} order by {_quote(index)} desc limit ?"
+    epoch = np.unique([x for (x,) in con.execute(qry, (sample + 1,)) if x is not None])
+    if len(epoch) < 2:
+        return 0
+    return int(np.median(np.diff(epoch)))
+
+
+def touched(dtm, width: int) -> list:
+    """Buckets of a given width (in seconds) containing any of the timestamps, merged into contiguous ranges.
+
+    Returns:
+        list: (begin, end) epoch seconds of each range, end exclusive
+    """
+    epoch = pd.to_datetime(pd.Series(dtm)).dropna().to_numpy(dtype='datetime64[s]').astype('int64')
+    buckets = np.unique(epoch // width * width)
+    if not len(buckets):
+        return []
+    breaks = np.flatnonzero(np.diff(buckets) > width) + 1
+    return [(int(run[0]), int(run[-1]) + width) for run in np.split(buckets, breaks)]
+
+
+def _ensure_functions(con: sqlite3.Connection) -> None:
+    """Register sin, cos and radians where SQLite was built without its math functions."""
+    try:
+        con.execute("select sin(radians(0)) + cos(0)")
+    except sqlite3.OperationalError:
+        con.create_function('sin', 1, lambda x: None if x is None else math.sin(x), deterministic=True)
+        con.create_function('cos', 1, lambda x: None if x is None else math.cos(x), deterministic=True)
+        con.create_function('radians', 1, lambda x: None if x is None else math.radians(x), deterministic=True)
+
+
+def _ensure_index(con: sqlite3.Connection, tbl: str, index="dtm") -> None:
+    """Index the raw table on its timestamp, unless an index leading with it exists already."""
+    for seq, name, *_ in con.execute(f"pragma index_list({_quote(tbl)})"):
+        info = con.execute(f"pragma index_info({_quote(name)})").fetchall()
+        if info and info[0][2] == index:
+            return
+    con.execute(f"create index if not exists {_quote(f'ix_{tbl}_{index}')} on {_quote(tbl)} ({_quote(index)})")
+    con.commit()
+
+
+def aggregate(con: sqlite3.Connection, tbl: str, width: int, begin: int, end: int, columns: list,
+              resolution: int, index="dtm") -> pd.DataFrame:
+    """Aggregate the raw rows of [begin, end) (epoch seconds) into buckets of 'width' seconds."""
+    pairs = wind_pairs(columns)
+    directions = [d for d, f in pairs]
+    epoch = schema.is_epoch(con, tbl, index=index)
+    exprs = [f"{_epoch(con, tbl, index)} / {width} * {width} as bucket", "count(*) as n"]
+    for column in columns:
+        c = _quote(column)
+        if column in directions:
+            exprs.append(f"count({c}) as {_quote(column + '_n')}")
+        else:
+            exprs += [f"avg({c}) as {c}", f"min({c}) as {_quote(column + '_min')}",
+                      f"max({c}) as {_quote(column + '_max')}", f"count({c}) as {_quote(column + '_n')}"]
+    for d, f in pairs:
+        exprs += [f"avg({_quote(f)} * sin(radians({_quote(d)}))) as {_quote(d + '_u')}",
+                  f"avg({_quote(f)} * cos(radians({_quote(d)}))) as {_quote(d + '_v')}"]
+    qry = f"select {', '.join(exprs)} from {_quote(tbl)} where {_quote(index)} >= ? and {_quote(index)} < ? " \
+          "group by bucket order by bucket"
+    df = pd.read_sql_query(qry, con, params=(schema.bound(pd.to_datetime(begin, unit='s'), epoch),
+                                             schema.bound(pd.to_datetime(end, unit='s'), epoch)))
+    if df.empty:
+        return df
+
+    df[index] = pd.to_datetime(df.pop('bucket'), unit='s')
+    df.set_index(index, inplace=True)
+    df.insert(1, 'coverage', df['n'] * resolution / width if resolution else np.nan)
+    for d, f in pairs:
+        u, v = df.pop(d + '_u'), df.pop(d + '_v')
+        df[d] = (np.degrees(np.arctan2(u, v)) + 360) % 360
+        df[f + '_vec'] = np.hypot(u, v)
+    return df
+
+
+def update_rollups(db: str, tbl: str, dtm=None, freqs=('1h', '1d'), index="dtm", resolution=None,
+                   verbose=True) -> dict:
+    """Recompute the rollups of a table for the buckets touched by new rows.
+
+    Args:
+        db (str): path to SQLite3 DB
+        tbl (str): name of raw table
+        dtm (array-like, optional): timestamps of the rows just loaded, e.g. df.index. Defaults to None, in which case the rollups are rebuilt over the whole table.
+        freqs (tuple, optional): keys of FREQS. Defaults to ('1h', '1d').
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+        resolution (int, optional): native resolution of the raw table in seconds, to compute coverage. Defaults to None, in which case it is estimated from the table.
+
+    Returns:
+        dict: number of buckets written per rollup table
+    """
+    res = {}
+    con = sqlite3.connect(db)
+    try:
+        columns = numeric_columns(con, tbl, index=index)
+        if not columns:
+            return res
+        _ensure_functions(con)
+        _ensure_index(con, tbl, index=index)
+        if resolution is None:
+            resolution = native_resolution(con, tbl, index=index)
+        managed = schema.is_epoch(con, tbl, index=index)
+        bounds = None
+        if dtm is None:
+            bounds = con.execute(f"select min({_quote(index)}), max({_quote(index)}) from {_quote(tbl)}").fetchone()
+            if bounds[0] is None:
+                return res
+            bounds = schema.to_datetime(list(bounds), managed)
+
+        for freq in freqs:
+            width = FREQS[freq]
+            target = f"{tbl}_{freq}"
+            ranges = touched(dtm if bounds is None else bounds, width)
+            if bounds is not None:
+                # rebuild: one range from the first to the last bucket of the table
+                ranges = [(ranges[0][0], ranges[-1][1])]
+            frames = [aggregate(con, tbl, width, begin, end, columns, resolution, index=index) for begin, end in ranges]
+            frames = [df for df in frames if not df.empty]
+            if not frames:
+                res[target] = 0
+                continue
+            df = pd.concat(frames) if len(frames) > 1 else frames[0]
+            upsert2sqlite(df, db=db, tbl=target, index=index, on_conflict='update', verbose=False, managed=managed)
+            res[target] = len(df)
+    finally:
+        con.close()
+
+    if verbose:
+        print(", ".join(f"{n} bucket(s) of {target} updated" for target, n in res.items()) + ".")
+    return res
+
+
+# %%
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""Typed table schemas per source, with dtm stored as INTEGER epoch seconds.
+
+A managed table is created with declared column types and a primary key on its natural key (dtm, or dtm and a
+further column), as a WITHOUT ROWID table, i.e. clustered on that key: range queries on dtm become seeks on the
+table itself, and no separate index or rowid is stored. Writers and readers in this package recognize a managed
+table by its INTEGER dtm and convert timestamps on the way in and out.
+
+Existing DBs are converted in place with migrate(), or from the command line:
+    python -m df2sqlite.schema mkn.sqlite [--tables meteo tei49i] [--no-vacuum]
+"""
+# %%
+import os
+import re
+import sqlite3
+import argparse
+import pandas as pd
+
+# source: tables (pattern matched against table names), key (natural key besides dtm), columns (declared types of
+# known columns; columns not listed get the type of their dtype, see column_type)
+SCHEMAS = {
+    'bulletin': dict(tables=r'meteo|bulletin|VMSW43|VRXA00', key=None,
+                     columns=dict(iii='INTEGER', zzzztttt='INTEGER', source_id='INTEGER')),
+    'tei49i': dict(tables=r'tei49i', key=None,
+                   columns=dict(pcdate='TEXT', pctime='TEXT', time='TEXT', date='TEXT', flags='TEXT', o3='REAL',
+                                cellai='REAL', cellbi='REAL', bncht='REAL', lmpt='REAL', o3lt='REAL', flowa='REAL',
+                                flowb='REAL', pres='REAL', source_id='INTEGER')),
+    'tei49c': dict(tables=r'tei49c', key=None,
+                   columns=dict(pcdate='TEXT', pctime='TEXT', time='TEXT', date='TEXT', o3='REAL', flags='TEXT',
+                                cellai='REAL', cellbi='REAL', bncht='REAL', lmpt='REAL', flowa='REAL', flowb='REAL',
+                                pres='REAL', source_id='INTEGER')),
+    'milos': dict(tables=r'milos', key=None,
+                  columns=dict(CO_raw='REAL', tre200s0='REAL', uor200s0='REAL', tde200s0='REAL', prestas0='REAL',
+                               dkl010s0='REAL', fkl010s0='REAL', gor000s0='REAL', ods000so='REAL', dirrad='REAL',
+                               itosurs0='REAL', source_id='INTEGER')),
+    'dwh': dict(tables=r'dwh', key=None, columns=dict(station='TEXT')),
+    'wdcgg': dict(tables=r'wdcgg', key=None,
+                  columns=dict(value='REAL', value_unc='REAL', QCflag='INTEGER', wind_direction='REAL',
+                               wind_speed='REAL', relative_humidity='REAL')),
+    'shadoz': dict(tables=r'shadoz', key=None, columns=dict(O3_ppb='REAL', Time='REAL', Press='REAL')),
+    'ebas': dict(tables=r'ebas', key=None, columns=dict(starttime='REAL', endtime='REAL')),
+    'kplc': dict(tables=r'kplc', key=None, columns={'Meter No': 'TEXT'}),
+    'picarro': dict(tables=r'g2401|picarro|CFKADS', key=None,
+                    columns=dict(ALARM_STATUS='INTEGER', INST_STATUS='INTEGER', MPVPosition='REAL',
+                                 solenoid_valves='INTEGER', OutletValve='REAL', n='INTEGER', source_id='INTEGER')),
+}
+
+
+# columns of provenance, cf. sources.SOURCE and sources.SOURCE_ID
+PROVENANCE = ('source', 'source_id')
+
+
+# %%
+class DuplicateKeyError(ValueError):
+    """A table holds different rows of the same natural key, which no precedence decides between."""
+
+
+def _quote(name: str) -> str:
+    """Quote an SQL identifier."""
+    return '"%s"' % str(name).replace('"', '""')
+
+
+def lookup(tbl: str) -> dict:
+    """Schema of the source a table belongs to, or None, e.g. lookup('tei49i_1h') is the schema of 'tei49i'."""
+    for source, schema in SCHEMAS.items():
+        if re.match(schema['tables'], tbl, flags=re.IGNORECASE):
+            return schema
+    return None
+
+
+def column_type(tbl: str, column: str, dtype=None) -> str:
+    """Declared type of a column: from the registry, else from the dtype of its values.
+
+    Args:
+        tbl (str): name of DB table
+        column (str): name of column
+        dtype (optional): dtype of the column's values in a dataframe. Defaults to None, i.e. REAL.
+    """
+    schema = lookup(tbl)
+    if schema and column in schema['columns']:
+        return schema['columns'][column]
+    if dtype is None:
+        return 'REAL'
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_numeric_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def is_epoch(db, tbl: str, index="dtm") -> bool:
+    """Whether a table stores its timestamps as INTEGER epoch seconds, i.e. is managed.
+
+    Args:
+        db (str or sqlite3.Connection): path to SQLite3 DB, or open connection
+        tbl (str): name of DB table
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+    """
+    con = sqlite3.connect(db) if isinstance(db, str) else db
+    try:
+        for cid, name, dtype, *_ in con.execute(f"pragma table_info({_quote(tbl)})"):
+            if name == index:
+                return dtype.upper() == 'INTEGER'
+        return False
+    finally:
+        if con is not db:
+            con.close()
+
+
+def primary_key(con: sqlite3.Connection, tbl: str) -> list:
+    """Columns of the primary key of a table, in key order ([] for rowid-only tables)."""
+    pk = sorted((pos, name) for cid, name, dtype, notnull, default, pos in
+                con.execute(f"pragma table_info({_quote(tbl)})") if pos)
+    return [name for pos, name in pk]
+
+
+def bound(value, epoch: bool):
+    """A timestamp as query parameter of a table holding epoch seconds, or text 'YYYY-MM-DD HH:MM:SS'."""
+    ts = pd.Timestamp(value)
+    return int(ts.timestamp()) if epoch else ts.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def to_datetime(values, epoch: bool):
+    """Timestamps read from a table, as datetime64."""
+    return pd.to_datetime(values, unit='s') if epoch else pd.to_datetime(values)
+
+
+def create_table(con: sqlite3.Connection, tbl: str, df: pd.DataFrame, index="dtm", key=None) -> list:
+    """Create a managed table for the columns of a dataframe.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        tbl (str): name of DB table
+        df (pd.DataFrame): data to be loaded, with dtm as column
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+        key (str, optional): additional column of the natural key. Defaults to None, in which case it is taken
+            from the registry.
+
+    Returns:
+        list: columns of the primary key
+    """
+    schema = lookup(tbl)
+    if key is None and schema:
+        key = schema['key']
+    keys = [index] if key is None else [index, key]
+    columns = [f"{_quote(index)} INTEGER NOT NULL"]
+    columns += [f"{_quote(c)} {column_type(tbl, c, df[c].dtype)}" + (" NOT NULL" if c in keys else "")
+                for c in df.columns if c != index]
+    columns.append(f"PRIMARY KEY ({', '.join(_quote(k) for k in keys)})")
+    con.execute(f"create table {_quote(tbl)} ({', '.join(columns)}) without rowid")
+    return keys
+
+
+# %%
+def _declared(con: sqlite3.Connection, tbl: str, column: str, dtype: str) -> str:
+    """Declared type of a column of a migrated table: registry, else its current declaration, else its values."""
+    schema = lookup(tbl)
+    if schema and column in schema['columns']:
+        return schema['columns'][column]
+    dtype = dtype.upper()
+    if dtype in ('INTEGER', 'REAL', 'TEXT', 'BLOB'):
+        return dtype
+    if dtype in ('FLOAT', 'DOUBLE', 'NUMERIC'):
+        return 'REAL'
+    if dtype in ('BIGINT', 'SMALLINT', 'INT', 'BOOLEAN'):
+        return 'INTEGER'
+    if dtype:
+        return 'TEXT'
+    # undeclared (e.g. columns added by alter table): storage classes of the values
+    types = {t for (t,) in con.execute(f"select distinct typeof({_quote(column)}) from {_quote(tbl)}")} - {'null'}
+    if types <= {'integer'}:
+        return 'INTEGER'
+    if types <= {'integer', 'real'}:
+        return 'REAL'
+    return 'TEXT'
+
+
+def migrate_table(con: sqlite3.Connection, tbl: str, index="dtm", verbose=True) -> dict:
+    """Convert a table with text timestamps into a managed table, in place.
+
+    Rows without timestamp are dropped, as are rows repeating another row of their natural key but for the
+    source. If a key has rows that differ in value, DuplicateKeyError is raised and the table is left as it was;
+    resolve such keys by precedence with df2sqlite.dedup first.
+    Indexes not leading with dtm are recreated; those leading with dtm are replaced by the primary key.
+
+    Args:
+        con (sqlite3.Connection): open DB connection, in autocommit mode (isolation_level None)
+        tbl (str): name of DB table
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+
+    Returns:
+        dict: rows before and after
+    """
+    info = con.execute(f"pragma table_info({_quote(tbl)})").fetchall()
+    columns = [(name, dtype) for cid, name, dtype, *_ in info]
+    keys = [index]
+    schema = lookup(tbl)
+    if schema and schema['key']:
+        keys.append(schema['key'])
+    indexes = []
+    for seq, name, unique, *_ in con.execute(f"pragma index_list({_quote(tbl)})"):
+        cols = [tpl[2] for tpl in con.execute(f"pragma index_info({_quote(name)})")]
+        if cols and cols[0] == index:
+            if unique and len(cols) > len(keys):
+                # natural key of upsert2sqlite(key=...)
+                keys = cols
+        else:
+            sql = con.execute("select sql from sqlite_master where type='index' and name=?", (name,)).fetchone()[0]
+            if sql:
+                indexes.append(sql)
+
+    tmp = f"{tbl}__migrate"
+    defs = [f"{_quote(index)} INTEGER NOT NULL"]
+    defs += [f"{_quote(c)} {_declared(con, tbl, c, dtype)}" + (" NOT NULL" if c in keys else "")
+             for c, dtype in columns if c != index]
+    defs.append(f"PRIMARY KEY ({', '.join(_quote(k) for k in keys)})")
+    names = ", ".join(_quote(c) for c, dtype in columns)
+    values = ", ".join(f"cast(strftime('%s', {_quote(c)}) as integer)" if c == index else _quote(c)
+                       for c, dtype in columns)
+    conditions = " and ".join(f"{_quote(k)} is not null" for k in keys)
+    # keys as migrated: text timestamps spelled differently may become the same epoch second
+    aliases = [f"k{i}" for i in range(len(keys))]
+    migrated = [f"strftime('%s', {_quote(c)})" if c == index else _quote(c) for c in keys]
+    distinct = [f"{expr} as {alias}" for expr, alias in zip(migrated, aliases)]
+    distinct += [_quote(c) for c, dtype in columns if c not in keys and c not in PROVENANCE]
+
+    before = con.execute(f"select count(*) from {_quote(tbl)}").fetchone()[0]
+    con.execute("begin")
+    try:
+        # as df2sqlite.resolve_duplicates: different rows of a key are not decided here
+        conflicts = con.execute(
+            f"select count(*) from (select 1 from (select distinct {', '.join(distinct)} from {_quote(tbl)} "
+            f"where {conditions} and {migrated[0]} is not null) group by {', '.join(aliases)} having count(*) > 1)"
+        ).fetchone()[0]
+        if conflicts:
+            raise DuplicateKeyError(
+                f"{conflicts} key(s) ({', '.join(keys)}) with different rows, not migrated. Resolve them with "
+                f"python -m df2sqlite.df2sqlite <db> --tables {tbl} [--precedence ...] [--keep first] first.")
+        con.execute(f"drop table if exists {_quote(tmp)}")
+        con.execute(f"create table {_quote(tmp)} ({', '.join(defs)}) without rowid")
+        # rows repeating a key but for their source: the first loaded is kept
+        con.execute(f"insert or ignore into {_quote(tmp)} ({names}) select {values} from {_quote(tbl)} "
+                    f"where {conditions} and strftime('%s', {_quote(index)}) is not null order by rowid")
+        con.execute(f"drop table {_quote(tbl)}")
+        con.execute(f"alter table {_quote(tmp)} rename to {_quote(tbl)}")
+        for sql in indexes:
+            con.execute(sql)
+        con.execute("commit")
+    except Exception:
+        con.execute("rollback")
+        raise
+    after = con.execute(f"select count(*) from {_quote(tbl)}").fetchone()[0]
+
+    if verbose:
+        print(f"{tbl}: {after} record(s) migrated, {before - after} dropped (repeated or no timestamp).")
+    return {"before": before, "after": after}
+
+
+def migrate(db: str, tables=None, index="dtm", vacuum=True, verbose=True) -> dict:
+    """Convert the tables of a DB with a dateTime axis into managed tables, in place.
+
+    Tables starting with '_' (e.g. the ingest ledger) and tables already managed are left alone.
+
+    Args:
+        db (str): path to SQLite3 DB
+        tables (list, optional): names of tables to migrate. Defaults to None, i.e. all tables.
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+        vacuum (bool, optional): rebuild the DB file afterwards, so that it shrinks. Defaults to True.
+
+    Returns:
+        dict: result of migrate_table per table
+    """
+    size = os.path.getsize(db)
+    con = sqlite3.connect(db, isolation_level=None)
+    res = {}
+    try:
+        if tables is None:
+            tables = [tpl[0] for tpl in con.execute("select name from sqlite_master where type='table' order by name")
+                      if not tpl[0].startswith(('_', 'sqlite_'))]
+        for tbl in tables:
+            names = [tpl[1] for tpl in con.execute(f"pragma table_info({_quote(tbl)})")]
+            if index not in names or is_epoch(con, tbl, index=index):
+                continue
+            try:
+                res[tbl] = migrate_table(con, tbl, index=index, verbose=verbose)
+            except Exception as err:
+                print(f"{tbl}: {err}")
+        if vacuum and res:
+            con.execute("vacuum")
+    finally:
+        con.close()
+
+    if verbose:
+        print(f"{len(res)} table(s) of {db} migrated, {size / 2**20:.1f} MB -> {os.path.getsize(db) / 2**20:.1f} MB.")
+    return res
+
+
+# %%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert SQLite3 DBs to managed tables with epoch timestamps.")
+    parser.add_argument('db', nargs='+', help="path(s) to SQLite3 DB")
+    parser.add_argument('--tables', nargs='*', help="names of tables to migrate. Default: all")
+    parser.add_argument('--index', default='dtm', help="name of dateTime axis. Default: dtm")
+    parser.add_argument('--no-vacuum', action='store_true', help="do not rebuild the DB file afterwards")
+    args = parser.parse_args()
+
+    for db in args.db:
+        migrate(db, tables=args.tables, index=args.index, vacuum=not args.no_vacuum)
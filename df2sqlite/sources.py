@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Dictionary of the sources (files) rows were loaded from.
+
+Extractors tag every row with the path of its file in a 'source' column. Stored as is, the same long string is
+repeated on every row of a table. Loaders therefore intern the paths into the table _sources(id, path, hash,
+loaded_at) and store the INTEGER source_id of the path instead; the path of a row is
+
+    select path from _sources where id = <tbl>.source_id
+
+Tables holding a 'source' column are converted the first time rows are loaded into them, or in place with
+migrate(), or from the command line:
+    python -m df2sqlite.sources mkn.sqlite [--tables meteo tei49i] [--no-vacuum]
+"""
+# %%
+import os
+import datetime
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+from df2sqlite.ledger import file_hash
+from df2sqlite.schema import _quote
+
+SOURCES = "_sources"
+SOURCE = "source"
+SOURCE_ID = "source_id"
+
+
+# %%
+def path_of(column: str) -> str:
+    """SQL expression of the path of the source_id held by column, e.g. path_of('excluded.source_id')."""
+    return f"(select path from {SOURCES} where id = {column})"
+
+
+def intern(con: sqlite3.Connection, paths: list, cache=None) -> dict:
+    """Return the ids of paths in _sources, adding the paths not known yet.
+
+    New paths are recorded with the content hash of the file, if they are a file (not e.g. a member of an
+    archive or a URL); the ledger has usually hashed it already (see ledger.file_hash). They are committed with
+    the rows of the transaction they are added in.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        paths (list): paths of sources
+        cache (dict, optional): path: id of the paths interned before on this connection. Defaults to None.
+
+    Returns:
+        dict: path: id
+    """
+    if cache is None:
+        cache = {}
+    new = [path for path in dict.fromkeys(paths) if path not in cache]
+    if new:
+        con.execute(f"create table if not exists {SOURCES} (id integer primary key, path text not null unique, "
+                    "hash text, loaded_at text)")
+        loaded_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for path in new:
+            row = con.execute(f"select id from {SOURCES} where path = ?", (path,)).fetchone()
+            if row is None:
+                digest = file_hash(path) if os.path.isfile(path) else None
+                row = (con.execute(f"insert into {SOURCES} (path, hash, loaded_at) values (?, ?, ?)",
+                                   (path, digest, loaded_at)).lastrowid, )
+            cache[path] = row[0]
+    return {path: cache[path] for path in paths}
+
+
+def encode(con: sqlite3.Connection, df: pd.DataFrame, tbl=None, cache=None) -> pd.DataFrame:
+    """Replace the source column of a dataframe by source_id, interning its paths.
+
+    The paths are interned once per distinct value (or category, cf. bulletin2df.extract_bulletin_files). If
+    the table to load into still holds a source column, it is migrated first, and it is given a source_id
+    column if it lacks one. Nothing is committed: the migration is committed with the rows loaded.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        df (pd.DataFrame): data to load
+        tbl (str, optional): name of DB table the data will be loaded into. Defaults to None.
+        cache (dict, optional): cf. intern. Defaults to None.
+
+    Returns:
+        pd.DataFrame: df without source column, a new frame if it had one
+    """
+    if SOURCE not in df.columns:
+        return df
+    if tbl is not None:
+        names = [tpl[1] for tpl in con.execute(f"pragma table_info({_quote(tbl)})")]
+        if SOURCE in names:
+            migrate_table(con, tbl)
+        elif names and SOURCE_ID not in names:
+            con.execute(f"alter table {_quote(tbl)} add column {SOURCE_ID} INTEGER")
+
+    column = df[SOURCE]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes, paths = column.cat.codes.to_numpy(), column.cat.categories
+    else:
+        codes, paths = pd.factorize(column)
+    paths = [str(path) for path in paths]
+    ids = intern(con, paths, cache=cache)
+    values = np.asarray([ids[path] for path in paths] + [0], dtype='int64')[codes]
+
+    # renaming in place of drop and insert, which cost more than the rest for frames of a single bulletin
+    df = df.copy(deep=False)
+    df.columns = [SOURCE_ID if name == SOURCE else name for name in df.columns]
+    df[SOURCE_ID] = pd.arrays.IntegerArray(values, codes < 0)
+    return df
+
+
+# %%
+def migrate_table(con: sqlite3.Connection, tbl: str, verbose=True) -> dict:
+    """Replace the source column of a table by source_id, in place, within the transaction of the caller.
+
+    Nothing is committed; if the migration fails, the table is left as it was.
+
+    Args:
+        con (sqlite3.Connection): open DB connection
+        tbl (str): name of DB table
+
+    Returns:
+        dict: rows and distinct sources converted
+    """
+    names = [tpl[1] for tpl in con.execute(f"pragma table_info({_quote(tbl)})")]
+    if SOURCE not in names:
+        return {"rows": 0, "sources": 0}
+    # an outermost savepoint would commit on release
+    if con.isolation_level is not None and not con.in_transaction:
+        con.execute("begin")
+    con.execute("savepoint migrate_sources")
+    try:
+        paths = [str(path) for (path,) in con.execute(f"select distinct {SOURCE} from {_quote(tbl)} "
+                                                      f"where {SOURCE} is not null")]
+        intern(con, paths)
+        if SOURCE_ID not in names:
+            con.execute(f"alter table {_quote(tbl)} add column {SOURCE_ID} INTEGER")
+        cur = con.execute(f"update {_quote(tbl)} set {SOURCE_ID} = "
+                          f"(select id from {SOURCES} where path = {_quote(tbl)}.{SOURCE}) "
+                          f"where {SOURCE} is not null and {SOURCE_ID} is null")
+        rows = cur.rowcount
+        con.execute(f"alter table {_quote(tbl)} drop column {SOURCE}")
+    except Exception:
+        con.execute("rollback to migrate_sources")
+        raise
+    finally:
+        con.execute("release migrate_sources")
+
+    if verbose:
+        print(f"{tbl}: {SOURCE} of {rows} record(s) replaced by {SOURCE_ID} ({len(paths)} source(s)).")
+    return {"rows": rows, "sources": len(paths)}
+
+
+def migrate(db: str, tables=None, vacuum=True, verbose=True) -> dict:
+    """Replace the source column of the tables of a DB by source_id, in place.
+
+    Args:
+        db (str): path to SQLite3 DB
+        tables (list, optional): names of tables to migrate. Defaults to None, i.e. all tables with a source column.
+        vacuum (bool, optional): rebuild the DB file afterwards, so that it shrinks. Defaults to True.
+
+    Returns:
+        dict: result of migrate_table per table
+    """
+    size = os.path.getsize(db)
+    con = sqlite3.connect(db)
+    res = {}
+    try:
+        if tables is None:
+            tables = [tpl[0] for tpl in con.execute("select name from sqlite_master where type='table' order by name")
+                      if not tpl[0].startswith(('_', 'sqlite_'))]
+        for tbl in tables:
+            if SOURCE not in [tpl[1] for tpl in con.execute(f"pragma table_info({_quote(tbl)})")]:
+                continue
+            try:
+                res[tbl] = migrate_table(con, tbl, verbose=verbose)
+                con.commit()
+            except Exception as err:
+                con.rollback()
+                print(f"{tbl}: {err}")
+        if vacuum and res:
+            con.execute("vacuum")
+    finally:
+        con.close()
+
+    if verbose:
+        print(f"{len(res)} table(s) of {db} migrated, {size / 2**20:.1f} MB -> {os.path.getsize(db) / 2**20:.1f} MB.")
+    return res
+
+
+# %%
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replace the source column of SQLite3 tables by source_id.")
+    parser.add_argument('db', nargs='+', help="path(s) to SQLite3 DB")
+    parser.add_argument('--tables', nargs='*', help="names of tables to migrate. Default: all")
+    parser.add_argument('--no-vacuum', action='store_true', help="do not rebuild the DB file afterwards")
+    args = parser.parse_args()
+
+    for db in args.db:
+        migrate(db, tables=args.tables, vacuum=not args.no_vacuum)
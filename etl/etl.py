@@ -15,6 +15,25 @@ import requests
 import pandas as pd
 import sqlite3
 import zipfile
+import queue
+import threading
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from df2sqlite import df2sqlite
+from df2sqlite import schema
+from df2sqlite import sources
+from df2sqlite.ledger import IngestLedger
+from df2sqlite.bulk import BulkLoader
+from df2sqlite import rollup
+from df2parquet import df2parquet
+from extract2df import bulletin2df
+from extract2df import picarro2df
+from etl import parsers
+from etl.metrics import Metrics
+
+BULLETIN = re.compile(r'VMSW43|VRXA00')
+# bulletins listed on a filebrowser (or any HTML directory listing)
+LISTING = re.compile(r'>((?:VMSW43|VRXA00)[^<]*\.(?:zip|001))<')
 
 # %%
 class ETLHandler:
@@ -34,6 +53,41 @@ class ETLHandler:
             self.index = config['index']
             self.seconds = config['seconds']
 
+            # loader mode: upsert on a UNIQUE (dtm[, key]) index instead of the full-table dedup
+            self.upsert = config.get('upsert', False)
+            self.key = config.get('key', None)
+            self.precedence = config.get('precedence', None)
+
+            # create new tables as managed tables (typed columns, epoch dtm, clustered on the natural key)
+            self.managed = config.get('schema', False)
+
+            # bulk-load session of process_directory: True, or options of BulkLoader (batch_files, batch_rows, cache_size)
+            self.bulk = config.get('bulk', None)
+            self.bulkloader = None
+            self.pending_rollups = {}
+
+            # skip files recorded in the DB's _ingest_ledger
+            self.ledger = config.get('ledger', True)
+
+            # root of Parquet mirror, synced for the tables loaded by process_directory; table: years loaded
+            self.mirror = config.get('mirror', None)
+            self.loaded_tables = {}
+
+            # timing spans of the ETL stages, optionally appended to a JSON-lines file by process_directory
+            self.metrics = Metrics()
+            self.metricsfile = config.get('metricsfile', None)
+
+            # on-load aggregation of high-frequency tables into <tbl>_<freq>, e.g. {'g2401': '1min'}, and whether
+            # their raw rows are loaded as well
+            self.aggregate = config.get('aggregate', None) or {}
+            self.aggregate_raw = config.get('aggregate_raw', True)
+
+            # watch mode: options of watch (interval, batch_files, poll)
+            self.watch_options = config.get('watch', None) or {}
+
+            # hourly/daily rollup tables, updated after each load: True for all tables, or a list of tables
+            self.rollup = config.get('rollup', False)
+
             # data paths
             self.incoming = config['incoming']
             self.archive = config['archive']
@@ -91,101 +145,58 @@ class ETLHandler:
                 self.logger.error(msg, err)
 
     @classmethod
-    def extract_file(self, file: str, index=None, stream=None):
+    def extract_file(self, file: str, index=None, stream=None, tbl=None):
         """
         Open a file, determine its type from the file name, then extract content into a Pandas dataframe.
 
+        The file is dispatched to the parser whose pattern its basename matches (see etl.parsers), zip archives
+        are inflated once. Files no parser claims are not opened, and give an empty dataframe.
+
         Args:
             file (str): full path to file.
             seconds (bool, optional): Should seconds remain in the timestamps? Defaults to 'False'.
             index (str, optional): The label of the column to set as index of the dataframe. Defaults to None, in which case the value is taken from the configuration.
+            tbl (str, optional): DB table the file is destined for, to attribute timing spans. Defaults to None, in which case it is the name of the file's folder, or the table of its parser.
         """
         try:
             if index is None:
                 index = self.index
+            # one match of the basename, unknown files are not opened
+            parser = parsers.match(os.path.basename(file))
+            if parser is None:
+                if self.verbose:
+                    print('No parser for %s, skipped.' % file)
+                return pd.DataFrame()
+            if tbl is None:
+                tbl = os.path.basename(os.path.dirname(file)) or parser['tbl']
+            metrics = self.metrics
             msg = 'Extracting file %s.' % file
             if self.verbose:
                 print(msg)
             if self.logging:
                 self.logger.info(msg)
 
-            df = pd.DataFrame()
-            if '.zip' in file:
+            with metrics.span('open', tbl) as span:
                 try:
-                    if stream:
-                        zf = zipfile.ZipFile(BytesIO(stream))
+                    span['bytes'] = len(stream) if stream else os.path.getsize(file)
+                    if file.endswith('.zip'):
+                        with zipfile.ZipFile(BytesIO(stream) if stream else file) as zf:
+                            buffer = BytesIO(zf.read(zf.namelist()[0]))
+                    elif stream:
+                        buffer = BytesIO(stream)
                     else:
-                        zf = zipfile.ZipFile(file)
+                        with open(file, 'rb') as fh:
+                            buffer = BytesIO(fh.read())
                 except Exception as err:
                     print('Warning: ', err, 'and will be ignored. Please remove manually.')
                     return pd.DataFrame()
-
-                if 'CFKADS2320' in file:
-                    print('not yet implemented')
-                    # CREATE TABLE "g2401" (
-                    # 	"dtm"	TEXT,
-                    # 	"DATE"	TEXT,
-                    # 	"TIME"	TEXT,
-                    # 	"JULIAN_DAYS"	REAL,
-                    # 	"EPOCH_TIME"	REAL,
-                    # 	"ALARM_STATUS"	REAL,
-                    # 	"INST_STATUS"	REAL,
-                    # 	"MPVPosition"	REAL,
-                    # 	"solenoid_valves"	REAL,
-                    # 	"OutletValve"	REAL,
-                    # 	"CavityPressure"	REAL,
-                    # 	"CO_sync"	REAL,
-                    # 	"CO2_sync"	REAL,
-                    # 	"CO2_dry_sync"	REAL,
-                    # 	"CH4_sync"	REAL,
-                    # 	"CH4_dry_sync"	REAL,
-                    # 	"H2O_sync"	REAL,
-                    # 	"CavityTemp"	REAL,
-                    # 	"DasTemp"	REAL,
-                    # 	"EtalonTemp"	REAL,
-                    # 	"WarmBoxTemp"	REAL,
-                    # 	"source"	TEXT
-                    # )
-
-                    #                     df.drop(columns=['FRAC_DAYS_SINCE_JAN1', 'FRAC_HRS_SINCE_JAN1'], inplace=True)
-                    #                     df['dtm'] = pd.to_datetime(df['DATE'] + ' ' + df['TIME'])
-                    #                     df['source'] = file
-                    #                     df.set_index(index, inplace=True)
-                if 'tei49i' in file:
-                    df = pd.read_csv(zf.open(zf.namelist()[0]), sep=' +', engine='python')
-                    df[index] = pd.to_datetime(df['pcdate'] + ' ' + df['pctime'])
-                    if not self.seconds:
-                        df[index] = df[index].apply(lambda x: x.round(freq='T'))
-                    df.drop(columns=[df.columns[4], 'hio3'], inplace=True)
-                    df['source'] = file
-                    df.set_index(self.index, inplace=True)
-                    # return df
-                elif 'tei49c' in file:
-                    # df = pd.read_csv(zf.open(zf.namelist()[0], mode='r'), sep=' ', engine='python', )
-                    df = pd.read_csv(file, compression='zip', sep=' +', engine='python')
-                    df[index] = pd.to_datetime(df['pcdate'] + ' ' + df['pctime'])
-                    if not self.seconds:
-                        df[index] = df[index].apply(lambda x: x.round(freq='T'))
-                    df.drop(columns=['o3lt'], inplace=True)
-                    df['source'] = file
-                    df.set_index(self.index, inplace=True)
-                    # return df
-                elif 'g2401' in file:
-                    df = pd.read_csv(zf.open(zf.namelist()[0]), sep=' +', encoding='latin1', engine='python')
-                    # columns_to_keep =
-                elif 'VMSW43' in file:
-                    df = pd.read_csv(zf.open(zf.namelist()[0]), skiprows=1, header=1, sep=' ', na_values='/')
-                    df[index] = pd.to_datetime(df['zzzztttt'], format='%Y%m%d%H%M')
-                    df['source'] = file
-                    df.set_index(index, inplace=True)
-            elif 'VMSW43' in file:
-                if stream:
-                    df = pd.read_csv(BytesIO(stream), skiprows=1, header=1, sep=' ', na_values='/')
-                else:
-                    df = pd.read_csv(file, skiprows=1, header=1, sep=' ', na_values='/')
-                df[index] = pd.to_datetime(df['zzzztttt'], format='%Y%m%d%H%M')
+            with metrics.span('parse', tbl) as span:
+                df = parser['read'](buffer, **parser['options'])
+                span['rows'] = len(df)
+            with metrics.span('transform', tbl, rows=len(df)):
+                if parser['transform'] is not None:
+                    df = parser['transform'](df, index=index, seconds=self.seconds)
                 df['source'] = file
-                df.set_index(index, inplace=True)
             return df
 
         except Exception as err:
@@ -194,7 +205,18 @@ class ETLHandler:
 
 
     @classmethod
-    def load_file(self, tbl: str, df: pd.DataFrame, index=None, remove_duplicates=True) -> None:
+    def table_loaded(self, tbl: str, df: pd.DataFrame) -> None:
+        """Record the years of the rows loaded into a table, whose partitions the Parquet mirror rewrites."""
+        if self.mirror:
+            years = self.loaded_tables.setdefault(tbl, set())
+            try:
+                years.update(int(year) for year in pd.DatetimeIndex(df.index).year.dropna().unique())
+            except Exception as err:
+                print(err)
+
+    @classmethod
+    def load_file(self, tbl: str, df: pd.DataFrame, index=None, remove_duplicates=True, upsert=None,
+                  on_conflict='nothing') -> None:
         """Append a dataframe to an SQLite3 DB.
 
         Args:
@@ -202,17 +224,60 @@ class ETLHandler:
             df (pd.DataFrame): Pandas dataframe with information to load
             index_label (str, optional): Name of dateTime axis. Defaults to None, in which case it is taken from the configuration.
             remove_duplicates (bool, optional): Should duplicate rows in table be removed?. Defaults to True.
+            upsert (bool, optional): Insert on a UNIQUE index of the natural key instead of removing duplicates afterwards. Defaults to None, in which case it is taken from the configuration.
+            on_conflict (str, optional): Upserts skip ('nothing') or overwrite ('update') rows stored already. Defaults to 'nothing'.
+
+        Within a bulk-load session (see process_directory), rows are loaded into the open batch, as they would be
+        otherwise, and the rollups are updated once the batch is committed. Tables listed in the configuration key 'aggregate' are loaded as
+        aggregates (see load_aggregate), and unless 'aggregate_raw' is False, as raw rows as well.
 
         Returns:
             None
         """
+        conn = None
         try:
             if index is None:
                 index = self.index
+            if upsert is None:
+                upsert = self.upsert
+
+            freq = self.aggregate.get(tbl)
+            if freq:
+                res = self.load_aggregate(tbl, df, freq, index=index)
+                if res is not None or not self.aggregate_raw:
+                    return res
+
+            if self.bulkloader is not None:
+                with self.metrics.span('load', tbl, rows=len(df)):
+                    res = self.bulkloader.load(df, tbl, index=index, key=self.key, on_conflict=on_conflict,
+                                               precedence=self.precedence, managed=self.managed, upsert=upsert,
+                                               remove_duplicates=remove_duplicates)
+                if self.logging:
+                    self.logger.info('%s record(s) added or updated in table %s.' % (res['records_changed'], tbl))
+                self.table_loaded(tbl, df)
+                # rollups read the committed table: collect the timestamps of the batch, update once per table
+                if tbl not in self.pending_rollups:
+                    self.pending_rollups[tbl] = []
+                    self.bulkloader.defer(self.flush_rollups, tbl, index=index)
+                self.pending_rollups[tbl].append(df.index)
+                return None
+
+            # managed tables reject duplicates by their primary key, there is no rowid to dedup on
+            if upsert or self.managed or schema.is_epoch(self.db, tbl, index=index):
+                with self.metrics.span('load', tbl, rows=len(df)):
+                    res = df2sqlite.upsert2sqlite(df, db=self.db, tbl=tbl, index=index, key=self.key,
+                                                  on_conflict=on_conflict, precedence=self.precedence,
+                                                  verbose=self.verbose, managed=self.managed)
+                if self.logging:
+                    self.logger.info('%s record(s) added or updated in table %s.' % (res['records_changed'], tbl))
+                self.table_loaded(tbl, df)
+                self.update_rollups(tbl, df, index=index)
+                return None
 
-            conn = sqlite3.connect(self.db)
-
-            df.to_sql(tbl, conn, if_exists='append', index=True, index_label=index)
+            with self.metrics.span('load', tbl, rows=len(df)):
+                conn = sqlite3.connect(self.db)
+                df = sources.encode(conn, df, tbl)
+                df.to_sql(tbl, conn, if_exists='append', index=True, index_label=index)
 
             msg = '%s record(s) added to table %s.' % (len(df), tbl)
             if self.verbose:
@@ -220,79 +285,445 @@ class ETLHandler:
             if self.logging:
                 self.logger.info(msg)                  
 
-            if remove_duplicates:            
-                # collect all field names using pragma, then remove source
-                cursor = conn.cursor()
-                cursor.execute("pragma table_info(%s)" % tbl)
-                res = cursor.fetchall()
-                names = [tpl[1] for tpl in res]
-                if 'source' in names:
-                    names.remove('source')
-
-                # identify duplicates on all fields
-                qry = "select count(*) from %s " % tbl
-                qry += "group by %s " % ",".join(names)
-                qry += "having count(*) > 1"
-                cursor.execute(qry)
-                res = cursor.fetchall()
-
-                # remove duplicates
-                if len(res) > 0:
-                    qry = "delete from %s where rowid not in ( " % tbl
-                    qry += "select min(rowid) from %s " % tbl
-                    qry += "group by %s )" % ",".join(names)
+            if remove_duplicates:
+                with self.metrics.span('dedup', tbl) as span:
+                    # collect all field names using pragma, then remove source
+                    cursor = conn.cursor()
+                    cursor.execute("pragma table_info(%s)" % tbl)
+                    res = cursor.fetchall()
+                    names = [tpl[1] for tpl in res if tpl[1] not in (sources.SOURCE, sources.SOURCE_ID)]
+
+                    # identify duplicates on all fields
+                    qry = "select count(*) from %s " % tbl
+                    qry += "group by %s " % ",".join(names)
+                    qry += "having count(*) > 1"
                     cursor.execute(qry)
-                    conn.commit()
-
-                    msg = '%s duplicate record(s) removed from table %s.' % (len(res), tbl)
-                    if self.verbose:
-                        print(msg)
-                    if self.logging:
-                        self.logger.info(msg)
+                    res = cursor.fetchall()
+                    span['rows'] = len(res)
+
+                    # remove duplicates
+                    if len(res) > 0:
+                        qry = "delete from %s where rowid not in ( " % tbl
+                        qry += "select min(rowid) from %s " % tbl
+                        qry += "group by %s )" % ",".join(names)
+                        cursor.execute(qry)
+                        conn.commit()
+
+                        msg = '%s duplicate record(s) removed from table %s.' % (len(res), tbl)
+                        if self.verbose:
+                            print(msg)
+                        if self.logging:
+                            self.logger.info(msg)
 
             conn.close()
+            self.table_loaded(tbl, df)
+            self.update_rollups(tbl, df, index=index)
             return None
 
         except Exception as err:
-            conn.close()
+            if conn is not None:
+                conn.close()
             print(err)
             if self.logging:
                 self.logger.error(f"'.append' error: {err}")
             return err
 
     @classmethod
-    def process_directory(self, path=None, seconds=None, index='dtm'):
+    def load_aggregate(self, tbl: str, df: pd.DataFrame, freq: str, index=None) -> None:
+        """Aggregate the rows of a high-frequency table (see picarro2df.aggregate) and upsert them into <tbl>_<freq>.
+
+        Intervals stored already, e.g. the minute a file starts in, filled partly by the previous file, are
+        combined with the new aggregates (see picarro2df.combine). Files must therefore be loaded once, as the
+        ledger ensures.
+
+        Args:
+            tbl (str): Name of DB table of the raw rows, e.g. 'g2401'
+            df (pd.DataFrame): raw rows, indexed by dtm
+            freq (str): length of intervals, e.g. '1min'
+            index (str, optional): Name of dateTime axis. Defaults to None, in which case it is taken from the configuration.
+
+        Returns:
+            None, or the error of load_file
+        """
+        if index is None:
+            index = self.index
+        target = f"{tbl}_{freq}"
+        with self.metrics.span('transform', tbl, rows=len(df)):
+            agg = picarro2df.aggregate(df, freq)
+
+        # rows of the open bulk-load batch are visible on its connection
+        con = sqlite3.connect(self.db) if self.bulkloader is None else self.bulkloader.con
+        try:
+            if con.execute("select 1 from sqlite_master where type='table' and name=?", (target,)).fetchone():
+                epoch = schema.is_epoch(con, target, index=index)
+                stored = pd.read_sql_query(f'select * from "{target}" where "{index}" between ? and ?', con,
+                                           params=(schema.bound(agg.index.min(), epoch),
+                                                   schema.bound(agg.index.max(), epoch)))
+                stored.index = pd.DatetimeIndex(schema.to_datetime(stored.pop(index), epoch), name=index)
+                stored = stored[stored.index.isin(agg.index)]
+                if not stored.empty:
+                    agg.loc[stored.index] = picarro2df.combine(stored, agg.loc[stored.index])
+        finally:
+            if self.bulkloader is None:
+                con.close()
+        return self.load_file(target, agg, index=index, upsert=True, on_conflict='update')
+
+    @classmethod
+    def update_rollups(self, tbl: str, df: pd.DataFrame, index=None) -> None:
+        """Recompute the buckets of the hourly and daily rollups of a table touched by the rows just loaded.
+
+        Only done if the configuration key 'rollup' is True or lists the table. Errors are reported, but do not
+        fail the load.
+
+        Args:
+            tbl (str): name of DB table
+            df (pd.DataFrame): rows just loaded, indexed by dtm
+            index (str, optional): Name of dateTime axis. Defaults to None, in which case it is taken from the configuration.
+        """
+        if not self.rollup or (self.rollup is not True and tbl not in self.rollup):
+            return
+        if index is None:
+            index = self.index
+        try:
+            with self.metrics.span('rollup', tbl, rows=len(df)):
+                res = rollup.update_rollups(self.db, tbl, df.index, index=index, verbose=self.verbose)
+            if self.logging:
+                self.logger.info(f"Rollups of {tbl} updated: {res}")
+        except Exception as err:
+            print(err)
+            if self.logging:
+                self.logger.error(f"'.update_rollups' error: {err}")
+
+    @classmethod
+    def flush_rollups(self, tbl: str, index=None) -> None:
+        """Update the rollups of a table for all timestamps loaded in the batch just committed."""
+        dtm = self.pending_rollups.pop(tbl, [])
+        if dtm:
+            self.update_rollups(tbl, pd.DataFrame(index=dtm[0].append(dtm[1:])), index=index)
+
+    @classmethod
+    def file_loaded(self, file: str, tbl: str, rows: int, ledger=None) -> None:
+        """Record a loaded file in the ledger and archive it, once its rows have been committed.
+
+        In a bulk-load session the file is recorded within the batch holding its rows, so that both are committed
+        together, and archiving is deferred to the commit of the batch, which the file is counted towards.
+
+        Args:
+            file (str): full path to file
+            tbl (str): name of DB table the file was loaded to
+            rows (int): number of rows extracted from the file
+            ledger (IngestLedger, optional): ledger to record the file in. Defaults to None.
+        """
+        if ledger is not None:
+            ledger.record(file, tbl, rows)
+        if self.bulkloader is None:
+            self.archive_loaded_file(file, tbl)
+        else:
+            self.bulkloader.defer(self.archive_loaded_file, file, tbl)
+            self.bulkloader.done()
+
+    @classmethod
+    def archive_loaded_file(self, file: str, tbl: str) -> None:
+        """Move a file whose rows have been committed to the archive, in a sub-folder per table and year.
+
+        Args:
+            file (str): full path to file
+            tbl (str): name of DB table the file was loaded to
+        """
+        if self.archive is None:
+            return
+        if 'meteo' in file or BULLETIN.search(os.path.basename(file)):
+            year = re.findall(r'\.(\d{4})', os.path.basename(file))[0]
+        else:
+            year = re.findall(r'-(\d{4})', os.path.basename(file))[0]
+        with self.metrics.span('archive', tbl):
+            os.makedirs(os.path.join(self.archive, tbl, year), exist_ok=True)
+            dst = os.path.join(self.archive, tbl, year, os.path.basename(file))
+            os.replace(src=file, dst=dst)
+
+    @classmethod
+    def process_bulletins(self, files: list, tbl: str, index='dtm', ledger=None, batch_size=None) -> int:
+        """Extract, load and archive bulletins (VMSW43, VRXA00) in batches.
+
+        Each batch is parsed with bulletin2df.extract_bulletin_files and loaded with a single load_file call.
+        Files are recorded in the ledger and archived after their batch has been committed. Malformed bulletins
+        are rejected by the extractor without failing their batch, and stay in incoming.
+
+        Args:
+            files (list): full paths to bulletin files
+            tbl (str): name of DB table
+            index (str, optional): Name of dateTime axis. Defaults to 'dtm'.
+            ledger (IngestLedger, optional): ledger to record loaded files in. Defaults to None.
+            batch_size (int, optional): number of files per batch. Defaults to None, in which case it is taken from the configuration (key 'batch_size'), or 1000.
+
+        Returns:
+            int: number of files loaded successfully
+        """
+        if batch_size is None:
+            batch_size = self.config.get('batch_size', 1000)
+        cnt = 0
+        for i in range(0, len(files), batch_size):
+            batch = files[i:i + batch_size]
+            df = bulletin2df.extract_bulletin_files(batch, index=index, log=self.logging, metrics=self.metrics, tbl=tbl)
+            if df.empty or self.load_file(tbl, df, index=index) is not None:
+                continue
+            # rows per file, members of multi-bulletin archives are named <archive>/<member>
+            rows = {}
+            names = set(batch)
+            for name, n in df['source'].value_counts().items():
+                file = name if name in names else os.path.dirname(name)
+                rows[file] = rows.get(file, 0) + int(n)
+            # files with a rejected bulletin stay in incoming
+            rejected = {name if name in names else os.path.dirname(name) for name in df.attrs.get('rejected', [])}
+            for file in batch:
+                if file in rows and file not in rejected:
+                    self.file_loaded(file, tbl, rows[file], ledger=ledger)
+                    cnt += 1
+        return cnt
+
+    @classmethod
+    def process_files_parallel(self, jobs: list, workers: int, index='dtm', ledger=None) -> int:
+        """Extract files in a process pool and load them through a single SQLite writer.
+
+        Parsed frames are passed to one writer thread over a bounded queue, so at most 2 * workers frames
+        are held in memory. A file is archived only after its rows have been committed.
+
+        Args:
+            jobs (list): tuples of (full path to file, name of DB table)
+            workers (int): number of extract processes
+            index (str, optional): Name of dateTime axis. Defaults to 'dtm'.
+            ledger (IngestLedger, optional): ledger to record loaded files in. Defaults to None.
+
+        Returns:
+            int: number of files loaded successfully
+        """
+        frames = queue.Queue(maxsize=2 * workers)
+        loaded = []
+
+        def writer():
+            while True:
+                item = frames.get()
+                if item is None:
+                    break
+                file, tbl, df = item
+                try:
+                    if not df.empty and self.load_file(tbl, df, index=index) is None:
+                        self.file_loaded(file, tbl, len(df), ledger=ledger)
+                        loaded.append(file)
+                except Exception as err:
+                    print(err)
+                    if self.logging:
+                        self.logger.error(f"'.process_files_parallel' error: {err}")
+
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        try:
+            # workers re-initialize the handler, logging stays with the parent process
+            config = dict(self.config, logfile=None)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config,)) as pool:
+                pending = {}
+                for file, tbl in jobs:
+                    while len(pending) >= 2 * workers:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            frames.put(pending.pop(future) + (_result(future, self.metrics),))
+                    pending[pool.submit(_extract_file, file, index, tbl)] = (file, tbl)
+                for future in as_completed(pending):
+                    frames.put(pending[future] + (_result(future, self.metrics),))
+        finally:
+            frames.put(None)
+            thread.join()
+        return len(loaded)
+
+    @classmethod
+    def process_url(self, url: str, index='dtm', concurrency=None, retries=3, backoff=1.0, files=None) -> tuple:
+        """Download, extract and load the bulletins listed at a URL, with asyncio.
+
+        Downloads share one pooled HTTP session, at most 'concurrency' of them are in flight, and failed
+        requests are retried with exponential backoff. Parsed frames are passed over a bounded queue to a
+        single writer, which loads whatever has arrived in one go, so that downloads overlap with parsing
+        and SQLite writes.
+
+        Args:
+            url (str): URL of directory listing, e.g. a filebrowser folder
+            index (str, optional): Name of dateTime axis. Defaults to 'dtm'.
+            concurrency (int, optional): Number of concurrent downloads. Defaults to None, in which case it is taken from the configuration (key 'concurrency'), or 8.
+            retries (int, optional): Number of retries per request. Defaults to 3.
+            backoff (float, optional): Seconds to wait before the first retry, doubled for every further retry. Defaults to 1.0.
+            files (list, optional): Names of files to fetch. Defaults to None, in which case they are taken from the listing at url.
+
+        Returns:
+            tuple: number of files listed, number of files loaded successfully
+        """
+        if concurrency is None:
+            concurrency = self.config.get('concurrency', 8)
+        return asyncio.run(self._process_url(url, index, concurrency, retries, backoff, files))
+
+    @classmethod
+    async def _process_url(self, url, index, concurrency, retries, backoff, files):
+        loop = asyncio.get_running_loop()
+        tbl = os.path.basename(url.rstrip('/'))
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.proxies = {"http": "", "https": ""}
+        session.verify = False
+        fetchers = ThreadPoolExecutor(max_workers=concurrency)
+        writer = ThreadPoolExecutor(max_workers=1)
+        try:
+            if files is None:
+                with self.metrics.span('list', tbl) as span:
+                    res = await loop.run_in_executor(fetchers, _get, session, url, retries, backoff)
+                    files = sorted(set(LISTING.findall(res.text)))
+                    span['rows'] = len(files)
+            msg = 'Downloading and extracting %s files from %s ...' % (len(files), url)
+            if self.verbose:
+                print(msg)
+            if self.logging:
+                self.logger.info(msg)
+
+            frames = asyncio.Queue(maxsize=2 * concurrency)
+            slots = asyncio.Semaphore(concurrency)
+
+            async def fetch(file):
+                async with slots:
+                    try:
+                        t0 = time.perf_counter()
+                        res = await loop.run_in_executor(fetchers, _get, session, "/".join([url.rstrip('/'), file]),
+                                                         retries, backoff)
+                        self.metrics.add('download', tbl, time.perf_counter() - t0, bytes=len(res.content))
+                        df = await loop.run_in_executor(fetchers, lambda: self.extract_file(file, index=index,
+                                                                                              stream=res.content, tbl=tbl))
+                    except Exception as err:
+                        print(err)
+                        if self.logging:
+                            self.logger.error(f"'.process_url' error: {file}: {err}")
+                        df = pd.DataFrame()
+                await frames.put((file, df))
+
+            async def load():
+                cnt = 0
+                done = False
+                while not done:
+                    batch = [await frames.get()]
+                    while not frames.empty():
+                        batch.append(frames.get_nowait())
+                    if None in batch:
+                        batch.remove(None)
+                        done = True
+                    batch = [(file, df) for file, df in batch if not df.empty]
+                    if batch:
+                        df = pd.concat([df for file, df in batch])
+                        res = await loop.run_in_executor(writer, lambda: self.load_file(tbl, df, index=index))
+                        if res is None:
+                            cnt += len(batch)
+                return cnt
+
+            loader = asyncio.create_task(load())
+            await asyncio.gather(*(fetch(file) for file in files))
+            await frames.put(None)
+            cnt = await loader
+
+            msg = '%s of %s files processed successfully.' % (cnt, len(files))
+            if self.verbose:
+                print(msg)
+            if self.logging:
+                self.logger.info(msg)
+            return len(files), cnt
+        finally:
+            fetchers.shutdown()
+            writer.shutdown()
+            session.close()
+
+    @classmethod
+    def walk(self, path: str):
+        """os.walk, timing the listing of each directory as a 'list' span of the table named after it.
+
+        The archive is not walked, if it lies below path.
+        """
+        dirs = os.walk(path)
+        archive = None if self.archive is None else os.path.abspath(self.archive)
+        while True:
+            t0 = time.perf_counter()
+            try:
+                root, subdirs, files = next(dirs)
+            except StopIteration:
+                return
+            subdirs[:] = [d for d in subdirs if os.path.abspath(os.path.join(root, d)) != archive]
+            self.metrics.add('list', os.path.basename(root), time.perf_counter() - t0, rows=len(files))
+            yield root, subdirs, files
+
+    @classmethod
+    def is_loaded(self, ledger, file: str, tbl: str) -> bool:
+        """Check a file against the ledger (if any), timed as part of the 'list' stage."""
+        if ledger is None:
+            return False
+        with self.metrics.span('list', tbl):
+            return ledger.is_loaded(file)
+
+    @classmethod
+    def process_directory(self, path=None, seconds=None, index='dtm', workers=None, concurrency=None) -> tuple:
         """Loop through entire directory (recursively), extract, load, archive files.
 
         Args:
             path (str, optional): Path of directory to process. This can also be a URL.
             seconds (bool, optional): Should seconds remain in timestamps of data loaded to DB?. Defaults to None, in which case it is taken from the configuration.
             index (str, optional): _description_. Defaults to 'dtm'.
+            workers (int, optional): Number of processes extracting files in parallel while a single writer loads them. Defaults to None, in which case it is taken from the configuration (key 'workers'), or files are processed one at a time.
+            concurrency (int, optional): If path is a URL, number of concurrent downloads (see process_url). Defaults to None, in which case it is taken from the configuration (key 'concurrency'), or files are downloaded one at a time.
+
+        If the configuration has a key 'bulk', all files are loaded in one bulk-load session (see df2sqlite.bulk),
+        committing once per batch of files; files are archived once their batch has been committed.
+        If the configuration has a key 'mirror', the Parquet mirror of every table loaded is synced at the end.
+        The timing spans of the run remain in self.metrics (see Metrics.summary): count, total, p50, p95, rows
+        and bytes per stage (list, open, parse, transform, load, dedup, archive), for the run and per table. If the
+        configuration has a key 'metricsfile', the summary is appended to this JSON-lines file (see Metrics.write).
 
         Returns:
-            _type_: _description_
+            tuple: number of files found, number of files processed successfully
         """
+        ledger = None
+        total, cnt = 0, 0
+        self.metrics = Metrics()
         try:
             if path is None:
                 path = self.incoming
             if seconds is None:
                 seconds = self.seconds
-            if 'http' in path:
-                res = requests.get(url=path, proxies={"http": "", "https": ""}, \
-                        verify=False)
-                files = re.findall(pattern=">(VMSW43.+.[zip|001])<", string=res.text)
+            if workers is None:
+                workers = self.config.get('workers', None)
+            if concurrency is None:
+                concurrency = self.config.get('concurrency', None)
+            if self.bulk:
+                options = self.bulk if isinstance(self.bulk, dict) else {}
+                self.bulkloader = BulkLoader(self.db, verbose=self.verbose, **options)
+                self.pending_rollups = {}
+            if self.ledger:
+                # in a bulk-load session, the ledger shares its connection
+                ledger = IngestLedger(self.db, con=None if self.bulkloader is None else self.bulkloader.con)
+            if 'http' in path and concurrency and concurrency > 1:
+                total, cnt = self.process_url(path, index=index, concurrency=concurrency)
+            elif 'http' in path:
+                tbl = os.path.basename(path)
+                with self.metrics.span('list', tbl) as span:
+                    res = requests.get(url=path, proxies={"http": "", "https": ""}, \
+                            verify=False)
+                    files = LISTING.findall(res.text)
+                    span['rows'] = len(files)
+                total = len(files)
                 msg = 'Downloading and extracting files from %s ...' % path
                 if self.verbose:
                     print(msg)
                 if self.logging:
                     self.logger.info(msg)
-                cnt = 0
                 for file in files:
-                    res = requests.get(url="/".join([path, file]), proxies={"http": "", "https": ""}, verify=False)
-                    df = self.extract_file(file, stream=res.content)
+                    with self.metrics.span('download', tbl) as span:
+                        res = requests.get(url="/".join([path, file]), proxies={"http": "", "https": ""}, verify=False)
+                        span['bytes'] = len(res.content)
+                    df = self.extract_file(file, stream=res.content, tbl=tbl)
                     if not df.empty:
                         # load dataframe to DB
-                        tbl = os.path.basename(path)
                         res = self.load_file(tbl, df, index=index)
                         if res is None:
                             cnt += 1
@@ -301,61 +732,359 @@ class ETLHandler:
                         print(msg)
                     if self.logging:
                         self.logger.info(msg)
+            elif workers and workers > 1:
+                jobs = []
+                bulletins = {}
+                skipped = 0
+                for root, dirs, files in self.walk(path):
+                    for file in files:
+                        file = os.path.join(root, file)
+                        if self.is_loaded(ledger, file, os.path.basename(root)):
+                            skipped += 1
+                            continue
+                        if BULLETIN.search(os.path.basename(file)):
+                            bulletins.setdefault(os.path.basename(root), []).append(file)
+                        else:
+                            jobs.append((file, os.path.basename(root)))
+                msg = 'Extracting %s files from %s with %s workers (%s already loaded) ...' % (len(jobs), path, workers, skipped)
+                if self.verbose:
+                    print(msg)
+                if self.logging:
+                    self.logger.info(msg)
+                cnt = sum(self.process_bulletins(files, tbl, index=index, ledger=ledger) for tbl, files in bulletins.items())
+                cnt += self.process_files_parallel(jobs, workers=workers, index=index, ledger=ledger)
+                total = len(jobs) + sum(len(files) for files in bulletins.values())
+                msg = '%s of %s files processed successfully.' % (cnt, total)
+                if self.verbose:
+                    print(msg)
+                if self.logging:
+                    self.logger.info(msg)
             else:
-                for root, dirs, files in os.walk(path):
-                    cnt = 0 
+                for root, dirs, files in self.walk(path):
+                    loaded = 0
                     msg = 'Extracting files from %s ...' % root
                     if self.verbose:
                         print(msg)
                     if self.logging:
                         self.logger.info(msg)
+                    tbl = os.path.basename(root)
+                    bulletins = []
                     for file in files:
                         file = os.path.join(root, file)
-                        df = self.extract_file(file)                
+                        if self.is_loaded(ledger, file, tbl):
+                            msg = '%s already loaded, skipped.' % file
+                            if self.verbose:
+                                print(msg)
+                            if self.logging:
+                                self.logger.info(msg)
+                            continue
+                        if BULLETIN.search(os.path.basename(file)):
+                            bulletins.append(file)
+                            continue
+                        df = self.extract_file(file, tbl=tbl)
                         if not df.empty:
                             # load dataframe to DB
-                            tbl = os.path.basename(root)
                             res = self.load_file(tbl, df, index=index)
                             
                             if res is None:
-                                # archive file
-                                if self.archive is not None:
-                                    if 'meteo' in file:
-                                        year = re.findall(r'\.(\d{4})', os.path.basename(file))[0]
-                                    else:
-                                        year = re.findall(r'-(\d{4})', os.path.basename(file))[0]
-                                    os.makedirs(os.path.join(self.archive, os.path.basename(root), year), exist_ok=True)            
-                                    dst = os.path.join(self.archive, os.path.basename(root), year, os.path.basename(file))
-                                    os.replace(src=file, dst=dst)                                  
-                                cnt += 1
+                                # record and archive file
+                                self.file_loaded(file, tbl, len(df), ledger=ledger)
+                                loaded += 1
+
+                    if bulletins:
+                        loaded += self.process_bulletins(bulletins, tbl, index=index, ledger=ledger)
                                 
-                    msg = '%s of %s files processed successfully.' % (cnt, len(files))
+                    msg = '%s of %s files processed successfully.' % (loaded, len(files))
                     if self.verbose:
                         print(msg)
                     if self.logging:
                         self.logger.info(msg)
-                    return len(files), cnt
+                    total += len(files)
+                    cnt += loaded
 
         except Exception as err:
             print(err)
             if self.logging:
                 self.logger.info(err)
+        finally:
+            if self.bulkloader is not None:
+                # commit the last batch, then record and archive its files
+                try:
+                    self.bulkloader.close()
+                except Exception as err:
+                    print(err)
+                    if self.logging:
+                        self.logger.error(f"'.process_directory' error committing bulk load: {err}")
+                self.bulkloader = None
+            if ledger is not None:
+                ledger.close()
+            if self.mirror and self.loaded_tables:
+                for tbl in sorted(self.loaded_tables):
+                    df2parquet.sync_table(self.db, tbl, self.mirror, index=index, years=self.loaded_tables[tbl],
+                                      verbose=self.verbose)
+                self.loaded_tables.clear()
+
+        if self.metricsfile:
+            try:
+                self.metrics.write(self.metricsfile, path=path, files=total, loaded=cnt)
+            except Exception as err:
+                print(err)
+                if self.logging:
+                    self.logger.error(f"'.process_directory' error writing metrics: {err}")
+        return total, cnt
+
+
+    @classmethod
+    def scan(self, path: str, dirs: dict) -> tuple:
+        """List the files of the directories below path that changed since the last scan.
+
+        Only directories whose mtime changed (files were added, removed or renamed) are listed, the others cost
+        one stat. The archive is not scanned.
+
+        Args:
+            path (str): directory to scan, recursively
+            dirs (dict): directory: (mtime, subdirectories) as of the last scan, updated in place
+
+        Returns:
+            tuple: files found (file: (size, mtime)) and directories listed
+        """
+        found = {}
+        listed = set()
+        archive = os.path.abspath(self.archive) if self.archive else None
+        stack = [path]
+        while stack:
+            folder = stack.pop()
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except FileNotFoundError:
+                dirs.pop(folder, None)
+                continue
+            known = dirs.get(folder)
+            if known is not None and known[0] == mtime:
+                stack.extend(known[1])
+                continue
+            with self.metrics.span('list', os.path.basename(folder)) as span:
+                subdirs = []
+                with os.scandir(folder) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            if os.path.abspath(entry.path) != archive:
+                                subdirs.append(entry.path)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            found[entry.path] = (st.st_size, st.st_mtime_ns)
+                            span['rows'] += 1
+            dirs[folder] = (mtime, subdirs)
+            listed.add(folder)
+            stack.extend(subdirs)
+        return found, listed
+
+    @classmethod
+    def process_batch(self, files: list, index='dtm', ledger=None) -> int:
+        """Extract and load a micro-batch of files of watch, then commit it and record and archive its files.
 
+        Args:
+            files (list): full paths to files, each in the directory named after its table
+            index (str, optional): Name of dateTime axis. Defaults to 'dtm'.
+            ledger (IngestLedger, optional): ledger to record loaded files in. Defaults to None.
+
+        Returns:
+            int: number of files loaded successfully
+        """
+        tables = {}
+        for file in files:
+            tables.setdefault(os.path.basename(os.path.dirname(file)), []).append(file)
+        cnt = 0
+        for tbl, files in tables.items():
+            bulletins = []
+            for file in files:
+                if self.is_loaded(ledger, file, tbl):
+                    continue
+                if BULLETIN.search(os.path.basename(file)):
+                    bulletins.append(file)
+                    continue
+                df = self.extract_file(file, tbl=tbl)
+                if not df.empty and self.load_file(tbl, df, index=index) is None:
+                    self.file_loaded(file, tbl, len(df), ledger=ledger)
+                    cnt += 1
+            if bulletins:
+                cnt += self.process_bulletins(bulletins, tbl, index=index, ledger=ledger)
+
+        # rows become queryable, then files are recorded and archived
+        self.bulkloader.commit()
+        if self.mirror and self.loaded_tables:
+            for tbl in sorted(self.loaded_tables):
+                df2parquet.sync_table(self.db, tbl, self.mirror, index=index, years=self.loaded_tables[tbl],
+                                      verbose=self.verbose)
+            self.loaded_tables.clear()
+        return cnt
 
     @classmethod
-    def append_sqlite3(self, df: pd.DataFrame, tbl: str, index_label=None):
+    def watch(self, path=None, interval=None, batch_files=None, poll=None, duration=None, stop=None,
+              index='dtm') -> dict:
+        """Watch a directory (recursively) for new files and load them in micro-batches as they arrive.
+
+        The directory is polled every 'poll' seconds with os.scandir, listing only directories whose mtime
+        changed (see scan), so the tree is not walked again on every poll. A new file is taken once its size and
+        mtime have not changed over one poll, i.e. it has been written completely. Files taken are coalesced into
+        a micro-batch, which is extracted, loaded and committed (see process_batch) 'interval' seconds after its
+        first file was taken, or as soon as it holds 'batch_files' files; files taken in excess, e.g. a backlog,
+        make further micro-batches. All batches are loaded in one bulk-load session, held open while watching;
+        files are recorded in the ledger and archived after their commit.
+
+        Args:
+            path (str, optional): Path of directory to watch. Defaults to None, i.e. incoming.
+            interval (float, optional): Seconds to coalesce files. Defaults to None, in which case it is taken from the configuration (key 'watch', a dict, key 'interval'), or 30.
+            batch_files (int, optional): Files of a full micro-batch. Defaults to None, i.e. key 'batch_files' of 'watch', or 100.
+            poll (float, optional): Seconds between polls. Defaults to None, i.e. key 'poll' of 'watch', or 1.
+            duration (float, optional): Stop watching after this many seconds. Defaults to None, i.e. until interrupted.
+            stop (threading.Event, optional): Stop watching once set. Defaults to None.
+            index (str, optional): Name of dateTime axis. Defaults to 'dtm'.
+
+        If the configuration has a key 'metricsfile', the summary of every micro-batch is appended to it.
+
+        Returns:
+            dict: path, batches, files (number of files taken), loaded (number of files processed successfully)
+        """
+        if path is None:
+            path = self.incoming
+        if interval is None:
+            interval = self.watch_options.get('interval', 30)
+        if batch_files is None:
+            batch_files = self.watch_options.get('batch_files', 100)
+        if poll is None:
+            poll = self.watch_options.get('poll', 1)
+        res = dict(path=path, batches=0, files=0, loaded=0)
+        ledger = None
+        # directory: (mtime, subdirectories), file: (size, mtime) when last seen resp. taken
+        dirs, pending, taken = {}, {}, {}
+        batch, first = [], None
+        self.metrics = Metrics()
+        options = self.bulk if isinstance(self.bulk, dict) else {}
+        self.bulkloader = BulkLoader(self.db, verbose=self.verbose, **options)
+        self.pending_rollups = {}
+        msg = 'Watching %s ...' % path
+        if self.verbose:
+            print(msg)
+        if self.logging:
+            self.logger.info(msg)
+        try:
+            if self.ledger:
+                ledger = IngestLedger(self.db, con=self.bulkloader.con)
+            t0 = time.monotonic()
+            try:
+                while not (stop is not None and stop.is_set()):
+                    if duration is not None and time.monotonic() - t0 >= duration:
+                        break
+                    # files unchanged since the last poll are complete
+                    for file, seen in list(pending.items()):
+                        try:
+                            st = os.stat(file)
+                        except FileNotFoundError:
+                            del pending[file]
+                            continue
+                        if seen == (st.st_size, st.st_mtime_ns):
+                            del pending[file]
+                            taken[file] = seen
+                            batch.append(file)
+                            if first is None:
+                                first = time.monotonic()
+                        else:
+                            pending[file] = (st.st_size, st.st_mtime_ns)
+                    found, listed = self.scan(path, dirs)
+                    for file in [file for file in taken if os.path.dirname(file) in listed and file not in found]:
+                        del taken[file]
+                    for file, st in found.items():
+                        if file not in pending and taken.get(file) != st:
+                            pending[file] = st
+
+                    if batch and (len(batch) >= batch_files or time.monotonic() - first >= interval):
+                        # files taken in one poll (e.g. a backlog at startup) are loaded batch_files at a time
+                        while batch:
+                            chunk, batch = batch[:batch_files], batch[batch_files:]
+                            res['loaded'] += self.flush_batch(chunk, path, index=index, ledger=ledger)
+                            res['batches'] += 1
+                            res['files'] += len(chunk)
+                        first = None
+                    if stop is not None:
+                        stop.wait(poll)
+                    else:
+                        time.sleep(poll)
+            except KeyboardInterrupt:
+                pass
+            while batch:
+                chunk, batch = batch[:batch_files], batch[batch_files:]
+                res['loaded'] += self.flush_batch(chunk, path, index=index, ledger=ledger)
+                res['batches'] += 1
+                res['files'] += len(chunk)
+
+        except Exception as err:
+            print(err)
+            if self.logging:
+                self.logger.error(f"'.watch' error: {err}")
+        finally:
+            try:
+                self.bulkloader.close()
+            except Exception as err:
+                print(err)
+                if self.logging:
+                    self.logger.error(f"'.watch' error committing bulk load: {err}")
+            self.bulkloader = None
+            if ledger is not None:
+                ledger.close()
+
+        msg = 'Stopped watching %s: %s of %s files loaded in %s batch(es).' % (path, res['loaded'], res['files'],
+                                                                           res['batches'])
+        if self.verbose:
+            print(msg)
+        if self.logging:
+            self.logger.info(msg)
+        return res
+
+    @classmethod
+    def flush_batch(self, batch: list, path: str, index='dtm', ledger=None) -> int:
+        """Process a micro-batch of watch, report it, and append its metrics to the metrics file (if any)."""
+        t0 = time.perf_counter()
+        cnt = self.process_batch(batch, index=index, ledger=ledger)
+        msg = '%s of %s files loaded in %.1f s.' % (cnt, len(batch), time.perf_counter() - t0)
+        if self.verbose:
+            print(msg)
+        if self.logging:
+            self.logger.info(msg)
+        if self.metricsfile:
+            try:
+                self.metrics.write(self.metricsfile, path=path, files=len(batch), loaded=cnt)
+            except Exception as err:
+                print(err)
+                if self.logging:
+                    self.logger.error(f"'.watch' error writing metrics: {err}")
+        self.metrics = Metrics()
+        return cnt
+
+    @classmethod
+    def append_sqlite3(self, df: pd.DataFrame, tbl: str, index_label=None, upsert=None):
         """Append a dataframe to an SQLite3 DB.
 
         Args:
             df (pd.DataFrame): Pandas dataframe holding data to load to DB
             tbl (str): name of DB table
             index_label (str, optional): Name of column holding dateTime stamps. Defaults to None, in which case this is taken from the config file.
+            upsert (bool, optional): Insert on a UNIQUE index of the natural key instead of removing duplicates afterwards. Defaults to None, in which case it is taken from the configuration.
         """
+        conn = None
         try:
             if index_label is None:
                 index_label = self.index
+            if upsert is None:
+                upsert = self.upsert
+
+            if upsert or self.managed or schema.is_epoch(self.db, tbl, index=index_label):
+                df2sqlite.upsert2sqlite(df, db=self.db, tbl=tbl, index=index_label, key=self.key,
+                                        precedence=self.precedence, verbose=self.verbose, managed=self.managed)
+                return
 
             conn = sqlite3.connect(self.db)
+            df = sources.encode(conn, df, tbl)
 
             df.to_sql(tbl, conn, if_exists='append', index=True, index_label=index_label)
             
@@ -370,9 +1099,7 @@ class ETLHandler:
             cursor = conn.cursor()
             cursor.execute("pragma table_info(%s)" % tbl)
             res = cursor.fetchall()
-            names = [tpl[1] for tpl in res]
-            if 'source' in names:
-                names.remove('source')
+            names = [tpl[1] for tpl in res if tpl[1] not in (sources.SOURCE, sources.SOURCE_ID)]
 
             # identify duplicates on all fields
             qry = "select count(*) from %s " % tbl
@@ -398,7 +1125,8 @@ class ETLHandler:
             conn.close()
             
         except Exception as err:
-            conn.close()
+            if conn is not None:
+                conn.close()
             print(err)
             if self.logging:
                 self.logger.error(f"'.append' error: {err}")
@@ -499,6 +1227,49 @@ class ETLHandler:
             print(err)
 
 
+# %%
+def _get(session: requests.Session, url: str, retries=3, backoff=1.0) -> requests.Response:
+    """GET a URL, retrying on connection errors, 429 and 5xx responses with exponential backoff."""
+    for attempt in range(retries + 1):
+        try:
+            res = session.get(url=url, timeout=60)
+            if res.status_code == 200:
+                return res
+            if res.status_code != 429 and res.status_code < 500:
+                res.raise_for_status()
+            err = requests.HTTPError(f"{res.status_code} for {url}", response=res)
+        except requests.ConnectionError as e:
+            err = e
+        except requests.Timeout as e:
+            err = e
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+    raise err
+
+
+def _init_worker(config: dict) -> None:
+    """Initialize ETLHandler in a worker process of process_files_parallel."""
+    ETLHandler(config)
+
+
+def _extract_file(file: str, index=None, tbl=None) -> tuple:
+    """Extract a file in a worker process of process_files_parallel, return the frame and the timing stats."""
+    ETLHandler.metrics = Metrics()
+    return ETLHandler.extract_file(file, index=index, tbl=tbl), ETLHandler.metrics.stats
+
+
+def _result(future, metrics=None) -> pd.DataFrame:
+    """Return the frame of a finished extract, or an empty frame if the worker failed. Merge the worker's timing stats into metrics."""
+    try:
+        df, stats = future.result()
+        if metrics is not None:
+            metrics.merge(stats)
+        return df
+    except Exception as err:
+        print(err)
+        return pd.DataFrame()
+
+
 if __name__ == "__main__":
     pass        
 
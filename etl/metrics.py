@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Timing spans for the stages of an ETL run: list, open, parse, transform, load, dedup, rollup, archive.
+
+Remote runs add a 'download' stage. Spans are aggregated per (table, stage) into count, total time, rows and bytes
+(rows of 'list' are files listed, of 'dedup' duplicate groups found), keeping the individual durations for p50/p95.
+Workers of a process pool record into their own Metrics and send the stats back for merging.
+"""
+# %%
+import json
+import time
+import datetime
+import threading
+import contextlib
+from array import array
+import numpy as np
+
+STAGES = ('list', 'open', 'parse', 'transform', 'load', 'dedup', 'rollup', 'archive')
+
+
+# %%
+class Metrics:
+    """Per-run aggregate of timing spans, safe to record into from several threads."""
+
+    def __init__(self):
+        self.started = datetime.datetime.now()
+        self.t0 = time.perf_counter()
+        # (tbl, stage): [count, total seconds, rows, bytes, durations]
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, stage: str, tbl=None, rows=0, bytes=0):
+        """Time the enclosed block as one span of a stage.
+
+        Yields a dict, whose 'tbl', 'rows' and 'bytes' can be set inside the block once they are known:
+
+            with metrics.span('parse', tbl) as span:
+                df = pd.read_csv(...)
+                span['rows'] = len(df)
+
+        Spans of blocks that raise are not recorded.
+        """
+        span = dict(tbl=tbl, rows=rows, bytes=bytes)
+        t0 = time.perf_counter()
+        yield span
+        self.add(stage, span['tbl'], time.perf_counter() - t0, span['rows'], span['bytes'])
+
+    def add(self, stage: str, tbl, seconds: float, rows=0, bytes=0) -> None:
+        with self.lock:
+            stat = self.stats.get((tbl, stage))
+            if stat is None:
+                stat = self.stats[(tbl, stage)] = [0, 0.0, 0, 0, array('d')]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] += int(rows or 0)
+            stat[3] += int(bytes or 0)
+            stat[4].append(seconds)
+
+    def merge(self, stats: dict) -> None:
+        """Add the stats of another Metrics, e.g. of a worker process."""
+        with self.lock:
+            for key, (count, total, rows, nbytes, durations) in stats.items():
+                stat = self.stats.get(key)
+                if stat is None:
+                    stat = self.stats[key] = [0, 0.0, 0, 0, array('d')]
+                stat[0] += count
+                stat[1] += total
+                stat[2] += rows
+                stat[3] += nbytes
+                stat[4].extend(durations)
+
+    def summary(self) -> dict:
+        """Aggregate the spans per run and per table.
+
+        Returns:
+            dict: started, seconds (wall time of the run), stages (stage: count, total, p50, p95, rows, bytes) and
+            tables (table: stages), stages in the order of STAGES
+        """
+        with self.lock:
+            stats = {key: (stat[0], stat[1], stat[2], stat[3], np.asarray(stat[4])) for key, stat in self.stats.items()}
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        keys = sorted(stats, key=lambda key: (order.get(key[1], len(order)), key[1]))
+
+        def aggregate(items):
+            durations = np.concatenate([item[4] for item in items])
+            return dict(count=sum(item[0] for item in items), total=sum(item[1] for item in items),
+                        p50=float(np.percentile(durations, 50)), p95=float(np.percentile(durations, 95)),
+                        rows=sum(item[2] for item in items), bytes=sum(item[3] for item in items))
+
+        stages = {}
+        for tbl, stage in keys:
+            stages.setdefault(stage, []).append(stats[(tbl, stage)])
+        tables = {}
+        for tbl, stage in keys:
+            tables.setdefault(tbl, {})[stage] = aggregate([stats[(tbl, stage)]])
+        return dict(started=self.started.strftime("%Y-%m-%d %H:%M:%S"), seconds=time.perf_counter() - self.t0,
+                    stages={stage: aggregate(items) for stage, items in stages.items()},
+                    tables={tbl: tables[tbl] for tbl in sorted(tables, key=str)})
+
+    def write(self, file: str, summary=None, **extra) -> None:
+        """Append one JSON line per table and stage, and one per stage for the run (table null), to a metrics file.
+
+        Args:
+            file (str): path to JSON-lines file
+            summary (dict, optional): as returned by summary(). Defaults to None, in which case it is computed.
+            extra: further fields written on every line, e.g. path=...
+        """
+        if summary is None:
+            summary = self.summary()
+        run = dict(started=summary['started'], seconds=round(summary['seconds'], 6), **extra)
+        with open(file, 'a') as fh:
+            for stage, stat in summary['stages'].items():
+                fh.write(json.dumps(dict(run, tbl=None, stage=stage, **stat)) + "\n")
+            for tbl, stages in summary['tables'].items():
+                for stage, stat in stages.items():
+                    fh.write(json.dumps(dict(run, tbl=tbl, stage=stage, **stat)) + "\n")
+
+
+# %%
+if __name__ == '__main__':
+    pass
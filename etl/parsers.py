@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""Registry of the parsers ETLHandler.extract_file dispatches files to, by file name.
+
+A parser is registered under a name with
+    pattern: regular expression the whole basename of a file must match, e.g. r'tei49i.*\\.zip'
+    read: function(buffer, **options) -> pd.DataFrame, buffer a binary file object holding the data file (the
+        member, if the file is a zip archive)
+    transform: function(df, index, seconds) -> pd.DataFrame indexed by dtm. Defaults to None, i.e. read indexes
+    options: keyword arguments of read, built once
+    schema: entry of df2sqlite.schema.SCHEMAS declaring the types of the columns read
+    tbl: table loaded into if the folder of a file does not name one
+
+The patterns are compiled into a single alternation, tried in the order of registration, so a file is
+dispatched with one match of its basename, whatever its folder is called, and files no parser claims are
+rejected before they are opened. Formats of new instruments plug in with register():
+
+    parsers.register('ae33', r'AE33_.*\\.dat', read=read_ae33, transform=..., schema='ae33', tbl='ae33')
+"""
+# %%
+import re
+import pandas as pd
+from extract2df import timestamps
+from extract2df import picarro2df
+
+# name: dict(name, pattern, read, transform, options, schema, tbl)
+PARSERS = {}
+_dispatch = None
+
+
+# %%
+def register(name: str, pattern: str, read, transform=None, options=None, schema=None, tbl=None) -> dict:
+    """Register a parser, or replace the parser of that name keeping its rank (see module docstring).
+
+    Returns:
+        dict: the parser
+    """
+    global _dispatch
+    if not name.isidentifier():
+        raise ValueError(f"'{name}' is not a valid parser name.")
+    PARSERS[name] = dict(name=name, pattern=re.compile(pattern), read=read, transform=transform,
+                         options=dict(options or {}), schema=schema, tbl=tbl)
+    _dispatch = None
+    return PARSERS[name]
+
+
+def match(basename: str):
+    """The parser of a file, by its basename, or None if no parser claims it."""
+    global _dispatch
+    if _dispatch is None:
+        _dispatch = re.compile("|".join(f"(?P<{name}>{parser['pattern'].pattern})"
+                                        for name, parser in PARSERS.items()))
+    m = _dispatch.fullmatch(basename)
+    return None if m is None else PARSERS[m.lastgroup]
+
+
+# %%
+def read_tei49(buffer, drop=(), **options) -> pd.DataFrame:
+    """Read a TEI 49 data file with the C engine, without the columns at the positions or with the names in drop."""
+    header = buffer.readline().decode('latin1').split()
+    buffer.seek(0)
+    usecols = [i for i, name in enumerate(header) if i not in drop and name not in drop]
+    return pd.read_csv(buffer, usecols=usecols, **options)
+
+
+def transform_tei49(df: pd.DataFrame, index='dtm', seconds=True) -> pd.DataFrame:
+    """Index a TEI 49 dataframe by the PC's timestamps, rounded to minutes unless seconds."""
+    df[index] = timestamps.from_date_time(df['pcdate'], df['pctime'])
+    if not seconds:
+        df[index] = timestamps.round_to(df[index], '1min')
+    return df.set_index(index)
+
+
+def transform_bulletin(df: pd.DataFrame, index='dtm', seconds=True) -> pd.DataFrame:
+    """Index a bulletin dataframe by its zzzztttt timestamps."""
+    df[index] = timestamps.from_compact(df['zzzztttt'])
+    return df.set_index(index)
+
+
+def transform_picarro(df: pd.DataFrame, index='dtm', seconds=True) -> pd.DataFrame:
+    """Name the index of a Picarro dataframe; its timestamps keep their fractions of seconds."""
+    return df.rename_axis(index)
+
+
+# %% in order of precedence
+register('picarro', r'.*(?:CFKADS2320|DataLog_User).*\.(?:dat|zip)', read=picarro2df.read_picarro,
+         transform=transform_picarro, schema='picarro', tbl='g2401')
+# the 5th column (flags) and hio3 are not loaded
+register('tei49i', r'tei49i.*\.zip', read=read_tei49, transform=transform_tei49,
+         options=dict(drop=(4, 'hio3'), sep=r'\s+'), schema='tei49i', tbl='tei49i')
+register('tei49c', r'tei49c.*\.zip', read=read_tei49, transform=transform_tei49,
+         options=dict(drop=('o3lt', ), sep=r'\s+'), schema='tei49c', tbl='tei49c')
+register('bulletin', r'(?:VMSW43|VRXA00).*', read=pd.read_csv, transform=transform_bulletin,
+         options=dict(skiprows=1, header=1, sep=' ', na_values='/'), schema='bulletin', tbl='meteo')
+
+
+# %%
+if __name__ == '__main__':
+    pass
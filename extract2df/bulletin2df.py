@@ -4,11 +4,13 @@
 # import os
 import pandas as pd
 import logging
-# from io import BytesIO
+from io import BytesIO
 import re
+import contextlib
 # import requests
 import zipfile
 # from jklutils import utils
+from extract2df import timestamps
 
 
 # %%
@@ -30,19 +32,19 @@ def extract_bulletin_file(file: str, pattern: str, log=True) -> pd.DataFrame:
             logging.info(msg)
  
         df = pd.DataFrame()
+        source = file
         if bool(re.search(f'{pattern}', file)):
             if bool(re.search('.zip', file)):
                 zf = zipfile.ZipFile(file)
                 file = zf.open(zf.namelist()[0])
         df = pd.read_csv(file, skiprows=1, header=1, sep=' ', na_values='/')
-        df["dtm"] = pd.to_datetime(df['zzzztttt'], format='%Y%m%d%H%M')
-        df['source'] = file
+        df["dtm"] = timestamps.from_compact(df['zzzztttt'])
+        df['source'] = source
         df.set_index("dtm", inplace=True)
 
+        # floats stay float64: float32 values do not round-trip through SQLite REAL
         if not df.empty:
             for column in df:
-                if df[column].dtype == 'float64':
-                    df[column] = pd.to_numeric(df[column], downcast='float')
                 if df[column].dtype == 'int64':
                     df[column] = pd.to_numeric(df[column], downcast='integer')
         return df
@@ -51,6 +53,144 @@ def extract_bulletin_file(file: str, pattern: str, log=True) -> pd.DataFrame:
         logging.error(err)
         return pd.DataFrame()
 
+def read_bulletin_payloads(file: str):
+    """
+    Yield the raw content of a bulletin file, or of every member of a zip archive of bulletins.
+
+    Args:
+        file (str): full path to file.
+
+    Yields:
+        tuple: (name, bytes), name being the path, or path/member for archives with several members.
+    """
+    if bool(re.search('.zip', file)):
+        with zipfile.ZipFile(file) as zf:
+            members = zf.namelist()
+            for member in members:
+                yield (file if len(members) == 1 else f"{file}/{member}"), zf.read(member)
+    else:
+        with open(file, 'rb') as fh:
+            yield file, fh.read()
+
+
+def _nospan(*args, **kwargs):
+    return contextlib.nullcontext({})
+
+
+def _read_layout(header: bytes, chunks: list, index="dtm") -> pd.DataFrame:
+    """Parse the data lines of bulletins sharing a header, each line prefixed with its source id, and build timestamps."""
+    rows = [line for _, lines in chunks for line in lines]
+    df = pd.read_csv(BytesIO(b"\n".join([b"source_id " + header] + rows)), sep=' ', na_values='/')
+    df[index] = timestamps.from_compact(df['zzzztttt'])
+    if df[index].isna().any():
+        raise ValueError(f"{df[index].isna().sum()} invalid zzzztttt timestamp(s).")
+    return df
+
+
+def extract_bulletin_files(files: list, index="dtm", log=True, metrics=None, tbl=None) -> pd.DataFrame:
+    """
+    Extract many bulletins (VMSW43, VRXA00) into one Pandas dataframe with a single read_csv per column layout.
+
+    The data lines of all bulletins sharing a header are concatenated, each prefixed with the position of its
+    bulletin, and parsed in one go. Bulletins without data, or with data lines that do not have as many fields as
+    their header, are rejected before parsing; if a layout fails to parse nonetheless, its bulletins are parsed one
+    by one, so that only the offending ones are rejected. Floats are kept as float64, integers are downcast.
+
+    Args:
+        files (list): full paths to bulletin files or zip archives of bulletins.
+        index (str, optional): name of dateTime axis. Defaults to "dtm".
+        metrics (etl.metrics.Metrics, optional): records the open, parse and transform stages of the batch. Defaults to None.
+        tbl (str, optional): table the spans are attributed to. Defaults to None.
+
+    Returns:
+        pd.DataFrame: rows of all bulletins. The per-row source id is df['source'].cat.codes, pointing into
+        df['source'].cat.categories, which lists the bulletins extracted, in the order they were read.
+        df.attrs['rejected'] lists the bulletins rejected.
+    """
+    try:
+        span = metrics.span if metrics is not None else _nospan
+        sources = []
+        seen = set()
+        rejected = []
+        layouts = {}
+        with span('open', tbl) as opened:
+            nbytes = 0
+            for file in files:
+                try:
+                    for name, payload in read_bulletin_payloads(file):
+                        if name in seen:
+                            continue
+                        nbytes += len(payload)
+                        # line 0: sequence number, line 1: bulletin header, then column header and data
+                        lines = [line.rstrip() for line in payload.splitlines()[2:] if line.strip()]
+                        seen.add(name)
+                        if len(lines) < 2:
+                            rejected.append(name)
+                            logging.error(f"{name}: rejected, no column header and data line.")
+                            continue
+                        header = lines[0]
+                        width = header.count(b' ')
+                        bad = sum(line.count(b' ') != width for line in lines[1:])
+                        if bad:
+                            rejected.append(name)
+                            logging.error(f"{name}: rejected, {bad} data line(s) do not have {width + 1} fields "
+                                          f"like the header.")
+                            continue
+                        prefix = b"%d " % len(sources)
+                        sources.append(name)
+                        layouts.setdefault(header, []).append((len(sources) - 1,
+                                                               [prefix + line for line in lines[1:]]))
+                except Exception as err:
+                    rejected.append(file)
+                    logging.error(f"{file}: {err}")
+            opened['bytes'] = nbytes
+
+        if not layouts:
+            df = pd.DataFrame()
+            df.attrs['rejected'] = rejected
+            return df
+
+        with span('parse', tbl) as parsed:
+            frames = []
+            for header, chunks in layouts.items():
+                try:
+                    frames.append(_read_layout(header, chunks, index=index))
+                except Exception as err:
+                    logging.warning(f"Batch of {len(chunks)} bulletin(s) failed ({err}), parsing them one by one.")
+                    for chunk in chunks:
+                        try:
+                            frames.append(_read_layout(header, [chunk], index=index))
+                        except Exception as err:
+                            rejected.append(sources[chunk[0]])
+                            logging.error(f"{sources[chunk[0]]}: rejected, {err}")
+            if not frames:
+                df = pd.DataFrame()
+                df.attrs['rejected'] = rejected
+                return df
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+            parsed['rows'] = len(df)
+
+        with span('transform', tbl, rows=len(df)):
+            df['source'] = pd.Categorical.from_codes(df.pop('source_id'), categories=sources)
+            df['source'] = df['source'].cat.remove_unused_categories()
+            df.set_index(index, inplace=True)
+
+            # floats stay float64: float32 values do not round-trip through SQLite REAL
+            for column in df:
+                if df[column].dtype == 'int64':
+                    df[column] = pd.to_numeric(df[column], downcast='integer')
+
+        df.attrs['rejected'] = rejected
+        if log:
+            logging.info(f"Extracted {df['source'].nunique()} bulletin(s), {len(df)} row(s), "
+                         f"rejected {len(rejected)}.")
+        return df
+
+    except Exception as err:
+        logging.error(err)
+        return pd.DataFrame()
+
+
 # def extract_bulletin_file(file: str, pattern: str, replace=None, target=None, verbose=True) -> pd.DataFrame:
 #     """
 #     Open a file, determine its type from the file name, then extract content into a Pandas dataframe.
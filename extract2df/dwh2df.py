@@ -5,12 +5,17 @@ import os
 import datetime
 from io import StringIO
 import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 import requests
 import pandas as pd
 
 # from extract2df import utils
 from jklutils import downcast
+from df2sqlite import df2sqlite
+from df2sqlite import schema
+from df2sqlite import rollup as rollups
 
 # %%
 def get_config(station: str):
@@ -70,6 +75,7 @@ def jretrieve_data(station, cfg=None, par_short_names=None, category=None, durat
 
         urls = []
         df = pd.DataFrame()
+        ok = True
 
         if cfg is None:
             if par_short_names is None:
@@ -97,12 +103,13 @@ def jretrieve_data(station, cfg=None, par_short_names=None, category=None, durat
                 if duration:
                     since = (datetime.datetime.now() - datetime.timedelta(days=duration)).strftime("%Y%m%d%H%M%S")
                 else:
-                    since = cfg[station]['since']
+                    since = cfg['since']
             if till is None:
                 till = time.strftime("%Y%m%d%H%M%S")
             base_url += "&date=%s-%s" % (since, till)
 
             params = cfg['par_short_names']
+            series = list(params.keys())
 
             # series = []
             # labels = []
@@ -136,6 +143,7 @@ def jretrieve_data(station, cfg=None, par_short_names=None, category=None, durat
                     #     df = df[df.columns[~df.isnull().all()]]
             else:
                 print(f"Request unsuccessful, returned {res.status_code}.")
+                ok = False
 
         if not df.empty:
             df.index.rename('dtm', inplace=True)
@@ -147,7 +155,172 @@ def jretrieve_data(station, cfg=None, par_short_names=None, category=None, durat
             # make sure df is sorted by date
             df.sort_index(inplace=True)
 
-        return {'data': df, 'labels': labels}
+        return {'data': df, 'labels': labels, 'ok': ok}
+
+    except Exception as err:
+        print(err)
+
+
+# %%
+# tbl: end of the period retrieved without gaps, as %Y%m%d%H%M%S
+SYNC = "_dwh_sync"
+
+
+def high_water_mark(db: str, tbl: str):
+    """Return the end of the period of a table retrieved without gaps (see jretrieve2sqlite), or None."""
+    con = sqlite3.connect(db)
+    try:
+        res = con.execute(f"SELECT mark FROM {SYNC} WHERE tbl = ?", (tbl,)).fetchone()
+    except sqlite3.OperationalError:
+        res = None
+    finally:
+        con.close()
+    return None if res is None else res[0]
+
+
+def set_high_water_mark(db: str, tbl: str, mark: str) -> None:
+    """Store the end of the period of a table retrieved without gaps, as %Y%m%d%H%M%S."""
+    con = sqlite3.connect(db)
+    try:
+        con.execute(f"CREATE TABLE IF NOT EXISTS {SYNC} (tbl TEXT PRIMARY KEY, mark TEXT, updated_at TEXT)")
+        con.execute(f"INSERT OR REPLACE INTO {SYNC} (tbl, mark, updated_at) VALUES (?, ?, ?)",
+                    (tbl, mark, time.strftime("%Y-%m-%d %H:%M:%S")))
+        con.commit()
+    finally:
+        con.close()
+
+
+def latest_dtm(db: str, tbl: str):
+    """Return the most recent timestamp stored in a DB table, or None if the table is empty or does not exist."""
+    con = sqlite3.connect(db)
+    try:
+        res = con.execute(f"SELECT max(dtm) FROM {tbl}").fetchone()[0]
+        epoch = schema.is_epoch(con, tbl)
+    except sqlite3.OperationalError:
+        res = None
+    finally:
+        con.close()
+    return None if res is None else schema.to_datetime(res, epoch)
+
+
+def monthly_windows(since: str, till: str) -> list:
+    """Split a period into windows at calendar month boundaries.
+
+    Args:
+        since (str): begin of period as %Y%m%d%H%M%S
+        till (str): end of period as %Y%m%d%H%M%S
+
+    Returns:
+        list: tuples of (since, till) as %Y%m%d%H%M%S, the last second of a window preceding the next window
+    """
+    begin = pd.Timestamp(datetime.datetime.strptime(since, "%Y%m%d%H%M%S"))
+    end = pd.Timestamp(datetime.datetime.strptime(till, "%Y%m%d%H%M%S"))
+    bounds = [begin] + [t for t in pd.date_range(begin.normalize(), end, freq='MS') if t > begin] + [end + pd.Timedelta(seconds=1)]
+    fmt = "%Y%m%d%H%M%S"
+    return [(a.strftime(fmt), (b - pd.Timedelta(seconds=1)).strftime(fmt)) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def jretrieve2sqlite(station: str, cfg: dict, db: str, tbl=None, since=None, till=None, incremental=True, workers=4,
+                     rollup=False) -> dict:
+    """Retrieve DWH data in monthly windows and stream them into an SQLite3 DB.
+
+    In incremental mode, only data after the high-water mark of the target table are requested (or, for tables
+    retrieved before the mark was kept, after max(dtm)). Windows are fetched concurrently by at most 'workers'
+    threads and each window is loaded as soon as it arrives, so that no more than about 2 * workers windows are
+    held in memory at any time.
+
+    A window whose request fails (or returns other than 200) is reported, and the high-water mark only advances
+    to the end of the run of successful windows preceding it, so that the next incremental run requests the
+    failed window again, whatever later windows have loaded. If all windows succeed, the mark is the most recent
+    timestamp loaded, as max(dtm) was.
+
+    Args:
+        station (str): DWH station id, e.g. 'KEMKN'
+        cfg (dict): configuration as returned by get_config
+        db (str): path to SQLite3 DB
+        tbl (str, optional): name of DB table. Defaults to None, in which case 'dwh_<station>' is used.
+        since (str, optional): begin of period as %Y%m%d%H%M%S. Defaults to None, in which case it is cfg['since'].
+        till (str, optional): end of period as %Y%m%d%H%M%S. Defaults to None, i.e., now.
+        incremental (bool, optional): Start after the most recent timestamp in the table. Defaults to True.
+        workers (int, optional): number of concurrent requests. Defaults to 4.
+        rollup (bool, optional): update the hourly and daily rollups of the table after each window. Defaults to False.
+
+    Returns:
+        dict: number of windows requested, records loaded, failed windows as (since, till), and high-water mark
+    """
+    try:
+        if tbl is None:
+            tbl = f"dwh_{station}"
+        if since is None:
+            since = cfg['since']
+        if till is None:
+            till = time.strftime("%Y%m%d%H%M%S")
+        fmt = "%Y%m%d%H%M%S"
+        if incremental:
+            mark = high_water_mark(db, tbl)
+            if mark is None:
+                latest = latest_dtm(db, tbl)
+                mark = None if latest is None else latest.strftime(fmt)
+            if mark is not None:
+                since = max(since, (pd.Timestamp(datetime.datetime.strptime(mark, fmt))
+                                    + pd.Timedelta(seconds=1)).strftime(fmt))
+        if since > till:
+            print(f"{tbl} is up to date.")
+            return {'windows': 0, 'records': 0, 'failed': [], 'mark': None}
+
+        windows = monthly_windows(since, till)
+        par_short_names = ",".join(cfg['par_short_names'].keys())
+        records = 0
+        # window: True if retrieved and loaded
+        succeeded = {}
+
+        def load(future):
+            window = futures.pop(future)
+            try:
+                res = future.result()
+                succeeded[window] = bool(res) and res.get('ok', True)
+                if succeeded[window] and not res['data'].empty:
+                    df = res['data']
+                    res = df2sqlite.upsert2sqlite(df, db=db, tbl=tbl)
+                    if rollup:
+                        rollups.update_rollups(db, tbl, df.index)
+                    return res['records_changed']
+            except Exception as err:
+                print(f"{tbl} {window[0]}-{window[1]}: {err}")
+                succeeded[window] = False
+            return 0
+
+        futures = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for a, b in windows:
+                while len(futures) >= 2 * workers:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    records += sum(load(future) for future in done)
+                futures[pool.submit(jretrieve_data, station=station, cfg=cfg, par_short_names=par_short_names,
+                                    category=cfg['category'], since=a, till=b)] = (a, b)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                records += sum(load(future) for future in done)
+
+        failed = [window for window in windows if not succeeded[window]]
+        mark = None
+        if incremental:
+            # end of the run of successful windows, at most the most recent timestamp loaded
+            mark = (pd.Timestamp(datetime.datetime.strptime(since, fmt)) - pd.Timedelta(seconds=1)).strftime(fmt)
+            for window in windows:
+                if not succeeded[window]:
+                    break
+                mark = window[1]
+            else:
+                latest = latest_dtm(db, tbl)
+                if latest is not None and since <= latest.strftime(fmt) < mark:
+                    mark = latest.strftime(fmt)
+            set_high_water_mark(db, tbl, mark)
+        if failed:
+            print(f"{tbl}: {len(failed)} of {len(windows)} window(s) failed, retrieved without gaps until {mark}: "
+                  + ", ".join(f"{a}-{b}" for a, b in failed))
+
+        return {'windows': len(windows), 'records': records, 'failed': failed, 'mark': mark}
 
     except Exception as err:
         print(err)
@@ -4,9 +4,17 @@
 import os
 from datetime import datetime
 import itertools
-import nappy
+import numpy as np
 import pandas as pd
 from jklutils import utils
+from extract2df import timestamps
+from df2sqlite.bulk import BulkLoader
+from df2sqlite.ledger import IngestLedger
+
+# %%
+class UnsupportedFormatError(NotImplementedError):
+    """A NASA Ames file the native reader does not read (FFI other than 1001), to be read with nappy instead."""
+
 
 # %%
 # extract name, unit, statistic from long_names
@@ -26,30 +34,104 @@ def list2df(illformed_list, sep=',', expected_number_of_items=10):
 
 
 # %%
+def read_nasa_ames_header(fh) -> dict:
+    """Parse the header of a NASA Ames 1001 file, naming its items as nappy does.
+
+    Args:
+        fh: text file object at the start of the file, left at the first data line
+
+    Returns:
+        dict: NLHEAD, FFI, ONAME, ORG, SNAME, MNAME, IVOL, NVOL, DATE, RDATE, DX, XNAME, NV, VSCAL, VMISS, VNAME,
+        NSCOML, SCOM, NNCOML, NCOM
+    """
+    nlhead, ffi = (int(x) for x in fh.readline().split()[:2])
+    if ffi != 1001:
+        raise UnsupportedFormatError(f"FFI {ffi} is not supported by the native reader.")
+    lines = [fh.readline().rstrip('\r\n') for _ in range(nlhead - 1)]
+    header = dict(NLHEAD=nlhead, FFI=ffi, ONAME=lines[0], ORG=lines[1], SNAME=lines[2], MNAME=lines[3])
+    header['IVOL'], header['NVOL'] = (int(x) for x in lines[4].split()[:2])
+    dates = [int(x) for x in lines[5].split()]
+    header['DATE'], header['RDATE'] = dates[:3], dates[3:6]
+    header['DX'] = [float(lines[6].split()[0])]
+    header['XNAME'] = [lines[7]]
+    nv = header['NV'] = int(lines[8].split()[0])
+    # VSCAL and VMISS may wrap over several lines
+    i, values = 9, []
+    while len(values) < 2 * nv:
+        values += [float(x) for x in lines[i].split()]
+        i += 1
+    header['VSCAL'], header['VMISS'] = values[:nv], values[nv:2 * nv]
+    header['VNAME'] = lines[i:i + nv]
+    i += nv
+    nscoml = header['NSCOML'] = int(lines[i].split()[0])
+    header['SCOM'] = lines[i + 1:i + 1 + nscoml]
+    i += 1 + nscoml
+    nncoml = header['NNCOML'] = int(lines[i].split()[0])
+    header['NCOM'] = lines[i + 1:i + 1 + nncoml]
+    return header
+
+
+def read_nasa_ames_file(file: str) -> tuple:
+    """Read a NASA Ames 1001 file into one float array, missing values (VMISS) as NaN.
+
+    Args:
+        file (str): path to file
+
+    Returns:
+        tuple: header (see read_nasa_ames_header), and array of shape (records, 1 + NV), the independent variable
+        in the first column
+    """
+    with open(file, 'r', encoding='utf-8', errors='replace') as fh:
+        header = read_nasa_ames_header(fh)
+        body = fh.read()
+    width = 1 + header['NV']
+    data = np.fromstring(body, dtype='float64', sep=' ')
+    if data.size % width:
+        raise ValueError(f"{file}: {data.size} values do not make up records of {width}.")
+    data = data.reshape(-1, width)
+    values = data[:, 1:]
+    values[values == np.asarray(header['VMISS'])] = np.nan
+    return header, data
+
+
+def _read_nappy(file: str) -> tuple:
+    """Read a NASA Ames file of any FFI with nappy, as header and data of read_nasa_ames_file."""
+    import nappy
+
+    fh = nappy.openNAFile(file)
+    fh.readData()
+    header = fh.getNADict()
+    data = np.column_stack([np.asarray(fh.X, dtype='float64')] + [np.asarray(v, dtype='float64') for v in fh.V])
+    values = data[:, 1:]
+    values[values == np.asarray(fh.VMISS, dtype='float64')] = np.nan
+    return header, data
+
+
 def extract_nasa_ames_file(file:str) -> pd.DataFrame:
+    """Extract an EBAS NASA Ames file.
+
+    Files of FFI 1001 are read natively, others with nappy. Files the native reader fails to parse are not
+    passed on to nappy: the error is reported and nothing is extracted.
+
+    Args:
+        file (str): path to file
+
+    Returns:
+        dict: mappings (short_name, long_name, unit, ... of each column) and df
+    """
     try:
-        # open file and read data
-        fh = nappy.openNAFile(file)
-        fh.readData()
-
-        # assign data, substitute missing values for None, convert to Pandas Dataframe
-        X = fh.X
-        V = fh.V
-        na_values = fh.VMISS
-        for row in range(len(na_values)):
-            V[row] = [None if x == na_values[row] else x for x in V[row]]
-
-        X = pd.DataFrame(X)
-        X.columns = fh.XNAME
-        V = pd.DataFrame(V).T
-        V.columns = fh.VNAME
-
-        df = X.merge(V, left_index=True, right_index=True)
+        try:
+            header, data = read_nasa_ames_file(file)
+        except UnsupportedFormatError:
+            header, data = _read_nappy(file)
+
+        # one frame from the block, named by the long names of the file
+        df = pd.DataFrame(data, columns=header['XNAME'][:1] + header['VNAME'])
         long_names = list2df(list(df.columns))
         long_names.rename(columns={0: 'long_name', 1: "unit"}, inplace=True)
 
         # assign short but unique column names
-        df.columns = fh.getNADict()['NCOM'][-1].split()
+        df.columns = header['NCOM'][-1].split()
         inc = itertools.count().__next__
         dups = df.columns[df.columns.duplicated()]
         df.rename(columns=lambda x: f"{x}_{inc()}" if x in dups else x, inplace=True)
@@ -58,8 +140,8 @@ def extract_nasa_ames_file(file:str) -> pd.DataFrame:
         mappings = pd.concat([short_names, long_names], axis=1)
 
         # convert times to datetime
-        epoch = datetime.strptime("%s-%s-%s" % tuple(fh.DATE), "%Y-%m-%d")
-        df['dtm'] = epoch + pd.to_timedelta(round(df['starttime'] / fh.DX[0]), unit='H')
+        epoch = datetime.strptime("%s-%s-%s" % tuple(header['DATE']), "%Y-%m-%d")
+        df['dtm'] = timestamps.from_offsets(epoch, (df['starttime'] / header['DX'][0]).round(), unit='h')
         df.set_index('dtm')
 
         df = utils.downcast_dataframe(df)
@@ -67,10 +149,74 @@ def extract_nasa_ames_file(file:str) -> pd.DataFrame:
         return res
 
     except Exception as err:
-        print(err)
+        print(f"{file}: {err!r}")
         return dict(mappings=pd.DataFrame(), df=pd.DataFrame())
 
 
+def ebas2sqlite(path: str, db: str, tbl=None, mappings=None, ledger=True, batch_files=100, on_conflict="nothing",
+                verbose=True) -> dict:
+    """Load the NASA Ames files of an EBAS directory to a DB table, one file at a time.
+
+    Each file is upserted on dtm as soon as it has been read, within a bulk-load session committing every
+    batch_files files, so that memory holds about one file, however many years the directory covers. The
+    mappings of all files are merged (the first file listing a short name wins) and upserted on short_name.
+
+    Args:
+        path (str): directory holding the files of one data type
+        db (str): path to SQLite3 DB
+        tbl (str, optional): name of DB table. Defaults to None, i.e. ebas_<name of directory>.
+        mappings (str, optional): name of DB table of the mappings. Defaults to None, i.e. ebas_mappings_<name of directory>.
+        ledger (bool, optional): skip files recorded in the DB's _ingest_ledger, and record the files loaded. Defaults to True.
+        batch_files (int, optional): files per transaction. Defaults to 100.
+        on_conflict (str, optional): one of 'nothing' or 'update', for rows whose dtm is stored already. Defaults to 'nothing'.
+
+    Returns:
+        dict: files found, loaded, skipped and failed (nothing extracted), records offered
+    """
+    name = os.path.basename(os.path.normpath(path))
+    if tbl is None:
+        tbl = f"ebas_{name}"
+    if mappings is None:
+        mappings = f"ebas_mappings_{name}"
+    files = sorted(os.path.join(path, f) for f in os.listdir(path) if os.path.isfile(os.path.join(path, f)))
+    res = dict(files=len(files), loaded=0, skipped=0, failed=0, records=0)
+    names = {}
+
+    session = BulkLoader(db, batch_files=batch_files, verbose=False)
+    log = IngestLedger(db, con=session.con) if ledger else None
+    try:
+        for file in files:
+            if log is not None and log.is_loaded(file):
+                if verbose:
+                    print(f"{file} already loaded, skipped.")
+                res['skipped'] += 1
+                continue
+            tmp = extract_nasa_ames_file(file=file)
+            df = tmp['df']
+            if df.empty:
+                res['failed'] += 1
+                continue
+            for row in tmp['mappings'].to_dict('records'):
+                names.setdefault(row['short_name'], row)
+            session.load(df.set_index('dtm'), tbl, on_conflict=on_conflict)
+            if log is not None:
+                # committed with the batch's rows
+                log.record(file, tbl, len(df))
+            session.done()
+            res['loaded'] += 1
+            res['records'] += len(df)
+            if verbose:
+                print(f"{file}: {len(df)} record(s) offered to table {tbl}.")
+        if names:
+            session.load(pd.DataFrame(list(names.values())).set_index('short_name'), mappings, index='short_name',
+                         on_conflict='update')
+    finally:
+        session.close()
+        if log is not None:
+            log.close()
+    return res
+
+
 # %%
 if __name__ == '__main__':
     pass
@@ -3,7 +3,8 @@
 # %%
 import os
 import datetime
-import json
+import sqlite3
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 #from pandas.plotting import register_matplotlib_converters
@@ -11,9 +12,112 @@ import matplotlib.pyplot as plt
 import re
 import requests
 #import xlrd
+from df2sqlite import df2sqlite
+from df2sqlite import schema
+from extract2df.dwh2df import latest_dtm
 
 
-def download_kplc_smartmeter_load_profile(usr: str, pwd: str, from_date: str, to_date: str, verbose: bool = True) -> json:
+# KPLC customer portal; a local stub serving the same /eup endpoints can stand in for it
+URL = "http://41.203.223.137:9090/eup"
+
+
+def _login(session: requests.Session, usr: str, pwd: str, url: str = URL, verbose: bool = True) -> bool:
+    """Log into the portal and retrieve the session cookies."""
+    result = session.post(f"{url}/login!login.do", data={"czyId": usr, "pwd": pwd, "lang": "en_US"})
+    if result.content != b'ok':
+        return False
+    if verbose:
+        print("Login successful!")
+    return session.get(f"{url}/login!loginSuccess.do").status_code == 200
+
+
+def _column_headers(session: requests.Session, url: str = URL) -> dict:
+    """Download the mappings of column codes to the header names of the XLS download feature."""
+    column_headers = session.get(f"{url}/js/locale/eupModule/fhqx/fhqx_en_US.js").content.decode()
+    column_headers = re.sub("fhqx_title_|'|\r\n", "", column_headers)
+    column_headers = re.split("=|;", column_headers)
+    column_headers.pop()
+    column_headers = dict(zip(column_headers[::2], column_headers[1::2]))
+    return {k.upper(): v for k, v in column_headers.items()}
+
+
+def _query_page(session: requests.Session, usr: str, from_date: str, to_date: str, start: int, limit: int,
+                url: str = URL) -> tuple:
+    """Query one page of load profile data.
+
+    Returns
+    -------
+    tuple: page (pd.DataFrame, columns as coded by the portal), total number of rows of the query
+    """
+    query = f"{url}/eup/fhqx/fhqx!query.do?"
+    data = {
+        "start": str(start),
+        "limit": str(limit),
+        "hh": usr,
+        "czy": usr,
+        "opp": "0",
+        "cdid": "9",
+        "ksrq": from_date,
+        "jsrq": to_date
+    }
+    result = session.post(query, data=data, headers=dict(referer=query))
+    result.raise_for_status()
+    payload = result.json()
+    page = pd.DataFrame.from_records(payload['result'] or [])
+    # numbers sent as strings, as pd.read_json would have inferred them
+    for col in page.select_dtypes(include=['object', 'string']).columns:
+        values = pd.to_numeric(page[col], errors='coerce')
+        if values.notna().sum() == page[col].notna().sum():
+            page[col] = values
+    return page, int(payload['rows'])
+
+
+def iter_kplc_smartmeter_load_profile(usr: str, pwd: str, from_date: str, to_date: str, page_size: int = 5000,
+                                      url: str = URL, verbose: bool = True):
+    """
+    Download KPLC smartmeter data page by page.
+
+    Parameters
+    ----------
+    usr : str
+        Account number
+    pwd : str
+        pwd
+    from_date : str
+        Beginning of data period, to be specified as yyyy-mm-dd
+    to_date : str
+        End of data period, to be specified as yyyy-mm-dd
+    page_size : int
+        Rows requested per query. Defaults to 5000
+    url : str
+        Base URL of the portal. Defaults to URL
+
+    Yields
+    ------
+    pd.DataFrame: page of data, columns named as in the XLS download feature, indexed by dtm
+    """
+    with requests.session() as session:
+        if not _login(session, usr, pwd, url=url, verbose=verbose):
+            print("Download not succesful!!")
+            return
+        column_headers = _column_headers(session, url=url)
+        start = total = 0
+        while start == 0 or start < total:
+            page, total = _query_page(session, usr, from_date, to_date, start, page_size, url=url)
+            if page.empty:
+                break
+            start += len(page)
+            if verbose:
+                print("{} of {} rows downloaded.".format(start, total))
+
+            page.rename(columns=column_headers, inplace=True)
+            page['dtm'] = pd.to_datetime(page['Time'], format="%Y-%m-%d %H:%M:%S")
+            page.set_index('dtm', inplace=True)
+            yield page
+
+
+def download_kplc_smartmeter_load_profile(usr: str, pwd: str, from_date: str, to_date: str, verbose: bool = True,
+                                          page_size: int = 5000, url: str = URL) -> pd.DataFrame:
     """
     Download KPLC smartmeter data from_date their website.
     
@@ -30,77 +134,154 @@ def download_kplc_smartmeter_load_profile(usr: str, pwd: str, from_date: str, to
         Beginning of data period, to_date be specified as yyyy-mm-dd
     to_date_date : str
         End of data period, to_date be specified as yyyy-mm-dd
+    page_size : int
+        Rows requested per query. Defaults to 5000
+    url : str
+        Base URL of the portal. Defaults to URL
         
     Returns
     -------
-    JSON object in native format
+    pd.DataFrame: data indexed by dtm, columns named as in the XLS download feature
     """
     try:
-        with requests.session() as session:
-        
-            # call login page with credentials in payload
-            url = "http://41.203.223.137:9090/eup/login!login.do"   
-            data = {
-                "czyId": usr, 
-                "pwd": pwd, 
-                "lang": "en_US"
-            }
-            result = session.post(url, data = data)            
-            if verbose:
-                print("Login successful!")
-            if result.content == b'ok':
-                
-                # retrieve session cookies
-                url = "http://41.203.223.137:9090/eup/login!loginSuccess.do"   
-                result = session.get(url)                
-                if result.status_code == 200: 
-                    
-                    # execute query
-                    url = "http://41.203.223.137:9090/eup/eup/fhqx/fhqx!query.do?"    
-                    data = {
-                        "start": "0",
-                        "limit": "100000",
-                        "hh": usr,
-                        "czy": usr,
-                        "opp": "0",
-                        "cdid": "9",
-                        "ksrq": from_date,
-                        "jsrq": to_date
-                    }
-                    result = session.post(url, data = data, headers = dict(referer = url))
-                
-            if result.status_code == 200: 
-                # convert byte object to json
-                result = json.loads(result.content.decode())
-                
-                if verbose:
-                        print("{} rows successfully downloaded.".format(result["rows"]))
-
-                result = pd.read_json(json.dumps(result['result']))
-
-                # rename columns to match XLS download feature
-                # download mappings of column header names
-                url = "http://41.203.223.137:9090/eup/js/locale/eupModule/fhqx/fhqx_en_US.js"                    
-                column_headers = session.get(url)
-                column_headers = column_headers.content.decode()
-                column_headers = re.sub("fhqx_title_|'|\r\n", "", column_headers)
-                column_headers = re.split("=|;", column_headers)
-                column_headers.pop()                
-                column_headers = dict(zip(column_headers[::2], column_headers[1::2]))
-                column_headers = {k.upper(): v for k, v in column_headers.items()}
-
-                result.rename(columns=column_headers, inplace=True)
-                result['dtm'] = pd.to_datetime(result['Time'], format="%Y-%m-%d %H:%M:%S")
-                result.set_index('dtm', inplace=True)
-            else:
-                print("Download not succesful!!")
-                                
-        return(result)
-                    
+        pages = list(iter_kplc_smartmeter_load_profile(usr, pwd, from_date, to_date, page_size=page_size, url=url,
+                                                       verbose=verbose))
+        return pd.concat(pages) if pages else pd.DataFrame()
+
     except Exception as err:
         print(err)
 
-def read_kplc_smartmeter_load_profile(file, fix=True, save_csv=True, verbose=True):
+
+def kplc2sqlite(usr: str, pwd: str, db: str, tbl: str = "kplc_smartmeter", since=None, till=None,
+                incremental: bool = True, days: int = 1400, page_size: int = 5000, url: str = URL,
+                verbose: bool = True) -> dict:
+    """
+    Download KPLC smartmeter data incrementally and upsert them page by page into an SQLite3 DB.
+
+    In incremental mode, the query starts on the day of max(dtm) of the table, and only newer rows are loaded.
+
+    Parameters
+    ----------
+    usr : str
+        Account number
+    pwd : str
+        pwd
+    db : str
+        Path to SQLite3 DB
+    tbl : str
+        Name of DB table. Defaults to 'kplc_smartmeter'
+    since : str, optional
+        Beginning of data period, yyyy-mm-dd. Defaults to None, i.e. max(dtm) of the table in incremental mode,
+        or 'days' before today
+    till : str, optional
+        End of data period, yyyy-mm-dd. Defaults to None, i.e. today
+    incremental : bln
+        Load only rows newer than max(dtm) of the table? Defaults to True
+    days : int
+        Period to download if the table is empty. Defaults to 1400
+    page_size : int
+        Rows requested per query. Defaults to 5000
+    url : str
+        Base URL of the portal. Defaults to URL
+
+    Returns
+    -------
+    dict: since, till, rows downloaded, records offered and changed
+    """
+    today = datetime.datetime.today()
+    latest = latest_dtm(db, tbl) if incremental else None
+    if since is None:
+        since = latest.strftime("%Y-%m-%d") if latest is not None else \
+            (today - datetime.timedelta(days=days)).strftime("%Y-%m-%d")
+    if till is None:
+        till = today.strftime("%Y-%m-%d")
+    res = dict(since=since, till=till, rows=0, records_offered=0, records_changed=0)
+
+    try:
+        for page in iter_kplc_smartmeter_load_profile(usr, pwd, since, till, page_size=page_size, url=url,
+                                                      verbose=verbose):
+            res['rows'] += len(page)
+            if latest is not None:
+                page = page[page.index > latest]
+            if page.empty:
+                continue
+            loaded = df2sqlite.upsert2sqlite(page, db=db, tbl=tbl, verbose=False)
+            for key in ('records_offered', 'records_changed'):
+                res[key] += (loaded or {}).get(key, 0)
+        if verbose:
+            print('%s record(s) added to table %s (%s rows downloaded).' % (res['records_changed'], tbl, res['rows']))
+        return res
+
+    except Exception as err:
+        print(err)
+
+
+# the meter was connected on 17 June 2020, the timestamps of its first day are all 12 hours early
+FIRST_DAY = pd.Timestamp(2020, 6, 18)
+
+
+def repair_timestamps(dtm, previous=None) -> tuple:
+    """
+    Repair the smart meter's 12-hour timestamp bug in one pass
+
+    Applies, in this order, to timestamps sorted oldest first:
+    1. a timestamp 25 hours after the previous one is moved 12 hours earlier,
+    2. a timestamp seen before is moved 12 hours later,
+    3. a timestamp before FIRST_DAY is moved 12 hours later,
+    4. a timestamp earlier than its (repaired) predecessor, e.g. after a break in the series, is set 1 hour
+       after the predecessor.
+    Rule 4 replaces a loop recomputing the differences of the whole series until none was negative, with the
+    same result.
+
+    Parameters
+    ----------
+    dtm : array-like
+        Timestamps as recorded, oldest first
+
+    previous : pd.DataFrame, optional
+        Rows stored already, oldest first, with columns 'Time' (as recorded) and 'dtm' (repaired), to repair
+        new rows only as continuation of them. Rule 2 looks back as far as these go, a day or more gives the
+        result of repairing all rows at once. Defaults to None
+
+    Returns
+    -------
+    tuple: repaired timestamps (pd.Series, index of dtm if a Series), number of timestamps changed
+    """
+    raw = pd.Series(pd.to_datetime(dtm))
+    if len(raw) == 0:
+        return raw, 0
+    hour = pd.Timedelta(hours=1).value
+    ts = raw.to_numpy(dtype='datetime64[ns]').astype('int64')
+    before = np.empty(0, dtype='int64')
+    if previous is not None and len(previous):
+        before = pd.to_datetime(previous['Time']).to_numpy(dtype='datetime64[ns]').astype('int64')
+        anchor = pd.Timestamp(previous['dtm'].iloc[-1]).value
+    ts = np.concatenate([before, ts])
+
+    # 1. jumps of 25 h
+    diff = np.diff(ts, prepend=ts[0])
+    ts = np.where(diff == 25 * hour, ts - 12 * hour, ts)
+    # 2. repeated timestamps, the first occurrence is kept
+    ts = np.where(pd.Series(ts).duplicated().to_numpy(), ts + 12 * hour, ts)
+    ts = ts[len(before):]
+    # 3. first day of the meter
+    ts = np.where(ts < FIRST_DAY.value, ts + 12 * hour, ts)
+    # 4. one forward pass from the first timestamp earlier than its predecessor
+    full = np.concatenate([[anchor], ts]) if len(before) else ts
+    back = np.flatnonzero(np.diff(full) < 0)
+    if len(back):
+        values = full.tolist()
+        for i in range(int(back[0]) + 1, len(values)):
+            if values[i] < values[i - 1]:
+                values[i] = values[i - 1] + hour
+        full = np.asarray(values, dtype='int64')
+    ts = full[1:] if len(before) else full
+
+    res = pd.Series(pd.to_datetime(ts, unit='ns'), index=raw.index, name=raw.name)
+    return res, int((res != raw).sum())
+
+
+def read_kplc_smartmeter_load_profile(file, fix=True, save_csv=True, verbose=True, previous=None):
     """
     Read KPLC smart meter 'load profile' data and fix time stamps
 
@@ -122,6 +303,10 @@ def read_kplc_smartmeter_load_profile(file, fix=True, save_csv=True, verbose=Tru
     verbose : bln
         Should function return info? default=True
 
+    previous : pd.DataFrame, optional
+        Last rows stored in the DB, with columns 'Time' and 'dtm', cf. repair_timestamps. If given, the rows of
+        the file are repaired as continuation of them, and only rows after them are returned. Defaults to None
+
     Returns
     -------
     df: Pandas dataframe
@@ -136,23 +321,13 @@ def read_kplc_smartmeter_load_profile(file, fix=True, save_csv=True, verbose=Tru
             df.sort_values(by='row', ascending=False, inplace=True)
 
             # assign Time to new column dtm and convert to proper datetime and
-            df['dtm'] = df['Time']
-            df['dtm'] = pd.to_datetime(df['dtm'], format='%Y-%m-%dT%H:%M:%S')
-
             # fix erroneous timestamps in data (afternoon times all of by 12 hrs)
-            # cf. https://pandas.pydata.org/pandas-docs/stable/user_guide/indexing.html#returning-a-view-versus-a-copy
-            # subtract 12 hrs if timestamp jumps 25 hrs from the previous timestamp
-#            df['diff1'] = df['dtm'].diff(1)
-            df.loc[df['dtm'].diff(1) == pd.to_timedelta(25, unit='h'), 'dtm'] -= pd.to_timedelta(12, unit='h')
-            # add 12 h to duplicated time stamps
-            df.loc[df['dtm'].duplicated(), 'dtm'] += pd.to_timedelta(12, unit='h')
-            # fix the first timestamps
-            df.loc[df['dtm'] < pd.datetime(2020,6,18), 'dtm'] += pd.to_timedelta(12, unit='h')
-
-            # Breaks in the time series may lead to 'missing duplicates' for the afternoon timestamps.
-            # This can lead to a negative 1st difference. Fix this iteratively
-            while(any(df['dtm'].diff(1) < pd.to_timedelta(0, unit='h'))):
-                df.loc[df['dtm'].diff(1) < pd.to_timedelta(0, unit='h'), 'dtm'] += -df['dtm'].diff(1) + pd.to_timedelta(1, unit='h')
+            df['dtm'], corrected = repair_timestamps(pd.to_datetime(df['Time'], format='%Y-%m-%dT%H:%M:%S'),
+                                                     previous=previous)
+            if previous is not None and len(previous):
+                df = df[df['dtm'] > pd.Timestamp(previous['dtm'].iloc[-1])]
+            if verbose:
+                print(f"{corrected} timestamp(s) corrected.")
 
             df.set_index(df['dtm'], inplace=True)
             df.drop(labels=['row'], axis=1, inplace=True)
@@ -251,25 +426,24 @@ def main():
     TBL = "kplc_smartmeter"
     USR = "2097696"
     PWD = "Gawkenya20"
-    to_date = datetime.datetime.today()
-    from_date = (to_date - datetime.timedelta(days=1400)).strftime("%Y-%m-%d")
-    to_date = to_date.strftime("%Y-%m-%d")
-
-    df = download_kplc_smartmeter_load_profile(USR, PWD, from_date, to_date)
-    res = df2sqlite.df2sqlite(df, db=DB, tbl=f"{TBL}")
 
-    if not df.empty:
-        file = os.path.join(os.path.expanduser(root), "data/kplc/load_profile.csv")
-        df.to_csv(file)
+    res = kplc2sqlite(USR, PWD, db=DB, tbl=TBL)
 
-        df = read_kplc_smartmeter_load_profile(file, fix=True, verbose=True)
+    if res and res['records_changed']:
+        con = sqlite3.connect(DB)
+        try:
+            df = pd.read_sql_query(f"select * from {TBL} order by dtm", con)
+            df['dtm'] = schema.to_datetime(df['dtm'], schema.is_epoch(con, TBL))
+        finally:
+            con.close()
+        df.set_index('dtm', inplace=True)
 
-        target = os.path.join(os.path.expanduser(root), "results/kplc")
+        target = os.path.join(os.path.expanduser(ROOT), "results/kplc")
         plot_kplc_smartmeter_load_profile(df, target)
     
         print(df.tail())
     else:
-        print("Could not retrieve any data from source. Exiting ...")
+        print("No new data retrieved from source. Exiting ...")
     # cols = (17, 18, 19)
     # ylab = "Phase current (A)"
     # name = os.path.join(root, "results/currents.png")
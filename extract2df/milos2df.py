@@ -1,44 +1,52 @@
 # %%
 import os
 from datetime import datetime
-from datetime import timedelta
+import numpy as np
 import pandas as pd
+from extract2df import timestamps
+
+COLUMNS = ["CO_raw", "tre200s0", "uor200s0", "tde200s0", "prestas0", "dkl010s0", "fkl010s0", "gor000s0", "ods000so",
+           "dirrad", "itosurs0"]
+NA_VALUES = ['//', '///', '////', '/////']
+
 
 # %%
+def _read_log(fpath: str) -> pd.DataFrame:
+    """Parse a daily MILOS 500 .LOG file (YYMMDD.LOG) with the C parser.
+
+    Rows are stamped H M S of the day given by the file name; stamps ending in 59 are rounded up to the full
+    minute, and a first row later than the second (23 59 59) belongs to the previous day. Of the values, the
+    last 2 columns are dropped; in the 11-column layout, surface ozone comes first and is moved to the end,
+    the 10-column layout lacks it.
+    """
+    dte = datetime.strptime(os.path.basename(fpath).split(".")[0], "%y%m%d")
+    df = pd.read_csv(fpath, sep=r"\s+", skiprows=1, header=None, na_values=NA_VALUES, engine="c")
+
+    # first 3 columns are H M S of the day given by the file name
+    seconds = df[0].to_numpy('int64') * 3600 + df[1].to_numpy('int64') * 60 + df[2].to_numpy('int64')
+    if seconds[0] % 60 == 59:
+        seconds = seconds + 1
+    if len(seconds) > 1 and seconds[0] > seconds[1]:
+        seconds[0] -= 86400
+    dtm = pd.DatetimeIndex(timestamps.from_offsets(dte, seconds, unit='s'), name='dtm')
+
+    values = df.iloc[:, 3:-2].to_numpy('float64')
+    if values.shape[1] == 11:
+        values = values[:, list(range(1, 11)) + [0]]
+    elif values.shape[1] == 10:
+        values = np.column_stack([values, np.full(len(values), np.nan)])
+    else:
+        raise ValueError(f"{fpath}: {values.shape[1]} columns, expected 10 or 11.")
+    return pd.DataFrame(values, index=dtm, columns=COLUMNS)
+
+
 def milos2df(fpath: str) -> pd.DataFrame:
     try:
         # fpath = "C:/Users/localadmin/Documents/git/gawke2sqlite/data/001217.LOG"
         # fpath = "C:/Users/localadmin/Documents/git/gawke2sqlite/data/031211.LOG"
         df = pd.DataFrame()
         if ".log" in fpath.lower():
-            # read file content into pd.DataFrame
-            dte = os.path.basename(fpath).split(".")[0]
-            custom_date_parser = lambda x: datetime.strptime(f"{dte} {x}", "%y%m%d %H %M %S")
-            
-            df = pd.read_csv(fpath, sep=r"\s+", skiprows=1, header=None, na_values=['//', '///', '////', '/////'],
-                parse_dates={"dtm": [0, 1, 2]}, date_parser=custom_date_parser, engine="python")
-
-            # correct dtm: round up to full minute, make sure first entry is from previous day
-            if df['dtm'][0].second == 59:
-                df.loc[:, 'dtm'] = df.loc[:, 'dtm'] + timedelta(seconds=1)
-            if df['dtm'][0] > df['dtm'][1]:
-                df.loc[0, 'dtm'] = df.loc[0, 'dtm'] - timedelta(days=1)
-            df.set_index('dtm', inplace=True)
-
-            # drop last 2 columns
-            df = df.iloc[:, :-2]
-
-            # handle different formats
-            if len(df.columns) == 11:
-                # first column is surface ozone, include as at the end
-                df = df.iloc[:, 1:12].merge(df.iloc[:, :1], on='dtm')
-            elif len(df.columns) == 10:
-                df['itosurs0'] = None
-
-            # rename columns
-            df.columns=["CO_raw", "tre200s0", "uor200s0", 
-                "tde200s0", "prestas0", "dkl010s0", "fkl010s0", 
-                "gor000s0", "ods000so", "dirrad", 'itosurs0']
+            df = _read_log(fpath)
 
         if ".csv" in fpath.lower():
             # TODO
@@ -63,17 +71,43 @@ def milos2df(fpath: str) -> pd.DataFrame:
         print(err)
 
 
+def milos_dir2df(path: str, recursive=True) -> pd.DataFrame:
+    """Parse all MILOS 500 .LOG files of a directory into one frame, e.g. to rebuild the MILOS tables.
+
+    Args:
+        path (str): directory holding YYMMDD.LOG files
+        recursive (bool, optional): include sub-directories. Defaults to True.
+
+    Returns:
+        pd.DataFrame: as returned by milos2df, sorted by dtm
+    """
+    files = []
+    for root, dirs, names in os.walk(path):
+        files += [os.path.join(root, name) for name in names if name.lower().endswith(".log")]
+        if not recursive:
+            break
+    frames = []
+    for fpath in sorted(files):
+        try:
+            frames.append(_read_log(fpath))
+        except Exception as err:
+            print(f"{fpath}: {err}")
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], name='dtm'))
+    return pd.concat(frames).sort_index(kind='stable')
+
+
 def extract_o3(df: pd.DataFrame, index=None, o3=None, aggregate=None) -> pd.DataFrame:
     """extract ozone readings from DataFrame and optionally aggregate.
 
     Args:
-        df (pd.DataFrame): _description_
-        index (pd.DataFrame): _description_. Defaults to None.
-        o3 (pd.DataFrame): _description_. Defaults to None.
-        aggregate (_type_, optional): _description_. Defaults to None.
+        df (pd.DataFrame): data as returned by milos2df
+        index (str, optional): name of dateTime axis. Defaults to None, i.e. 'dtm'.
+        o3 (str, optional): name of ozone column. Defaults to None, i.e. 'itosurs0'.
+        aggregate (str, optional): pandas frequency to average to, e.g. '10min'. Defaults to None, i.e. no aggregation.
 
     Returns:
-        pd.DataFrame: _description_
+        pd.DataFrame: ozone readings indexed by dtm
     """
     try:
         if index is None:
@@ -81,12 +115,12 @@ def extract_o3(df: pd.DataFrame, index=None, o3=None, aggregate=None) -> pd.Data
         if o3 is None:
             o3 = "itosurs0"
         
-        df.reset_index(inplace=True)
+        df = df.reset_index()
         df = df.loc[:, [index, o3]]
         df.set_index(index, inplace=True)
 
         if aggregate:
-            df.resample("10M").agg("mean")
+            df = df.resample(aggregate).agg("mean")
 
         return df
     except Exception as err:
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Picarro G2401 (serial CFKADS2320) CO, CO2, CH4 and H2O analyzer data.
+
+The analyzer writes a DataLog_User (or DataLog_User_Sync) file per hour, usually zipped, with a row every few
+seconds: whitespace-delimited, columns padded to a fixed width, a header naming the columns. Only the columns
+listed here are parsed, the fractional day and hour counters and the like are skipped.
+
+At this rate a single analyzer adds millions of rows per month. aggregate() reduces the rows to means and
+standard deviations per minute (or any other interval), which ETLHandler can load next to or instead of the
+raw rows (configuration key 'aggregate').
+"""
+# %%
+import numpy as np
+import pandas as pd
+from extract2df import timestamps
+
+TIME = ('DATE', 'TIME', 'EPOCH_TIME')
+# instrument and valve states, aggregated by their maximum, so that a minute with any alarm is flagged
+STATUS = ('ALARM_STATUS', 'INST_STATUS', 'MPVPosition', 'solenoid_valves', 'OutletValve')
+# DataLog_User_Sync has the mole fractions as <species>_sync, DataLog_User without suffix
+MEASURES = ('CavityPressure', 'CavityTemp', 'DasTemp', 'EtalonTemp', 'WarmBoxTemp',
+            'CO_sync', 'CO2_sync', 'CO2_dry_sync', 'CH4_sync', 'CH4_dry_sync', 'H2O_sync',
+            'CO', 'CO2', 'CO2_dry', 'CH4', 'CH4_dry', 'H2O')
+COLUMNS = frozenset(TIME + STATUS + MEASURES)
+
+
+# %%
+def read_picarro(file, index='dtm') -> pd.DataFrame:
+    """Read a Picarro data file into a dataframe indexed by dtm.
+
+    Parsed with the C engine, reading only COLUMNS. Timestamps are taken from EPOCH_TIME (UTC), or else
+    from DATE and TIME.
+
+    Args:
+        file: path or file-like object, e.g. a member of a zip archive opened with ZipFile.open
+        index (str, optional): name of dateTime axis. Defaults to 'dtm'.
+
+    Returns:
+        pd.DataFrame: status and measured columns present in the file, in file order
+    """
+    df = pd.read_csv(file, sep=r'\s+', usecols=lambda column: column in COLUMNS, encoding='latin1')
+    if 'EPOCH_TIME' in df.columns:
+        # written with milliseconds
+        dtm = timestamps.from_offsets('1970-01-01', df['EPOCH_TIME'], unit='s').dt.round('ms')
+    else:
+        dtm = timestamps.from_date_time(df['DATE'], df['TIME'], format="%Y-%m-%d %H:%M:%S.%f")
+    df = df.drop(columns=[column for column in TIME if column in df.columns])
+    df.index = pd.DatetimeIndex(dtm, name=index)
+    return df
+
+
+def aggregate(df: pd.DataFrame, freq='1min') -> pd.DataFrame:
+    """Aggregate high-frequency rows to intervals of freq, labelled by their start.
+
+    Measured columns give their mean (under the column's name) and standard deviation (<column>_sd), status
+    columns their maximum, other columns (e.g. source) their first value, and n is the number of rows of the
+    interval.
+
+    Args:
+        df (pd.DataFrame): as returned by read_picarro
+        freq (str, optional): length of intervals. Defaults to '1min'.
+
+    Returns:
+        pd.DataFrame: one row per interval with data, indexed like df
+    """
+    grouped = df.groupby(df.index.floor(freq))
+    status = [column for column in df.columns if column in STATUS]
+    measures = [column for column in df.columns
+                if column not in STATUS and pd.api.types.is_numeric_dtype(df[column])]
+    other = [column for column in df.columns if column not in status and column not in measures]
+    res = pd.concat([grouped[measures].mean(), grouped[measures].std().add_suffix('_sd'),
+                     grouped[status].max(), grouped[other].first()], axis=1)
+    # mean, sd of each measure side by side
+    res = res[[c for m in measures for c in (m, f"{m}_sd")] + status + other]
+    res['n'] = grouped.size()
+    res.index.name = df.index.name
+    return res
+
+
+def combine(a: pd.DataFrame, b: pd.DataFrame) -> pd.DataFrame:
+    """Combine aggregates of the same intervals, as if their rows had been aggregated together.
+
+    An interval spans two files when a file starts within it, e.g. at 00:00:13. Means and standard deviations are
+    pooled, weighted by n, status columns take the maximum, and n is summed. Other columns are taken from b.
+
+    Args:
+        a (pd.DataFrame): aggregates as returned by aggregate(), e.g. rows stored already
+        b (pd.DataFrame): aggregates of the same intervals (same index)
+
+    Returns:
+        pd.DataFrame: combined aggregates, with the columns of b
+    """
+    res = b.copy()
+    n1, n2 = a['n'].astype('float64'), b['n'].astype('float64')
+    n = n1 + n2
+    for column in b.columns:
+        if column == 'n' or column not in a.columns:
+            continue
+        if f"{column}_sd" in b.columns and f"{column}_sd" in a.columns:
+            # rows read back from the DB hold None for the sd of single-row intervals
+            m1, m2 = a[column].astype('float64'), b[column].astype('float64')
+            s1, s2 = (df[f"{column}_sd"].astype('float64').fillna(0) for df in (a, b))
+            ss = (n1 - 1) * s1 ** 2 + (n2 - 1) * s2 ** 2 + n1 * n2 / n * (m1 - m2) ** 2
+            res[column] = (n1 * m1 + n2 * m2) / n
+            res[f"{column}_sd"] = (ss / (n - 1)) ** 0.5
+        elif column in STATUS:
+            res[column] = np.maximum(a[column], b[column])
+    res['n'] = (n1 + n2).astype(b['n'].dtype)
+    return res
+
+
+# %%
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""Extract SHADOZ sfco3 (surface ozone) and V06 (sonde) files, read straight from their tar or zip archives."""
+# %%
+import os
+from datetime import datetime
+from io import StringIO
+import tarfile
+import zipfile
+import pandas as pd
+from extract2df import timestamps
+
+
+# %%
+def iter_archive(fpath: str, include=None):
+    """Yield the members of a tar or zip archive without extracting them to disk.
+
+    Args:
+        fpath (str): path to archive
+        include (list, optional): file extensions to include. Defaults to ['.txt', '.dat'].
+
+    Yields:
+        tuple: (member name, file-like object)
+    """
+    if not include:
+        include = [".txt", ".dat"]
+    print(f"Processing {os.path.basename(fpath)} ...")
+    if ".tar" in fpath:
+        with tarfile.open(fpath) as tar:
+            for member in tar:
+                if member.isfile() and member.name[-4:] in include:
+                    print(f" - Reading {member.name} ...")
+                    yield member.name, tar.extractfile(member)
+    elif ".zip" in fpath:
+        with zipfile.ZipFile(fpath, 'r') as zfh:
+            for fname in zfh.namelist():
+                if fname[-4:] in include:
+                    print(f" - Reading {fname} ...")
+                    with zfh.open(fname) as fh:
+                        yield fname, fh
+
+# %%
+def extract_shadoz_file(fpath, remove_file=False) -> pd.DataFrame:
+    """Extract a SHADOZ sfco3 or V06 file.
+
+    Args:
+        fpath (str or file-like): path to file, or file-like object as yielded by iter_archive
+        remove_file (bool, optional): Remove file from disk after reading. Defaults to False.
+    """
+    try:
+        # read file and determine number of header rows, file type
+        if isinstance(fpath, str):
+            with open(fpath, 'r', encoding='utf') as fh:
+                text = fh.read()
+        else:
+            text = fpath.read()
+            if isinstance(text, bytes):
+                text = text.decode('utf')
+        data = text.splitlines(keepends=True)
+        header_rows = int(data[0])
+        shadoz_data_type = data[4].split(sep=": ")[1]
+        if "01" in shadoz_data_type:
+            df = pd.read_csv(StringIO(text), sep=r"\s+", header=None,
+                skiprows=header_rows, engine="python")
+            # date and time columns (nested parse_dates is no longer supported by pandas)
+            dtm = timestamps.from_date_time(df[0], df[1], format=None)
+            df = df.drop(columns=[0, 1])
+            df.index = pd.DatetimeIndex(dtm, name='dtm')
+            df.rename(columns={2: "O3_ppb"}, inplace=True)
+            df.reset_index()
+        elif "06" in shadoz_data_type:
+            launch_dtm = f"{data[12].split(sep=': ')[1].split()[0]} \
+                {data[13].split(sep=': ')[1].split()[0]}"
+            launch_dtm = datetime.strptime(launch_dtm, "%Y%m%d %H:%M:%S")
+            names = data[header_rows - 2].split()
+            units = data[header_rows - 1].split()
+            df = pd.read_csv(StringIO(text), sep=r"\s+", header=None,
+                skiprows=header_rows, parse_dates=None,
+                na_values=['9000.0', '9000.00', '9000.000', '9000.00000'],
+                index_col=None, engine="python")
+            # df.columns = [f"{x}_{y}" for x, y in zip(names, units)]
+            df.columns = names
+            df['dtm'] = timestamps.from_offsets(launch_dtm, df['Time'], unit='s')
+            df.set_index('dtm', inplace=True)
+            df.reset_index()
+        else:
+            raise ValueError(f"Cannot read file of type {shadoz_data_type}")
+
+        if remove_file and isinstance(fpath, str):
+            os.remove(fpath)
+
+        return df
+
+    except Exception as err:
+        print(err)
+
+
+# %%
+if __name__ == '__main__':
+    pass
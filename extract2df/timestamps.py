@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""Vectorized construction of timestamps for all extractors.
+
+Each input layout has its own constructor, all returning a pd.Series of datetime64 values:
+
+- from_date_time: separate date and time strings, e.g. tei49i/tei49c 'pcdate', 'pctime'
+- from_compact: integers or strings %Y%m%d%H%M[%S], e.g. bulletin 'zzzztttt'
+- from_components: year, month, day, hour, minute, second columns, e.g. WDCGG, MILOS
+- from_offsets: offsets from an epoch, e.g. EBAS NASA Ames, SHADOZ
+
+floor_to/round_to align timestamps to the minute or the 10 minutes, to_epoch returns int64 epoch seconds.
+"""
+# %%
+import numpy as np
+import pandas as pd
+
+
+# inputs of fewer values are parsed by pandas, see from_compact
+SMALL = 16
+
+
+# %%
+def _series(values, index=None) -> pd.Series:
+    if isinstance(values, pd.Series):
+        return values
+    return pd.Series(values, index=index)
+
+
+def from_components(year, month, day, hour=0, minute=0, second=0, index=None) -> pd.Series:
+    """Assemble timestamps from numeric date and time components with numpy datetime arithmetic.
+
+    Rows with out-of-range components become NaT.
+
+    Args:
+        year, month, day: array-likes of integers
+        hour, minute, second (optional): array-likes or scalars. Default to 0.
+        index (optional): index of the result. Defaults to the index of 'year' if it is a pd.Series.
+
+    Returns:
+        pd.Series: datetime64
+    """
+    if index is None and isinstance(year, pd.Series):
+        index = year.index
+    n = len(year)
+    y, mo, d, h, mi, s = (np.broadcast_to(np.asarray(x, dtype='float64'), (n,))
+                          for x in (year, month, day, hour, minute, second))
+    valid = ((mo >= 1) & (mo <= 12) & (d >= 1) & (d <= 31) & (h >= 0) & (h < 24)
+             & (mi >= 0) & (mi < 60) & (s >= 0) & (s < 61))
+    valid &= ~np.isnan(y)
+    months = np.where(valid, (y - 1970) * 12 + mo - 1, 0).astype('int64')
+    days = months.astype('datetime64[M]').astype('datetime64[D]') + np.where(valid, d - 1, 0).astype('int64')
+    seconds = np.where(valid, h * 3600 + mi * 60 + s, 0)
+    dtm = days.astype('datetime64[ns]') + (seconds * 1e9).round().astype('timedelta64[ns]')
+    # day 31 of a 30-day month etc. rolls over into the next month
+    valid &= (dtm.astype('datetime64[M]') == months.astype('datetime64[M]'))
+    dtm[~valid] = np.datetime64('NaT')
+    return pd.Series(dtm, index=index)
+
+
+def from_compact(values, index=None) -> pd.Series:
+    """Parse timestamps written as %Y%m%d%H%M or %Y%m%d%H%M%S, e.g. 202305120520 or 19991224000001.
+
+    Args:
+        values: array-like of integers or digit strings
+
+    Returns:
+        pd.Series: datetime64
+    """
+    values = _series(values, index=index)
+    a = values.to_numpy()
+    if 0 < len(a) < SMALL and a.dtype.kind in 'iu' and 1e11 <= a.min() and a.max() < 1e12:
+        # a few %Y%m%d%H%M values, e.g. a single bulletin: the fixed cost of the arithmetic below exceeds parsing;
+        # invalid dates (NaT below) make pandas raise
+        try:
+            return pd.to_datetime(values, format="%Y%m%d%H%M")
+        except ValueError:
+            pass
+    v = pd.to_numeric(values, errors='coerce').to_numpy(dtype='float64')
+    # 14 digits carry seconds
+    has_seconds = v >= 1e13
+    s = np.where(has_seconds, v % 100, 0)
+    v = np.where(has_seconds, v // 100, v)
+    return from_components(v // 1e8, v // 1e6 % 100, v // 1e4 % 100, v // 100 % 100, v % 100, s,
+                           index=values.index)
+
+
+def from_date_time(date, time, format="%Y-%m-%d %H:%M:%S") -> pd.Series:
+    """Parse timestamps given as separate date and time strings, e.g. '2022-12-31' and '23:50:01'.
+
+    Args:
+        date: array-like of date strings
+        time: array-like of time strings
+        format (str, optional): format of 'date time', None to infer it. Defaults to '%Y-%m-%d %H:%M:%S'.
+
+    Returns:
+        pd.Series: datetime64
+    """
+    date = _series(date)
+    return pd.to_datetime(date.astype(str) + ' ' + _series(time, index=date.index).astype(str), format=format)
+
+
+def from_offsets(epoch, offsets, unit='s') -> pd.Series:
+    """Add offsets to an epoch, e.g. hours since the start date of a NASA Ames file.
+
+    Args:
+        epoch: start time (anything pd.Timestamp accepts)
+        offsets: array-like of numbers
+        unit (str, optional): unit of offsets. Defaults to 's'.
+
+    Returns:
+        pd.Series: datetime64
+    """
+    offsets = _series(offsets)
+    return pd.Timestamp(epoch) + pd.to_timedelta(offsets, unit=unit)
+
+
+def floor_to(ts, freq='1min') -> pd.Series:
+    """Floor timestamps to a fixed frequency, e.g. '1min' or '10min'."""
+    return _series(ts).dt.floor(freq)
+
+
+def round_to(ts, freq='1min') -> pd.Series:
+    """Round timestamps to a fixed frequency, e.g. '1min' or '10min'."""
+    return _series(ts).dt.round(freq)
+
+
+def to_epoch(ts) -> pd.Series:
+    """Convert timestamps to int64 seconds since 1970-01-01 (NaT becomes <NA>)."""
+    ts = _series(ts)
+    seconds = ts.to_numpy(dtype='datetime64[s]').astype('int64')
+    return pd.Series(seconds, index=ts.index, dtype='Int64').mask(ts.isna())
+
+
+# %%
+if __name__ == '__main__':
+    pass
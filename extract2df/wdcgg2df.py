@@ -3,12 +3,14 @@
 # %%
 import os
 from datetime import datetime
+from io import StringIO
 from typing import Tuple
 import shutil
 import sqlite3
 import tarfile
 from dateutil. relativedelta import relativedelta
 import pandas as pd
+from extract2df import timestamps
 
 
 # %%
@@ -33,11 +35,46 @@ def extract_archive(fpath: str, include=None) -> list:
         print(err)
 
 # %%
-def extract_wdcgg_file(fpath: str, remove_file=False) -> Tuple[str, pd.DataFrame]:
+def iter_archive(fpath: str, include=None):
+    """Yield the members of a tar archive without extracting them to disk.
+
+    Args:
+        fpath (str): path to archive
+        include (list, optional): file extensions to include. Defaults to ['.txt'].
+
+    Yields:
+        tuple: (member name, file-like object)
+    """
+    if not include:
+        include = [".txt"]
+    print(f"Processing {os.path.basename(fpath)} ...")
+    if ".tar" in fpath:
+        with tarfile.open(fpath) as tar:
+            for member in tar:
+                if member.isfile() and member.name[-4:] in include and 'WDCGG' not in member.name:
+                    print(f" - Reading {member.name} ...")
+                    yield member.name, tar.extractfile(member)
+
+# %%
+def extract_wdcgg_file(fpath, remove_file=False, name=None) -> Tuple[str, pd.DataFrame]:
+    """Extract a WDCGG file.
+
+    Args:
+        fpath (str or file-like): path to file, or file-like object as yielded by iter_archive
+        remove_file (bool, optional): Remove file from disk after reading. Defaults to False.
+        name (str, optional): file name, required for header-less files read from a file-like object.
+    """
     try:
         # read file and determine number of header rows, file type
-        with open(fpath, 'r', encoding='utf') as fh:
-            data = fh.readlines()
+        if isinstance(fpath, str):
+            name = fpath if name is None else name
+            with open(fpath, 'r', encoding='utf') as fh:
+                text = fh.read()
+        else:
+            text = fpath.read()
+            if isinstance(text, bytes):
+                text = text.decode('utf')
+        data = text.splitlines(keepends=True)
         try:
             header_lines = int(data[0].split(sep=": ")[1])
         except:
@@ -62,17 +99,20 @@ def extract_wdcgg_file(fpath: str, remove_file=False) -> Tuple[str, pd.DataFrame
         else:
             # assume insitu data and extract other stuff from filename
             data_type = 'insitu'
-            items = os.path.basename(fpath).split(sep="_")
+            items = os.path.basename(name).split(sep="_")
             gaw_id = items[0]
             data_set_type = items[1]
             species = items[2].upper()
 
 
         # read actual data
-        df = pd.read_csv(fpath, sep=r"\s+", header=None,
-                skiprows=header_lines, parse_dates={'dtm': [1, 2, 3, 4, 5, 6]},
+        df = pd.read_csv(StringIO(text), sep=r"\s+", header=None,
+                skiprows=header_lines,
                 na_values=['-999', '-9', '-99.9', '-999.999'],
                 engine="python")
+        dtm = timestamps.from_components(df[1], df[2], df[3], df[4], df[5], df[6])
+        df = df.drop(columns=[1, 2, 3, 4, 5, 6])
+        df.insert(0, 'dtm', dtm)
         if header_lines > 1:
             cols = data[header_lines-1].split()[1:]
         else:
@@ -80,10 +120,9 @@ def extract_wdcgg_file(fpath: str, remove_file=False) -> Tuple[str, pd.DataFrame
         
         for i in range(6):
             cols.pop(1)
-        df['dtm'] = pd.to_datetime(df['dtm'], format="%Y %m %d %H %M %S")
         df.columns = ['dtm'] + cols
 
-        if remove_file:
+        if remove_file and isinstance(fpath, str):
             os.remove(fpath)
 
         if 'MET' in species:
@@ -105,47 +144,48 @@ def extract_wdcgg_file(fpath: str, remove_file=False) -> Tuple[str, pd.DataFrame
 
 # %%
 if __name__ == "__main__":
-    pass
-
-fpath = "C:/Users/localadmin/Documents/git/scratch/data/wdcgg/txt/WDCGG_20220805041645.tar.gz"
-ROOT = os.path.expanduser("~/Documents/data")
-SOURCE = "wdcgg"
-GAWID = "mkn"
-target_dir = os.path.join(ROOT, SOURCE, "txt")
-os.makedirs(target_dir, exist_ok=True)
-db = os.path.join(ROOT, f"{GAWID}.sqlite")
-
-# %%
-# process tar archives, add data to sqlite db
-archives = []
-for root, dnames, fnames in os.walk(target_dir):
-    for fname in fnames:
-        archives.append(os.path.join(root, fname))
-
-# %%
-for fpath in archives:
-    flist = extract_archive(fpath)
-    for fh in flist:
-        description, df = extract_wdcgg_file(fpath=fh, remove_file=True)
-        # res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{gaw_id}_{species}_{data_type}")
-        res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{description}")
-        print(res)
-
-# clean up
-shutil.rmtree(os.path.join(target_dir, 'tmp'))
-
-# %%
-# process header-less files from Empa (received via e-mail from Martin S.)
-target_dir = os.path.join(ROOT, "empa")
-data_files = []
-for root, dnames, fnames in os.walk(target_dir):
-    for fname in fnames:
-        if 'MKN' in fname:
-            data_files.append(os.path.join(root, fname))
-
-# %%
-for fh in data_files:
-    description, df = extract_wdcgg_file(fpath=fh, remove_file=False)
-    # res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{gaw_id}_{species}_{data_type}")
-    res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{description}")
-    print(res)
+    from df2sqlite.df2sqlite import append_to_sqlite_db
+    from df2sqlite.bulk import BulkLoader
+
+    fpath = "C:/Users/localadmin/Documents/git/scratch/data/wdcgg/txt/WDCGG_20220805041645.tar.gz"
+    ROOT = os.path.expanduser("~/Documents/data")
+    SOURCE = "wdcgg"
+    GAWID = "mkn"
+    target_dir = os.path.join(ROOT, SOURCE, "txt")
+    os.makedirs(target_dir, exist_ok=True)
+    db = os.path.join(ROOT, f"{GAWID}.sqlite")
+
+    # %%
+    # process tar archives, add data to sqlite db
+    archives = []
+    for root, dnames, fnames in os.walk(target_dir):
+        for fname in fnames:
+            archives.append(os.path.join(root, fname))
+
+    # %%
+    with BulkLoader(db) as session:
+        for fpath in archives:
+            for name, fh in iter_archive(fpath):
+                description, df = extract_wdcgg_file(fh, name=name)
+                # res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{gaw_id}_{species}_{data_type}")
+                res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{description}", session=session)
+                session.done()
+                print(res)
+
+    # %%
+    # process header-less files from Empa (received via e-mail from Martin S.)
+    target_dir = os.path.join(ROOT, "empa")
+    data_files = []
+    for root, dnames, fnames in os.walk(target_dir):
+        for fname in fnames:
+            if 'MKN' in fname:
+                data_files.append(os.path.join(root, fname))
+
+    # %%
+    with BulkLoader(db) as session:
+        for fh in data_files:
+            description, df = extract_wdcgg_file(fpath=fh, remove_file=False)
+            # res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{gaw_id}_{species}_{data_type}")
+            res = append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{description}", session=session)
+            session.done()
+            print(res)
@@ -3,12 +3,15 @@
 # %%
 import os
 from datetime import datetime
+from io import StringIO
 from datetime import timedelta
 import zipfile
-import df2sqlite
+from df2sqlite import df2sqlite
+from df2sqlite.bulk import BulkLoader
 import tarfile
 import pandas as pd
 import requests
+from extract2df.shadoz2df import iter_archive, extract_shadoz_file
 
 
 # %%
@@ -77,48 +80,6 @@ def extract_archive(fpath: str, include=None) -> list:
     except Exception as err:
         print(err)
 
-# %%
-def extract_shadoz_file(fpath: str, remove_file=False) -> pd.DataFrame:
-    try:
-        # read file and determine number of header rows, file type
-        with open(fpath, 'r', encoding='utf') as fh:
-            data = fh.readlines()
-        header_rows = int(data[0])
-        shadoz_data_type = data[4].split(sep=": ")[1]
-        if "01" in shadoz_data_type:
-            df = pd.read_csv(fpath, sep=r"\s+", header=None,
-                skiprows=header_rows, parse_dates=[[0, 1]],
-                index_col=[0], engine="python")
-            df.index.rename('dtm', inplace=True)
-            df.rename(columns={2: "O3_ppb"}, inplace=True)
-            df.reset_index()
-        elif "06" in shadoz_data_type:
-            launch_dtm = f"{data[12].split(sep=': ')[1].split()[0]} \
-                {data[13].split(sep=': ')[1].split()[0]}"
-            launch_dtm = datetime.strptime(launch_dtm, "%Y%m%d %H:%M:%S")
-            names = data[header_rows - 2].split()
-            units = data[header_rows - 1].split()
-            df = pd.read_csv(fpath, sep=r"\s+", header=None,
-                skiprows=header_rows, parse_dates=None,
-                na_values=['9000.0', '9000.00', '9000.000', '9000.00000'],
-                index_col=None, engine="python")
-            # df.columns = [f"{x}_{y}" for x, y in zip(names, units)]
-            df.columns = names
-            df['dtm'] = launch_dtm + pd.to_timedelta(df['Time'], unit="s")
-            df.set_index('dtm', inplace=True)
-            df.reset_index()
-        else:
-            raise ValueError(f"Cannot read file of type {shadoz_data_type}")
-
-        if remove_file:
-            os.remove(fpath)
-
-        return df
-
-    except Exception as err:
-        print(err)
-
-
 # %%
 ROOT_URL = "https://acd-ext.gsfc.nasa.gov/anonftp/acd"
 SOURCE = "shadoz"
@@ -149,12 +110,13 @@ if not archives:
 # process tar archives, add data to sqlite db
 db = os.path.join(ROOT, f"{GAWID}.sqlite")
 
-for fpath in archives:
-    flist = extract_archive(fpath)
-    for fh in flist:
-        df = extract_shadoz_file(fpath=fh, remove_file=True)
-        res = df2sqlite.append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{FILE_TYPE}")
-        print(res)
+with BulkLoader(db) as session:
+    for fpath in archives:
+        for name, fh in iter_archive(fpath):
+            df = extract_shadoz_file(fh)
+            res = df2sqlite.append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{FILE_TYPE}", session=session)
+            session.done()
+            print(res)
 
 # %% sonde data NRB
 # download data from SHADOZ repository
@@ -178,11 +140,12 @@ if not archives:
 # %%
 # process zip archives, add data to sqlite db
 db = os.path.join(ROOT, f"{GAWID}.sqlite")
-for fpath in archives:
-    flist = extract_archive(fpath)
-    for fh in flist:
-        df = extract_shadoz_file(fpath=fh, remove_file=True)
-        res = df2sqlite.append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{FILE_TYPE}")
-        print(res)
+with BulkLoader(db) as session:
+    for fpath in archives:
+        for name, fh in iter_archive(fpath):
+            df = extract_shadoz_file(fh)
+            res = df2sqlite.append_to_sqlite_db(df, db, tbl=f"{SOURCE}_{FILE_TYPE}", session=session)
+            session.done()
+            print(res)
 
 # %%
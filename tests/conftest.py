@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""Run the tests from the repository root or from tests/: the packages are imported from the repository root."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Batches of bulletins: malformed bulletins are rejected one by one, values are kept as float64."""
+import os
+import glob
+import shutil
+import sqlite3
+from extract2df import bulletin2df
+from etl.etl import ETLHandler
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+FILES = sorted(glob.glob(os.path.join(DATA, "meteo", "VRXA00*")))
+
+
+def copies(folder, malformed=None) -> list:
+    """Copies of the VRXA00 samples, the data line of the file at position malformed[0] edited by malformed[1]."""
+    folder.mkdir(parents=True, exist_ok=True)
+    files = [shutil.copy(file, folder) for file in FILES]
+    if malformed is not None:
+        i, edit = malformed
+        with open(files[i]) as fh:
+            lines = fh.read().splitlines()
+        lines[-1] = edit(lines[-1])
+        with open(files[i], 'w') as fh:
+            fh.write("\n".join(lines) + "\n")
+    return files
+
+
+def test_batch_as_single_files():
+    df = bulletin2df.extract_bulletin_files(FILES, log=False)
+    assert df.attrs['rejected'] == []
+    assert list(df['source'].cat.categories) == FILES
+    for file in FILES:
+        single = bulletin2df.extract_bulletin_file(file, pattern="VRXA00", log=False)
+        batch = df[df['source'] == file].drop(columns='source')
+        assert batch.equals(single.drop(columns='source').astype(batch.dtypes))
+        assert (batch.dtypes[batch.dtypes.apply(lambda t: t.kind == 'f')] == 'float64').all()
+
+
+def test_extra_field_rejects_one_file(tmp_path):
+    files = copies(tmp_path, malformed=(2, lambda line: line + " 999"))
+    df = bulletin2df.extract_bulletin_files(files, log=False)
+    assert df.attrs['rejected'] == [files[2]]
+    assert list(df['source'].cat.categories) == files[:2] + files[3:]
+    assert len(df) == len(files) - 1
+
+
+def test_invalid_timestamp_rejects_one_file(tmp_path):
+    files = copies(tmp_path, malformed=(1, lambda line: line.replace(line.split(" ")[1], "2023XX120540", 1)))
+    df = bulletin2df.extract_bulletin_files(files, log=False)
+    assert df.attrs['rejected'] == [files[1]]
+    assert df.index.notna().all() and len(df) == len(files) - 1
+
+
+def test_process_bulletins_leaves_rejected_in_incoming(tmp_path):
+    files = copies(tmp_path / "incoming" / "meteo", malformed=(2, lambda line: line + " 999"))
+    ETLHandler(dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=False,
+                    incoming=str(tmp_path / "incoming"), archive=str(tmp_path / "archive"),
+                    database=str(tmp_path / "db.sqlite")))
+    assert ETLHandler.process_directory() == (len(files), len(files) - 1)
+    assert os.listdir(tmp_path / "incoming" / "meteo") == [os.path.basename(files[2])]
+    con = sqlite3.connect(tmp_path / "db.sqlite")
+    assert con.execute("select count(*) from meteo").fetchone()[0] == len(files) - 1
+    # as read, not rounded to float32
+    assert con.execute("select prestas0 from meteo order by dtm limit 1").fetchone()[0] == 663.3
+    con.close()
+
+
+def test_bulletin_without_data_is_rejected(tmp_path):
+    files = copies(tmp_path / "incoming" / "meteo")
+    with open(files[3]) as fh:
+        lines = fh.read().splitlines()
+    with open(files[3], 'w') as fh:
+        fh.write("\n".join(lines[:-1]) + "\n")
+    df = bulletin2df.extract_bulletin_files(files, log=False)
+    assert df.attrs['rejected'] == [files[3]]
+    assert len(df) == len(files) - 1
+
+    # reported, and left in incoming
+    ETLHandler(dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=False,
+                    incoming=str(tmp_path / "incoming"), archive=str(tmp_path / "archive"),
+                    database=str(tmp_path / "db.sqlite")))
+    assert ETLHandler.process_directory() == (len(files), len(files) - 1)
+    assert os.listdir(tmp_path / "incoming" / "meteo") == [os.path.basename(files[3])]
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Syncs of the Parquet mirror: partitions of newer rows, and of the years a load backfilled."""
+import os
+import sqlite3
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+from df2parquet import df2parquet  # noqa: E402
+
+
+def insert(db, dtms: list, value: float):
+    con = sqlite3.connect(db)
+    con.execute('CREATE TABLE IF NOT EXISTS "meteo" (dtm TEXT, tre200s0 REAL)')
+    con.executemany('INSERT INTO "meteo" VALUES (?, ?)', [(dtm, value) for dtm in dtms])
+    con.commit()
+    con.close()
+
+
+def test_sync_table(tmp_path):
+    db, root = str(tmp_path / "mkn.sqlite"), str(tmp_path / "mirror")
+    insert(db, ["2022-12-31 23:50:00", "2023-01-01 00:00:00"], 1.0)
+    assert df2parquet.sync_table(db, "meteo", root, verbose=False) == {"partitions": 2, "records": 2}
+    assert sorted(os.listdir(os.path.join(root, "mkn", "meteo"))) == ["_sync.json", "year=2022", "year=2023"]
+    assert df2parquet.sync_table(db, "meteo", root, verbose=False) == {"partitions": 0, "records": 0}
+
+    # newer rows rewrite the partition of the last mirrored year only
+    insert(db, ["2023-01-01 00:10:00"], 2.0)
+    assert df2parquet.sync_table(db, "meteo", root, verbose=False) == {"partitions": 1, "records": 2}
+
+    # a backfill older than the mirror is written only for the years the caller passes
+    insert(db, ["2021-06-01 00:00:00"], 3.0)
+    assert df2parquet.sync_table(db, "meteo", root, verbose=False) == {"partitions": 0, "records": 0}
+    assert df2parquet.sync_table(db, "meteo", root, years={2021}, verbose=False) == {"partitions": 1, "records": 1}
+    df = df2parquet.read_mirror(root, "mkn", "meteo")
+    assert sorted(pd.to_datetime(df["dtm"]).dt.year.unique()) == [2021, 2022, 2023]
+    assert len(df) == 4
+
+    # the mark stays at the latest timestamp mirrored
+    with open(os.path.join(root, "mkn", "meteo", "_sync.json")) as fh:
+        assert "2023-01-01 00:10:00" in fh.read()
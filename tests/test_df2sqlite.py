@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Upserts by precedence of source, and the UNIQUE natural key of tables loaded with the legacy dedup."""
+import sqlite3
+import pandas as pd
+import pytest
+from df2sqlite import df2sqlite
+from df2sqlite.bulk import BulkLoader
+from df2sqlite.df2sqlite import DuplicateKeyError
+
+PRECEDENCE = ['VRXA00', 'VMSW43']
+
+
+def frame(values: dict, source: str) -> pd.DataFrame:
+    """One row per timestamp: value."""
+    return pd.DataFrame({'tre200s0': list(values.values()), 'source': source},
+                        index=pd.DatetimeIndex(list(values), name='dtm'))
+
+
+def stored(db: str, tbl: str) -> list:
+    con = sqlite3.connect(db)
+    try:
+        return con.execute(f"select t.dtm, t.tre200s0, s.path from {tbl} t join _sources s on s.id = t.source_id "
+                           "order by t.dtm").fetchall()
+    finally:
+        con.close()
+
+
+@pytest.mark.parametrize('managed', [False, True])
+def test_upsert_precedence(tmp_path, managed):
+    db = str(tmp_path / "db.sqlite")
+    load = dict(db=db, tbl='meteo', precedence=PRECEDENCE, managed=managed, verbose=False)
+    df2sqlite.upsert2sqlite(frame({'2024-01-01 00:00': 1.0, '2024-01-01 00:10': 1.0}, '/in/VMSW43.1.zip'), **load)
+    # ranks higher: replaces the row of its timestamp, adds the other
+    df2sqlite.upsert2sqlite(frame({'2024-01-01 00:10': 2.0, '2024-01-01 00:20': 2.0}, '/in/VRXA00.2'), **load)
+    # ranks lower: is added where nothing is stored only
+    df2sqlite.upsert2sqlite(frame({'2024-01-01 00:10': 3.0, '2024-01-01 00:30': 3.0}, '/in/VMSW43.3.zip'), **load)
+    # ranks the same: replaces
+    df2sqlite.upsert2sqlite(frame({'2024-01-01 00:20': 4.0}, '/in/VRXA00.4'), **load)
+
+    # managed tables store epoch seconds
+    rows = [(pd.Timestamp(dtm, unit='s') if managed else pd.Timestamp(dtm), value, path)
+            for dtm, value, path in stored(db, 'meteo')]
+    assert rows == [(pd.Timestamp('2024-01-01 00:00'), 1.0, '/in/VMSW43.1.zip'),
+                    (pd.Timestamp('2024-01-01 00:10'), 2.0, '/in/VRXA00.2'),
+                    (pd.Timestamp('2024-01-01 00:20'), 4.0, '/in/VRXA00.4'),
+                    (pd.Timestamp('2024-01-01 00:30'), 3.0, '/in/VMSW43.3.zip')]
+
+
+def test_upsert_without_precedence_keeps_first(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    df2sqlite.upsert2sqlite(frame({'2024-01-01': 1.0}, '/in/VRXA00.1'), db, 'meteo', verbose=False)
+    res = df2sqlite.upsert2sqlite(frame({'2024-01-01': 2.0}, '/in/VMSW43.2.zip'), db, 'meteo', verbose=False)
+    assert res == {'records_offered': 1, 'records_changed': 0}
+    assert stored(db, 'meteo') == [('2024-01-01 00:00:00', 1.0, '/in/VRXA00.1')]
+
+
+def legacy(db: str, rows: list) -> None:
+    """A table loaded by the legacy to_sql path: text dtm, source column, no UNIQUE key."""
+    df = pd.DataFrame(rows, columns=['dtm', 'tre200s0', 'source'])
+    con = sqlite3.connect(db)
+    df.to_sql('meteo', con, index=False)
+    con.close()
+
+
+def test_unique_key_refuses_conflicts(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    legacy(db, [('2024-01-01 00:00:00', 1.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:00:00', 2.0, '/in/VRXA00.1'),
+                ('2024-01-01 00:10:00', 1.0, '/in/VMSW43.1.zip')])
+    con = sqlite3.connect(db)
+    with pytest.raises(DuplicateKeyError):
+        df2sqlite.ensure_unique_key(con, 'meteo', ['dtm'], verbose=False)
+    con.rollback()
+    # nothing removed, no key
+    assert con.execute("select count(*) from meteo").fetchone()[0] == 3
+    assert not df2sqlite.has_unique_key(con, 'meteo', ['dtm'])
+    con.close()
+
+    # upserts refuse to load as well, and leave the table as it was
+    with pytest.raises(DuplicateKeyError):
+        df2sqlite.upsert2sqlite(frame({'2024-01-01 00:20': 3.0}, '/in/VRXA00.2'), db, 'meteo', verbose=False)
+    con = sqlite3.connect(db)
+    assert con.execute("select count(*) from meteo").fetchone()[0] == 3
+    con.close()
+
+
+def test_unique_key_resolves_by_precedence(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    legacy(db, [('2024-01-01 00:00:00', 1.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:00:00', 2.0, '/in/VRXA00.1'),
+                ('2024-01-01 00:10:00', 1.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:10:00', 1.0, '/in/VMSW43.2.zip')])
+    con = sqlite3.connect(db)
+    res = df2sqlite.resolve_duplicates(con, 'meteo', ['dtm'], precedence=PRECEDENCE, verbose=False)
+    con.commit()
+    assert res == {'identical': 1, 'precedence': 1, 'conflicting': 0}
+    assert con.execute("select dtm, tre200s0, source from meteo order by dtm").fetchall() == [
+        ('2024-01-01 00:00:00', 2.0, '/in/VRXA00.1'), ('2024-01-01 00:10:00', 1.0, '/in/VMSW43.1.zip')]
+    # the rows removed are kept
+    assert con.execute("select count(*) from _meteo_duplicates").fetchone()[0] == 2
+    con.close()
+
+
+def test_dedup_keep_first(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    legacy(db, [('2024-01-01 00:00:00', 1.0, '/in/a'), ('2024-01-01 00:00:00', 2.0, '/in/b')])
+    res = df2sqlite.dedup(db, ['meteo'], keep='first', verbose=False)
+    assert res['meteo']['conflicting'] == 1
+    con = sqlite3.connect(db)
+    assert con.execute("select dtm, tre200s0 from meteo").fetchall() == [('2024-01-01 00:00:00', 1.0)]
+    assert df2sqlite.has_unique_key(con, 'meteo', ['dtm'])
+    con.close()
+
+
+def test_session_appends_as_df2sqlite(tmp_path):
+    first = frame({'2024-01-01 00:00': 1.0, '2024-01-01 00:10': 1.0}, '/in/VMSW43.1.zip')
+    again = frame({'2024-01-01 00:10': 1.0, '2024-01-01 00:20': 2.0}, '/in/VMSW43.1.zip')
+    db, bulk = str(tmp_path / "db.sqlite"), str(tmp_path / "bulk.sqlite")
+    for df in (first, again):
+        df2sqlite.df2sqlite(df, db, 'meteo', verbose=False)
+    with BulkLoader(bulk, verbose=False) as session:
+        for df in (first, again):
+            session.load(df, 'meteo', upsert=False)
+    # appended, the duplicate row removed, no UNIQUE key created
+    assert stored(bulk, 'meteo') == stored(db, 'meteo') == [
+        ('2024-01-01 00:00:00', 1.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:10:00', 1.0, '/in/VMSW43.1.zip'),
+        ('2024-01-01 00:20:00', 2.0, '/in/VMSW43.1.zip')]
+    con = sqlite3.connect(bulk)
+    assert not df2sqlite.has_unique_key(con, 'meteo', ['dtm'])
+    con.close()
+
+
+def test_append_within_session_reports_duplicates_unknown(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    df = frame({'2024-01-01 00:00': 1.0}, '/in/VMSW43.1.zip')
+    with BulkLoader(db, verbose=False) as session:
+        assert df2sqlite.append_to_sqlite_db(df, db, 'meteo', session=session) == {
+            'records_inserted': 1, 'duplicate_records': None}
+        df2sqlite.append_to_sqlite_db(df, db, 'meteo', session=session)
+    assert len(stored(db, 'meteo')) == 1
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""The native reader of EBAS NASA Ames 1001 files, and the fallback to nappy for other formats only."""
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("jklutils")
+from extract2df import ebas2df  # noqa: E402
+
+VNAMES = ["end_time of measurement, days from the file reference point", "ozone, nmol/mol",
+          "numflag ozone, no unit"]
+
+
+def nasa_ames(path, rows: list, ffi=1001) -> str:
+    """Write an hourly EBAS ozone file of 2020, VMISS 999.99 for ozone."""
+    ncom = ["Data definition: EBAS_1.1", "Station code: KE0001R", "starttime endtime O3 flag_O3"]
+    header = ["", "Jane Doe", "KE01L, Kenya Meteorological Department", "Test data", "GAW-WDCRG", "1 1",
+              "2020 01 01 2020 06 30", "0.041667", "days from file reference point", str(len(VNAMES)),
+              "1 1 1", "9999.999999 999.99 9.999"] + VNAMES + ["0", str(len(ncom))] + ncom
+    header[0] = f"{len(header)} {ffi}"
+    path.write_text("\n".join(header + [" ".join(str(x) for x in row) for row in rows]) + "\n")
+    return str(path)
+
+
+ROWS = [[0.0, 0.041667, 41.5, 0.0], [0.041667, 0.083333, 999.99, 0.999], [0.083333, 0.125, 43.25, 0.0]]
+
+
+def test_read_nasa_ames_file(tmp_path):
+    header, data = ebas2df.read_nasa_ames_file(nasa_ames(tmp_path / "o3.nas", ROWS))
+    assert (header['FFI'], header['NV'], header['DATE']) == (1001, 3, [2020, 1, 1])
+    assert header['VMISS'] == [9999.999999, 999.99, 9.999]
+    assert header['VNAME'] == VNAMES
+    assert header['NCOM'][-1] == "starttime endtime O3 flag_O3"
+    expected = np.array(ROWS)
+    expected[1, 2] = np.nan
+    np.testing.assert_array_equal(data, expected)
+
+
+def test_extract_nasa_ames_file(tmp_path):
+    res = ebas2df.extract_nasa_ames_file(nasa_ames(tmp_path / "o3.nas", ROWS))
+    df, mappings = res['df'], res['mappings']
+    assert list(df.columns) == ["starttime", "endtime", "O3", "flag_O3", "dtm"]
+    assert mappings['short_name'].tolist() == ["starttime", "endtime", "O3", "flag_O3"]
+    assert mappings['unit'].tolist()[2] == " nmol/mol"
+    assert df['O3'].isna().tolist() == [False, True, False]
+    # as the baseline extractor: hours from the reference date, by starttime / DX
+    pd.testing.assert_series_equal(
+        df['dtm'], pd.Timestamp('2020-01-01') + pd.to_timedelta(round(df['starttime'] / 0.041667), unit='h'),
+        check_names=False, check_dtype=False)
+
+
+def test_parse_errors_are_not_passed_to_nappy(tmp_path, monkeypatch):
+    calls = []
+
+    def read_nappy(file):
+        calls.append(file)
+        raise ImportError("nappy")
+
+    monkeypatch.setattr(ebas2df, '_read_nappy', read_nappy)
+    malformed = nasa_ames(tmp_path / "malformed.nas", ROWS[:2] + [ROWS[2][:3]])
+    with pytest.raises(ValueError):
+        ebas2df.read_nasa_ames_file(malformed)
+    assert ebas2df.extract_nasa_ames_file(malformed)['df'].empty
+    assert calls == []
+
+    # other FFIs are read with nappy
+    other = nasa_ames(tmp_path / "other.nas", ROWS, ffi=2010)
+    with pytest.raises(ebas2df.UnsupportedFormatError):
+        ebas2df.read_nasa_ames_file(other)
+    ebas2df.extract_nasa_ames_file(other)
+    assert calls == [other]
+
+
+def test_native_reader_as_nappy(tmp_path):
+    pytest.importorskip("nappy")
+    file = nasa_ames(tmp_path / "o3.nas", ROWS)
+    header, data = ebas2df.read_nasa_ames_file(file)
+    expected_header, expected = ebas2df._read_nappy(file)
+    np.testing.assert_array_equal(data, expected)
+    for key in ('FFI', 'DATE', 'DX', 'XNAME', 'VNAME', 'VMISS', 'NCOM'):
+        assert header[key] == expected_header[key]
+
+
+def test_ebas2sqlite_skips_files_loaded(tmp_path):
+    folder = tmp_path / "ozone"
+    folder.mkdir()
+    nasa_ames(folder / "o3.nas", ROWS)
+    db = str(tmp_path / "db.sqlite")
+    res = ebas2df.ebas2sqlite(str(folder), db, verbose=False)
+    assert res == dict(files=1, loaded=1, skipped=0, failed=0, records=len(ROWS))
+    con = sqlite3.connect(db)
+    assert con.execute("select count(*) from ebas_ozone").fetchone()[0] == len(ROWS)
+    assert con.execute("select count(*) from _ingest_ledger").fetchone()[0] == 1
+    assert sorted(con.execute("select short_name from ebas_mappings_ozone")) == [
+        ("O3",), ("endtime",), ("flag_O3",), ("starttime",)]
+    con.close()
+
+    res = ebas2df.ebas2sqlite(str(folder), db, verbose=False)
+    assert (res['loaded'], res['skipped']) == (0, 1)
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Paging and incremental resume of the KPLC smart meter download, against a stubbed portal session."""
+import json
+import sqlite3
+import pandas as pd
+import pytest
+
+pytest.importorskip("matplotlib")
+pytest.importorskip("jklutils")
+from extract2df import kplc2df  # noqa: E402
+
+
+class Response:
+    def __init__(self, content=b"", status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class Portal:
+    """Serves the login, the column headers and the load profile queries of the portal, newest row first."""
+
+    def __init__(self, times):
+        self.rows = [{"SJ": t.strftime("%Y-%m-%d %H:%M:%S"), "ZXYG": str(0.5 * i), "UA": "230.1"}
+                     for i, t in enumerate(times)][::-1]
+        self.queries = []
+
+    def session(self):
+        return Session(self)
+
+
+class Session:
+    def __init__(self, portal):
+        self.portal = portal
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def get(self, url):
+        if url.endswith("fhqx_en_US.js"):
+            return Response(b"fhqx_title_sj='Time';\r\nfhqx_title_zxyg='Total cumulative energy(T1+T2)(kWh)';\r\n"
+                            b"fhqx_title_ua='Voltage A';\r\n")
+        return Response()
+
+    def post(self, url, data=None, headers=None):
+        if "login!login.do" in url:
+            return Response(b"ok")
+        self.portal.queries.append(dict(data))
+        start, limit = int(data["start"]), int(data["limit"])
+        rows = [row for row in self.portal.rows if data["ksrq"] <= row["SJ"][:10] <= data["jsrq"]]
+        return Response(json.dumps({"rows": len(rows), "result": rows[start:start + limit]}).encode())
+
+
+@pytest.fixture
+def portal(monkeypatch):
+    portal = Portal(pd.date_range("2024-01-01", periods=10, freq="6h"))
+    monkeypatch.setattr(kplc2df.requests, "session", portal.session)
+    return portal
+
+
+def test_pages(portal):
+    pages = list(kplc2df.iter_kplc_smartmeter_load_profile("usr", "pwd", "2024-01-01", "2024-01-31", page_size=4,
+                                                           verbose=False))
+    assert [len(page) for page in pages] == [4, 4, 2]
+    assert [q["start"] for q in portal.queries] == ["0", "4", "8"]
+    df = pd.concat(pages)
+    assert list(df.columns[:3]) == ["Time", "Total cumulative energy(T1+T2)(kWh)", "Voltage A"]
+    assert df.index.sort_values().equals(pd.date_range("2024-01-01", periods=10, freq="6h", name="dtm"))
+    assert df["Voltage A"].dtype == "float64"
+
+
+def test_resume_from_latest(portal, tmp_path):
+    db = str(tmp_path / "kplc.sqlite")
+    res = kplc2df.kplc2sqlite("usr", "pwd", db, since="2024-01-01", till="2024-01-31", page_size=4, verbose=False)
+    assert (res["rows"], res["records_changed"]) == (10, 10)
+
+    # 6 more rows: the next run queries from the day of the latest row stored, and adds only newer rows
+    portal.__init__(pd.date_range("2024-01-01", periods=16, freq="6h"))
+    res = kplc2df.kplc2sqlite("usr", "pwd", db, till="2024-01-31", page_size=4, verbose=False)
+    assert {q["ksrq"] for q in portal.queries} == {"2024-01-03"}
+    assert res["since"] == "2024-01-03"
+    assert (res["rows"], res["records_changed"]) == (8, 6)
+
+    con = sqlite3.connect(db)
+    count, distinct, latest = con.execute("select count(*), count(distinct dtm), max(dtm) from kplc_smartmeter").fetchone()
+    con.close()
+    assert (count, distinct) == (16, 16)
+    assert pd.Timestamp(latest) == pd.Timestamp("2024-01-04 18:00")
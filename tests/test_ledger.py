@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Files recorded in the ingest ledger are skipped, by path, size and mtime, or by content."""
+import os
+import glob
+import shutil
+import sqlite3
+from df2sqlite.ledger import IngestLedger
+from etl.etl import ETLHandler
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def test_is_loaded(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    file = tmp_path / "tei49i-20230101.zip"
+    file.write_bytes(b"content")
+    ledger = IngestLedger(db)
+    assert not ledger.is_loaded(str(file))
+    ledger.record(str(file), 'tei49i', 10)
+    assert ledger.is_loaded(str(file))
+
+    # same content, touched or copied elsewhere
+    os.utime(file, (0, 0))
+    copy = tmp_path / "copy.zip"
+    shutil.copy(file, copy)
+    assert ledger.is_loaded(str(file)) and ledger.is_loaded(str(copy))
+    # different content
+    copy.write_bytes(b"other content")
+    assert not ledger.is_loaded(str(copy))
+    ledger.close()
+
+    # the ledger persists in the DB
+    ledger = IngestLedger(db)
+    assert ledger.is_loaded(str(file))
+    ledger.close()
+
+
+def test_process_directory_skips_loaded_files(tmp_path, monkeypatch):
+    files = sorted(glob.glob(os.path.join(DATA, "tei49i", "*.zip")))
+    incoming = tmp_path / "incoming" / "tei49i"
+    config = dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=True,
+                  incoming=str(tmp_path / "incoming"), archive=str(tmp_path / "archive"),
+                  database=str(tmp_path / "db.sqlite"))
+    extracted = []
+    extract_file = ETLHandler.extract_file.__func__
+
+    def spy(cls, file, *args, **kwargs):
+        extracted.append(file)
+        return extract_file(cls, file, *args, **kwargs)
+
+    monkeypatch.setattr(ETLHandler, 'extract_file', classmethod(spy))
+
+    shutil.copytree(os.path.dirname(files[0]), incoming)
+    ETLHandler(config)
+    assert ETLHandler.process_directory() == (len(files), len(files))
+    assert len(extracted) == len(files)
+    con = sqlite3.connect(tmp_path / "db.sqlite")
+    rows = con.execute("select count(*) from tei49i").fetchone()[0]
+    assert con.execute("select count(*) from _ingest_ledger").fetchone()[0] == len(files)
+    con.close()
+
+    # the same files delivered again are not extracted, and stay in incoming
+    extracted.clear()
+    shutil.copytree(os.path.dirname(files[0]), incoming, dirs_exist_ok=True)
+    ETLHandler(config)
+    assert ETLHandler.process_directory() == (len(files), 0)
+    assert extracted == []
+    assert sorted(os.listdir(incoming)) == [os.path.basename(file) for file in files]
+    con = sqlite3.connect(tmp_path / "db.sqlite")
+    assert con.execute("select count(*) from tei49i").fetchone()[0] == rows
+    con.close()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Timestamps and columns of MILOS 500 .LOG files, as the baseline milos2df built them."""
+import numpy as np
+import pandas as pd
+from extract2df import milos2df
+
+
+def log(path, rows: list) -> str:
+    """Write a .LOG file: a header line, then rows of H M S, values and 2 trailing columns."""
+    path.write_text("MILOS 500\n" + "".join(" ".join(str(x) for x in row) + " 0 0\n" for row in rows))
+    return str(path)
+
+
+def values(i: int, n: int) -> list:
+    return [f"{i}{j:02d}.5" for j in range(n)]
+
+
+def test_round_up_and_previous_day(tmp_path):
+    # stamped at second 59: rounded up to the full minute; the first row, 23 59 59, is midnight of the file's day
+    file = log(tmp_path / "001217.LOG", [[23, 59, 59] + values(1, 11), [0, 0, 59] + values(2, 11),
+                                         [0, 1, 59] + values(3, 11)])
+    df = milos2df.milos2df(file)
+    assert df.index.name == 'dtm'
+    assert list(df.index) == [pd.Timestamp('2000-12-17 00:00'), pd.Timestamp('2000-12-17 00:01'),
+                              pd.Timestamp('2000-12-17 00:02')]
+    # surface ozone comes first and is moved to the end
+    assert list(df.columns) == milos2df.COLUMNS
+    assert df.iloc[0].tolist() == [float(x) for x in values(1, 11)[1:] + values(1, 11)[:1]]
+
+
+def test_whole_seconds_and_ten_columns(tmp_path):
+    rows = [[0, 0, 0] + values(1, 10), [0, 1, 0] + values(2, 10)]
+    rows[1][5] = '///'
+    df = milos2df.milos2df(log(tmp_path / "031211.LOG", rows))
+    assert list(df.index) == [pd.Timestamp('2003-12-11 00:00'), pd.Timestamp('2003-12-11 00:01')]
+    # no surface ozone; '///' is missing
+    assert df['itosurs0'].isna().all()
+    assert np.isnan(df.iloc[1, 2]) and df.iloc[1, 1] == 201.5
+
+
+def test_dir(tmp_path):
+    log(tmp_path / "001218.LOG", [[0, 0, 0] + values(1, 10)])
+    (tmp_path / "sub").mkdir()
+    log(tmp_path / "sub" / "001217.LOG", [[23, 59, 59] + values(1, 11), [0, 0, 59] + values(2, 11)])
+    df = milos2df.milos_dir2df(str(tmp_path))
+    assert list(df.index) == [pd.Timestamp('2000-12-17 00:00'), pd.Timestamp('2000-12-17 00:01'),
+                              pd.Timestamp('2000-12-18 00:00')]
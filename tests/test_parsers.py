@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Dispatch of files to the registered parsers, and their output against the extraction of the baseline loader."""
+import os
+import glob
+import zipfile
+import pandas as pd
+import pytest
+from etl import parsers
+from etl.etl import ETLHandler
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+@pytest.mark.parametrize('basename, name', [
+    ('tei49i-20230101.zip', 'tei49i'),
+    ('tei49c-20230101.zip', 'tei49c'),
+    ('VMSW43.202206270900.zip', 'bulletin'),
+    ('VRXA00.202305120520', 'bulletin'),
+    ('CFKADS2320-20220101-000000Z-DataLog_User.dat', 'picarro'),
+    ('DataLog_User_Sync.zip', 'picarro'),
+    ('tei49i-20230101.txt', None),
+    ('notes.zip', None),
+])
+def test_match(basename, name):
+    parser = parsers.match(basename)
+    assert (parser and parser['name']) == name
+
+
+def test_register(monkeypatch):
+    monkeypatch.setattr(parsers, 'PARSERS', dict(parsers.PARSERS))
+    monkeypatch.setattr(parsers, '_dispatch', None)
+    read = lambda buffer, **options: pd.DataFrame()
+    parsers.register('ae33', r'AE33_.*\.dat', read=read, tbl='ae33')
+    assert parsers.match('AE33_AE33-S01_20230101.dat')['tbl'] == 'ae33'
+    # replacing a parser keeps its rank: tei49i files are still claimed before a catch-all registered later
+    parsers.register('catchall', r'.*', read=read)
+    parsers.register('tei49i', r'tei49i.*\.zip', read=read)
+    assert parsers.match('tei49i-20230101.zip')['name'] == 'tei49i'
+    assert parsers.match('notes.zip')['name'] == 'catchall'
+    with pytest.raises(ValueError):
+        parsers.register('not a name', r'.*', read=read)
+
+
+@pytest.fixture
+def etl(tmp_path):
+    ETLHandler(dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=False,
+                    incoming=str(tmp_path), archive=None, database=str(tmp_path / "db.sqlite")))
+    return ETLHandler
+
+
+def baseline_tei49(file: str, drop: list, seconds: bool) -> pd.DataFrame:
+    """What the baseline extract_file returned for TEI 49 files ('T' of pandas < 3 spelled 'min')."""
+    with zipfile.ZipFile(file) as zf:
+        df = pd.read_csv(zf.open(zf.namelist()[0]), sep=' +', engine='python')
+    df['dtm'] = pd.to_datetime(df['pcdate'] + ' ' + df['pctime'])
+    if not seconds:
+        df['dtm'] = df['dtm'].apply(lambda x: x.round(freq='min'))
+    df.drop(columns=[df.columns[i] if isinstance(i, int) else i for i in drop], inplace=True)
+    df['source'] = file
+    return df.set_index('dtm')
+
+
+@pytest.mark.parametrize('kind, drop', [('tei49i', [4, 'hio3']), ('tei49c', ['o3lt'])])
+@pytest.mark.parametrize('seconds', [False, True])
+def test_tei49_as_baseline(etl, kind, drop, seconds):
+    etl.seconds = seconds
+    files = sorted(glob.glob(os.path.join(DATA, kind, "*.zip")))
+    assert files
+    for file in files:
+        pd.testing.assert_frame_equal(etl.extract_file(file, tbl=kind), baseline_tei49(file, drop, seconds),
+                                      check_index_type=False)
+
+
+def test_bulletin_as_baseline(etl):
+    files = sorted(glob.glob(os.path.join(DATA, "meteo", "*")))
+    assert files
+    for file in files:
+        expected = pd.read_csv(file, skiprows=1, header=1, sep=' ', na_values='/')
+        expected['dtm'] = pd.to_datetime(expected['zzzztttt'], format='%Y%m%d%H%M')
+        expected['source'] = file
+        pd.testing.assert_frame_equal(etl.extract_file(file, tbl='meteo'), expected.set_index('dtm'),
+                                      check_index_type=False)
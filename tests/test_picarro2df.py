@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""Picarro files parsed with the C engine, and 1-minute aggregates of files split within a minute."""
+import os
+import sqlite3
+import zipfile
+import numpy as np
+import pandas as pd
+import pytest
+from benchmarks import generators
+from df2sqlite import schema
+from etl.etl import ETLHandler
+from extract2df import picarro2df
+
+
+def read(files: list) -> pd.DataFrame:
+    frames = []
+    for file in files:
+        with zipfile.ZipFile(file) as zf:
+            frames.append(picarro2df.read_picarro(zf.open(zf.namelist()[0])))
+    return pd.concat(frames)
+
+
+@pytest.fixture(scope='module')
+def files(tmp_path_factory) -> list:
+    # hourly files starting 13 s past the hour: the first minute of each hour spans two files
+    return generators.picarro(str(tmp_path_factory.mktemp('g2401')), days=0.125, seed=3)
+
+
+def test_read_picarro(files):
+    with zipfile.ZipFile(files[0]) as zf:
+        df = picarro2df.read_picarro(zf.open(zf.namelist()[0]))
+        raw = pd.read_csv(zf.open(zf.namelist()[0]), sep=r'\s+')
+    assert set(df.columns) <= picarro2df.COLUMNS and 'CO2_sync' in df.columns and 'EPOCH_TIME' not in df.columns
+    assert 'FRAC_DAYS_SINCE_JAN1' not in df.columns and len(df) == len(raw)
+    # EPOCH_TIME (UTC) and DATE, TIME agree to the millisecond
+    local = pd.to_datetime(raw['DATE'] + ' ' + raw['TIME'])
+    assert (abs(df.index - pd.DatetimeIndex(local)) <= pd.Timedelta('1ms')).all()
+
+
+@pytest.mark.parametrize('split', ['2022-01-01 00:10:07', '2022-01-01 00:10:00', '2022-01-01 00:10:57'])
+def test_combine_split(files, split):
+    df = read(files[:1])
+    first, second = df[df.index < split], df[df.index >= split]
+    a, b = picarro2df.aggregate(first), picarro2df.aggregate(second)
+    both = a.index.intersection(b.index)
+    combined = pd.concat([a.drop(both), picarro2df.combine(a.loc[both], b.loc[both]), b.drop(both)])
+    expected = picarro2df.aggregate(df)
+    pd.testing.assert_frame_equal(combined[expected.columns], expected, check_freq=False, rtol=1e-9)
+
+
+def test_load_aggregates_of_split_files(tmp_path, files):
+    # each file split in two within a minute, and loaded file by file
+    incoming = tmp_path / "incoming" / "g2401"
+    os.makedirs(incoming)
+    for file in files:
+        with zipfile.ZipFile(file) as zf:
+            name = zf.namelist()[0]
+            header, *lines = zf.read(name).decode().splitlines()
+        stem = os.path.splitext(name)[0]
+        # 5-s rows starting 13 s past the hour: an odd number of rows puts the split within a minute
+        split = len(lines) // 2 | 1
+        for part, rows in ((1, lines[:split]), (2, lines[split:])):
+            if rows:
+                (incoming / f"{stem}-{part}.dat").write_text("\n".join([header] + rows) + "\n")
+    parts = len(os.listdir(incoming))
+    db = str(tmp_path / "db.sqlite")
+    ETLHandler(dict(verbose=False, index='dtm', seconds=True, logfile=None, ledger=True, archive=None,
+                    incoming=str(tmp_path / "incoming"), database=db, aggregate={'g2401': '1min'},
+                    aggregate_raw=False))
+    assert parts > len(files) and ETLHandler.process_directory() == (parts, parts)
+
+    con = sqlite3.connect(db)
+    stored = pd.read_sql('select * from "g2401_1min" order by dtm', con)
+    stored.index = pd.DatetimeIndex(schema.to_datetime(stored.pop('dtm'), schema.is_epoch(con, 'g2401_1min')),
+                                    name='dtm')
+    assert con.execute("select count(*) from sqlite_master where name = 'g2401'").fetchone()[0] == 0
+    con.close()
+    expected = picarro2df.aggregate(read(files))
+    assert (stored.index == expected.index).all() and stored['n'].sum() == expected['n'].sum()
+    measures = [c for c in expected.columns if c in picarro2df.MEASURES or c.endswith('_sd')]
+    np.testing.assert_allclose(stored[measures].to_numpy(float), expected[measures].to_numpy(float), rtol=1e-9)
+    np.testing.assert_array_equal(stored['ALARM_STATUS'], expected['ALARM_STATUS'])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""ETLHandler.process_url against a local HTTP server serving sample bulletins of data/."""
+import os
+import glob
+import shutil
+import sqlite3
+import threading
+import functools
+import collections
+import http.server
+import pytest
+from etl.etl import ETLHandler
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+# bulletins named as a filebrowser lists them (cf. etl.LISTING)
+FILES = sorted(glob.glob(os.path.join(DATA, "meteo", "*.zip"))) + [os.path.join(DATA, "VMSW43.200001010001.001")]
+
+
+class Handler(http.server.SimpleHTTPRequestHandler):
+    """Serves a directory; the first failures[name] requests of a file are answered with 503."""
+
+    def __init__(self, *args, requests=None, failures=None, **kwargs):
+        self.requests = requests
+        self.failures = failures
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        name = os.path.basename(self.path)
+        self.requests[name] += 1
+        if self.requests[name] <= self.failures.get(name, 0):
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve copies of the sample bulletins below <url>/meteo, with an HTML listing of them."""
+    folder = tmp_path / "srv" / "meteo"
+    folder.mkdir(parents=True)
+    for file in FILES:
+        shutil.copy(file, folder)
+    (folder / "index.html").write_text("".join(f"<a>{os.path.basename(f)}</a>" for f in FILES))
+    requests, failures = collections.Counter(), {}
+    handler = functools.partial(Handler, directory=str(tmp_path / "srv"), requests=requests, failures=failures)
+    srv = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield dict(url=f"http://127.0.0.1:{srv.server_port}/meteo/", names=[os.path.basename(f) for f in FILES],
+                   requests=requests, failures=failures)
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def handler(tmp_path):
+    ETLHandler(dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=False,
+                    incoming=str(tmp_path / "incoming"), archive=None, database=str(tmp_path / "db.sqlite")))
+    return ETLHandler
+
+
+def rows(tmp_path) -> int:
+    con = sqlite3.connect(tmp_path / "db.sqlite")
+    try:
+        return con.execute("select count(*) from meteo").fetchone()[0]
+    finally:
+        con.close()
+
+
+def expected_rows() -> int:
+    """Rows of the sample bulletins, loaded file by file."""
+    return sum(len(ETLHandler.extract_file(file, tbl='meteo')) for file in FILES)
+
+
+def test_loads_listing(server, tmp_path):
+    etl = handler(tmp_path)
+    listed, loaded = etl.process_url(server["url"], concurrency=3, retries=0, backoff=0)
+    assert listed == loaded == len(server["names"])
+    assert rows(tmp_path) == expected_rows()
+    # one request for the listing, one per file
+    assert all(server["requests"][name] == 1 for name in server["names"])
+
+
+def test_retries(server, tmp_path):
+    retried = server["names"][:2]
+    server["failures"].update({name: 2 for name in retried})
+    etl = handler(tmp_path)
+    listed, loaded = etl.process_url(server["url"], concurrency=3, retries=2, backoff=0)
+    assert listed == loaded == len(server["names"])
+    assert [server["requests"][name] for name in retried] == [3, 3]
+    assert rows(tmp_path) == expected_rows()
+
+
+def test_errors(server, tmp_path):
+    failing = server["names"][0]
+    server["failures"][failing] = 10
+    files = server["names"] + ["VRXA00.209901010000.001"]
+    etl = handler(tmp_path)
+    listed, loaded = etl.process_url(server["url"], concurrency=3, retries=1, backoff=0, files=files)
+    # the file failing more often than retried, and the file not found, are not loaded; the others are
+    assert (listed, loaded) == (len(files), len(files) - 2)
+    assert server["requests"][failing] == 2
+    assert server["requests"]["VRXA00.209901010000.001"] == 1
+    assert rows(tmp_path) == expected_rows() - len(etl.extract_file(FILES[0], tbl='meteo'))
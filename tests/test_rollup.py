@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""Hourly and daily rollups against a pandas resample of the raw rows, rebuilt and updated incrementally."""
+import sqlite3
+import numpy as np
+import pandas as pd
+import pytest
+from df2sqlite import df2sqlite, rollup, schema
+
+
+def raw(start: str, periods: int, seed: int) -> pd.DataFrame:
+    """10-minute meteo rows: temperature (with gaps), wind direction and speed."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'tre200s0': rng.normal(15, 5, periods).round(1),
+                       'dkl010z0': rng.uniform(0, 360, periods).round(),
+                       'fkl010z0': rng.uniform(0, 10, periods).round(1)},
+                      index=pd.date_range(start, periods=periods, freq='10min', name='dtm'))
+    df.iloc[::7, 0] = np.nan
+    return df
+
+
+def expected(df: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """The rollup of a pandas resample."""
+    r = df.resample(freq)
+    t = r['tre200s0']
+    u = (df['fkl010z0'] * np.sin(np.radians(df['dkl010z0']))).resample(freq).mean()
+    v = (df['fkl010z0'] * np.cos(np.radians(df['dkl010z0']))).resample(freq).mean()
+    res = pd.DataFrame({'n': r.size(), 'tre200s0': t.mean(), 'tre200s0_min': t.min(), 'tre200s0_max': t.max(),
+                        'tre200s0_n': t.count(), 'fkl010z0': r['fkl010z0'].mean(),
+                        'dkl010z0': (np.degrees(np.arctan2(u, v)) + 360) % 360, 'fkl010z0_vec': np.hypot(u, v)})
+    res['coverage'] = res['n'] * 600 / pd.Timedelta(freq).total_seconds()
+    return res[res['n'] > 0]
+
+
+def stored(db: str, tbl: str, columns: list) -> pd.DataFrame:
+    con = sqlite3.connect(db)
+    df = pd.read_sql(f"select * from {tbl} order by dtm", con)
+    df['dtm'] = schema.to_datetime(df['dtm'], schema.is_epoch(con, tbl))
+    con.close()
+    return df.set_index('dtm')[columns]
+
+
+def same(db: str, df: pd.DataFrame):
+    for freq, pdfreq in (('1h', '1h'), ('1d', '1D')):
+        exp = expected(df, pdfreq)
+        pd.testing.assert_frame_equal(stored(db, f"meteo_{freq}", list(exp.columns)), exp, check_dtype=False,
+                                      check_freq=False, check_names=False, check_index_type=False,
+                                      atol=1e-9)
+
+
+def test_touched():
+    dtm = pd.to_datetime(['2024-01-01 00:10', '2024-01-01 00:50', '2024-01-01 01:00', '2024-01-01 03:20'])
+    t0 = int(pd.Timestamp('2024-01-01').timestamp())
+    assert rollup.touched(dtm, 3600) == [(t0, t0 + 2 * 3600), (t0 + 3 * 3600, t0 + 4 * 3600)]
+
+
+@pytest.mark.parametrize('managed', [False, True])
+def test_update_rollups(tmp_path, managed):
+    db = str(tmp_path / "db.sqlite")
+    df = raw('2024-01-01 00:00', 2 * 144 - 3, seed=1)
+    df2sqlite.upsert2sqlite(df, db, 'meteo', managed=managed, verbose=False)
+    res = rollup.update_rollups(db, 'meteo', verbose=False)
+    assert res == {'meteo_1h': 48, 'meteo_1d': 2}
+    same(db, df)
+
+    # new rows: the rest of the last hour of day 2 and the first two hours of day 3; only their buckets are
+    # recomputed
+    new = raw('2024-01-02 23:30', 12, seed=2)
+    df2sqlite.upsert2sqlite(new, db, 'meteo', managed=managed, verbose=False)
+    res = rollup.update_rollups(db, 'meteo', dtm=new.index, verbose=False)
+    assert res == {'meteo_1h': 3, 'meteo_1d': 2}
+    same(db, pd.concat([df, new]))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""In-place migration of tables with text timestamps to managed WITHOUT ROWID tables keyed on epoch dtm."""
+import sqlite3
+import pandas as pd
+import pytest
+from df2sqlite import schema
+from df2sqlite.df2sqlite import DuplicateKeyError
+from extract2df import milos2df
+
+ROWS = [('2024-01-01 00:10:00', 2.5, 80, '/in/VRXA00.2'), ('2024-01-01 00:00:00', 1.5, 70, '/in/VRXA00.1'),
+        ('2024-01-01 00:20:00', None, 90, '/in/VRXA00.3')]
+
+
+def legacy(db: str, rows: list) -> None:
+    """A meteo table as the legacy to_sql path wrote it, with its index on dtm."""
+    df = pd.DataFrame(rows, columns=['dtm', 'tre200s0', 'iii', 'source'])
+    con = sqlite3.connect(db)
+    df.to_sql('meteo', con, index=False)
+    con.execute('create index ix_meteo_dtm on meteo (dtm)')
+    con.execute('create index ix_meteo_iii on meteo (iii)')
+    con.close()
+
+
+def test_migrate_round_trip(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    # repeated but for its source, and without timestamp: dropped
+    legacy(db, ROWS + [('2024-01-01 00:10:00', 2.5, 80, '/in/VMSW43.2.zip'), (None, 3.0, 80, '/in/VRXA00.4')])
+    res = schema.migrate(db, verbose=False)
+    assert res == {'meteo': {'before': 5, 'after': 3}}
+
+    con = sqlite3.connect(db)
+    assert schema.is_epoch(con, 'meteo') and schema.primary_key(con, 'meteo') == ['dtm']
+    sql = con.execute("select sql from sqlite_master where name = 'meteo'").fetchone()[0]
+    assert sql.lower().endswith('without rowid')
+    types = {name: dtype for cid, name, dtype, *_ in con.execute("pragma table_info(meteo)")}
+    assert types == {'dtm': 'INTEGER', 'tre200s0': 'REAL', 'iii': 'INTEGER', 'source': 'TEXT'}
+    # the index on dtm is replaced by the primary key, others are kept
+    assert [tpl[1] for tpl in con.execute("pragma index_list(meteo)") if not tpl[1].startswith('sqlite_')] == [
+        'ix_meteo_iii']
+    df = pd.read_sql("select * from meteo order by dtm", con)
+    con.close()
+    df['dtm'] = schema.to_datetime(df['dtm'], True).dt.strftime('%Y-%m-%d %H:%M:%S')
+    expected = pd.DataFrame(sorted(ROWS), columns=['dtm', 'tre200s0', 'iii', 'source'])
+    pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+
+    # managed tables are left alone
+    assert schema.migrate(db, verbose=False) == {}
+
+
+def test_migrate_refuses_conflicts(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    # the same epoch second, spelled differently, with a different value
+    legacy(db, ROWS + [('2024-01-01 00:10', 9.5, 80, '/in/VMSW43.2.zip')])
+    con = sqlite3.connect(db, isolation_level=None)
+    with pytest.raises(DuplicateKeyError, match='df2sqlite.df2sqlite'):
+        schema.migrate_table(con, 'meteo', verbose=False)
+    assert not schema.is_epoch(con, 'meteo')
+    assert con.execute("select count(*) from meteo").fetchone()[0] == 4
+    assert not con.in_transaction
+    con.close()
+    assert schema.migrate(db, verbose=False) == {}
+
+
+def test_milos_columns_declared():
+    declared = schema.SCHEMAS['milos']['columns']
+    assert set(milos2df.COLUMNS) <= set(declared)
+    assert set(declared) - set(milos2df.COLUMNS) == {'source_id'}
+    assert schema.column_type('milos', 'dkl010s0', 'object') == 'REAL'
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""The source column of legacy tables replaced by source_id in place, and rows encoded on load."""
+import sqlite3
+import pandas as pd
+from df2sqlite import df2sqlite, sources
+
+ROWS = [('2024-01-01 00:00:00', 1.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:10:00', 2.0, '/in/VRXA00.2'),
+        ('2024-01-01 00:20:00', 3.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:30:00', 4.0, None)]
+
+
+def legacy(db: str, tbl: str, rows: list) -> None:
+    df = pd.DataFrame(rows, columns=['dtm', 'tre200s0', 'source'])
+    con = sqlite3.connect(db)
+    df.to_sql(tbl, con, index=False)
+    con.close()
+
+
+def test_migrate_round_trip(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    legacy(db, 'meteo', ROWS)
+    legacy(db, 'meteo_old', ROWS[:2])
+    con = sqlite3.connect(db)
+    # paths interned before keep their id
+    known = sources.intern(con, ['/in/VRXA00.2'])['/in/VRXA00.2']
+    con.commit()
+    con.close()
+
+    res = sources.migrate(db, verbose=False)
+    assert res == {'meteo': {'rows': 3, 'sources': 2}, 'meteo_old': {'rows': 2, 'sources': 2}}
+
+    con = sqlite3.connect(db)
+    for tbl, rows in (('meteo', ROWS), ('meteo_old', ROWS[:2])):
+        assert [tpl[1] for tpl in con.execute(f"pragma table_info({tbl})")] == ['dtm', 'tre200s0', 'source_id']
+        assert con.execute(f"select t.dtm, t.tre200s0, s.path from {tbl} t left join _sources s "
+                           "on s.id = t.source_id order by t.dtm").fetchall() == rows
+    assert sorted(con.execute("select path from _sources")) == [('/in/VMSW43.1.zip',), ('/in/VRXA00.2',)]
+    assert con.execute("select id from _sources where path = '/in/VRXA00.2'").fetchone()[0] == known
+    con.close()
+    assert sources.migrate(db, verbose=False) == {}
+
+
+def test_migrate_table_within_transaction(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    legacy(db, 'meteo', ROWS)
+    con = sqlite3.connect(db)
+    sources.migrate_table(con, 'meteo', verbose=False)
+    assert con.in_transaction
+    con.rollback()
+    assert [tpl[1] for tpl in con.execute("pragma table_info(meteo)")] == ['dtm', 'tre200s0', 'source']
+    assert con.execute("select count(*) from meteo where source is not null").fetchone()[0] == 3
+    con.close()
+
+
+def test_dedup_with_source_id(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    # loaded twice from different files: one observation
+    legacy(db, 'meteo', ROWS[:2] + [('2024-01-01 00:00:00', 1.0, '/in/VRXA00.1')])
+    sources.migrate(db, verbose=False)
+    res = df2sqlite.dedup(db, ['meteo'], verbose=False)
+    assert res['meteo']['identical'] == 1
+    con = sqlite3.connect(db)
+    assert con.execute(f"select dtm, tre200s0, {sources.path_of('source_id')} from meteo order by dtm").fetchall() == [
+        ('2024-01-01 00:00:00', 1.0, '/in/VMSW43.1.zip'), ('2024-01-01 00:10:00', 2.0, '/in/VRXA00.2')]
+    con.close()
+
+
+def test_load_migrates_legacy_table(tmp_path):
+    db = str(tmp_path / "db.sqlite")
+    legacy(db, 'meteo', ROWS[:2])
+    df = pd.DataFrame({'tre200s0': [5.0], 'source': ['/in/VRXA00.5']},
+                      index=pd.DatetimeIndex(['2024-01-01 00:50'], name='dtm'))
+    df2sqlite.append_to_sqlite_db(df, db, 'meteo')
+    con = sqlite3.connect(db)
+    assert [tpl[1] for tpl in con.execute("pragma table_info(meteo)")] == ['dtm', 'tre200s0', 'source_id']
+    assert [path for (path,) in con.execute(f"select {sources.path_of('source_id')} from meteo order by dtm")] == [
+        '/in/VMSW43.1.zip', '/in/VRXA00.2', '/in/VRXA00.5']
+    con.close()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""The vectorized timestamp constructors against the pandas parsing the baseline extractors used."""
+import numpy as np
+import pandas as pd
+import pytest
+from extract2df import timestamps
+
+TIMES = pd.date_range('2019-12-31 22:00', periods=500, freq='17min')
+
+
+def same(result, expected):
+    """Equal timestamps, whatever the resolution."""
+    pd.testing.assert_series_equal(pd.Series(result).astype('datetime64[ns]').reset_index(drop=True),
+                                   pd.Series(expected).astype('datetime64[ns]').reset_index(drop=True),
+                                   check_names=False)
+
+
+@pytest.mark.parametrize('n', [1, timestamps.SMALL - 1, timestamps.SMALL, len(TIMES)])
+def test_from_compact(n):
+    values = TIMES[:n].strftime('%Y%m%d%H%M').astype('int64')
+    same(timestamps.from_compact(values), pd.to_datetime(pd.Series(values), format='%Y%m%d%H%M'))
+    strings = pd.Series(TIMES[:n].strftime('%Y%m%d%H%M%S'))
+    same(timestamps.from_compact(strings), pd.to_datetime(strings, format='%Y%m%d%H%M%S'))
+
+
+def test_from_compact_invalid():
+    res = timestamps.from_compact(pd.Series([202305120520, 202302300000, 202305122460]))
+    assert res.iloc[0] == pd.Timestamp('2023-05-12 05:20') and res.iloc[1:].isna().all()
+
+
+def test_from_components():
+    res = timestamps.from_components(TIMES.year, TIMES.month, TIMES.day, TIMES.hour, TIMES.minute, 0)
+    same(res, TIMES)
+    # out of range, or rolling over into the next month
+    res = timestamps.from_components([2023, 2023, 2023, np.nan], [2, 13, 4, 1], [29, 1, 31, 1])
+    assert res.isna().all()
+
+
+def test_from_date_time():
+    date, time = pd.Series(TIMES.strftime('%Y-%m-%d')), pd.Series(TIMES.strftime('%H:%M:%S'))
+    same(timestamps.from_date_time(date, time), pd.to_datetime(date + ' ' + time))
+
+
+def test_round_to():
+    ts = pd.Series(TIMES + pd.to_timedelta(np.arange(len(TIMES)) % 60, unit='s'))
+    same(timestamps.round_to(ts, '1min'), ts.apply(lambda x: x.round(freq='min')))
+    same(timestamps.floor_to(ts, '10min'), ts.dt.floor('10min'))
+
+
+def test_from_offsets():
+    epoch = pd.Timestamp('2020-01-01')
+    hours = np.arange(0, 48, 0.5)
+    same(timestamps.from_offsets(epoch, hours, unit='h'), epoch + pd.to_timedelta(hours, unit='h'))
+
+
+def test_to_epoch():
+    assert timestamps.to_epoch(pd.Series(TIMES[:2])).tolist() == [int(t.timestamp()) for t in TIMES[:2]]
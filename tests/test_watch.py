@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""Watch mode: a backlog in incoming is loaded in micro-batches of at most batch_files files, each committed,
+then recorded in the ledger and archived."""
+import os
+import glob
+import shutil
+import sqlite3
+from etl.etl import ETLHandler
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+
+def test_watch_backlog(tmp_path, monkeypatch):
+    shutil.copytree(os.path.join(DATA, "tei49i"), tmp_path / "incoming" / "tei49i")
+    shutil.copytree(os.path.join(DATA, "meteo"), tmp_path / "incoming" / "meteo")
+    files = glob.glob(str(tmp_path / "incoming" / "*" / "*"))
+    db = str(tmp_path / "db.sqlite")
+    ETLHandler(dict(verbose=False, index='dtm', seconds=False, logfile=None, ledger=True,
+                    incoming=str(tmp_path / "incoming"), archive=str(tmp_path / "archive"), database=db))
+
+    batches, archived = [], []
+    process_batch = ETLHandler.process_batch.__func__
+    archive_loaded_file = ETLHandler.archive_loaded_file.__func__
+
+    def spy_batch(cls, files, *args, **kwargs):
+        batches.append(len(files))
+        return process_batch(cls, files, *args, **kwargs)
+
+    def spy_archive(cls, file, tbl):
+        # the file's rows and its ledger entry are committed before it is archived
+        con = sqlite3.connect(db)
+        assert con.execute(f"select count(*) from {tbl}").fetchone()[0] > 0
+        assert con.execute("select count(*) from _ingest_ledger where path = ?", (file,)).fetchone()[0] == 1
+        con.close()
+        archived.append(file)
+        return archive_loaded_file(cls, file, tbl)
+
+    monkeypatch.setattr(ETLHandler, 'process_batch', classmethod(spy_batch))
+    monkeypatch.setattr(ETLHandler, 'archive_loaded_file', classmethod(spy_archive))
+
+    res = ETLHandler.watch(interval=60, batch_files=4, poll=0.05, duration=1)
+    assert res['files'] == res['loaded'] == len(files)
+    # all files are taken in the same poll, but no batch holds more than batch_files
+    assert batches == [4, 4, 4, len(files) - 12] and res['batches'] == len(batches)
+    assert sorted(archived) == sorted(files)
+    assert glob.glob(str(tmp_path / "incoming" / "*" / "*")) == []
+    assert len(glob.glob(str(tmp_path / "archive" / "*" / "*" / "*"))) == len(files)
+
+    con = sqlite3.connect(db)
+    assert con.execute("select count(*) from tei49i").fetchone()[0] > 0
+    assert con.execute("select count(*) from meteo").fetchone()[0] > 0
+    assert con.execute("select count(*) from _ingest_ledger").fetchone()[0] == len(files)
+    con.close()
@@ -5,6 +5,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import sqlite3
+from df2parquet import df2parquet
+from df2sqlite import schema
 
 # Another utility for the legend
 from matplotlib.cm import ScalarMappable
@@ -20,21 +22,140 @@ fields = ["Press", "GeopAlt", "O3_ppmv", "O3_DU"]
 dtm = ["1998-01-01", "2022-12-31"]
 
 # %%
-def load_data(db: str, tbl: str, fields=[], dtm=[]) -> pd.DataFrame:
+def _width(bucket) -> int:
+    """Bucket width in seconds from a number of seconds or a pandas frequency string such as '1h'."""
+    if isinstance(bucket, str):
+        return max(1, int(pd.Timedelta(bucket).total_seconds()))
+    return max(1, int(bucket))
+
+
+def decimate_lttb(x, y, points: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets decimation of a series.
+
+    Keeps the first and last point and, for each of points - 2 equal-count buckets in between, the point forming
+    the largest triangle with the point kept before and the mean of the next bucket.
+
+    Args:
+        x (array-like): numeric x values, e.g. epoch seconds, sorted
+        y (array-like): y values without NaN
+        points (int): number of points to keep
+
+    Returns:
+        np.ndarray: positions of the points kept
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, points - 1).astype('int64')
+    keep = np.empty(points, dtype='int64')
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2]) if i + 2 < len(edges) else slice(n - 1, n)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def _aggregate(df: pd.DataFrame, fields: list, width: int, origin=0) -> pd.DataFrame:
+    """min/max/mean/count per time bucket of a frame read in full (from the Parquet mirror)."""
+    epoch = df['dtm'].to_numpy(dtype='datetime64[s]').astype('int64')
+    groups = df[fields].groupby((epoch - origin) // width * width + origin)
+    res = pd.DataFrame(index=groups.size().index)
+    for field in fields:
+        res[field] = groups[field].mean()
+        res[f"{field}_min"] = groups[field].min()
+        res[f"{field}_max"] = groups[field].max()
+        res[f"{field}_n"] = groups[field].count()
+    res.insert(0, 'dtm', pd.to_datetime(res.index, unit='s'))
+    return res.reset_index(drop=True)
+
+
+def load_data(db: str, tbl: str, fields=[], dtm=[], mirror=None, points=None, bucket=None, lttb=False) -> pd.DataFrame:
+    """Load time series from a DB table, optionally downsampled to a number of points or time buckets.
+
+    With points or bucket, rows are aggregated per time bucket in SQL (or, reading from a mirror, in pandas), so
+    that the size of the result does not depend on the size of the table. Each field then comes with its mean
+    (under the field's name), <field>_min, <field>_max and <field>_n, dtm being the start of the bucket.
+    Buckets of a given width are aligned to midnight UTC, buckets derived from points to the first timestamp.
+
+    Args:
+        db (str): path to SQLite3 DB
+        tbl (str): name of DB table
+        fields (list): columns to load besides dtm
+        dtm (list, optional): [begin] or [begin, end] of period. Defaults to [], i.e., everything.
+        mirror (str, optional): root of a Parquet mirror (see df2parquet) to read from instead of the DB, with column and date-range pushdown. Defaults to None.
+        points (int, optional): number of buckets spanning the period, i.e. rows returned. Defaults to None.
+        bucket (int or str, optional): bucket width in seconds, or as pandas frequency, e.g. '1h'. Overrides the width derived from points. Defaults to None.
+        lttb (bool, optional): aggregate to 4 * points buckets, then keep points of them by LTTB on the mean of the first field, which follows the shape of the series more closely than points equal-width buckets. Requires points. Defaults to False.
+
+    Returns:
+        pd.DataFrame: dtm and fields, sorted by dtm
+    """
     try:
         if not fields:
             raise ValueError("fields cannot be an empty list.")
+        downsample = bool(points or bucket)
+        if lttb and not points:
+            raise ValueError("lttb requires points.")
+        buckets = points * 4 if lttb else points
+
+        if mirror:
+            df = df2parquet.read_mirror(mirror, db, tbl, fields=fields, dtm=dtm)
+            if downsample and not df.empty:
+                origin = 0
+                if bucket:
+                    width = _width(bucket)
+                else:
+                    first, last = df['dtm'].min(), df['dtm'].max()
+                    width = int((last - first).total_seconds()) // buckets + 1
+                    origin = int(first.timestamp())
+                df = _aggregate(df, fields, width, origin)
         else:
-            fields = ", ".join(fields)
-        if len(dtm)==2:
-            where = f"WHERE dtm BETWEEN '{dtm[0]}' and '{dtm[1]}'"
-        elif len(dtm)==1:
-            where = f"WHERE dtm >= '{dtm[0]}'"
-
-        con = sqlite3.connect(db)
-        qry = f"SELECT dtm, {fields} FROM {tbl} {where} ORDER BY dtm"
-        df = pd.read_sql_query(qry, con, parse_dates = ['dtm'])
-        con.close()
+            con = sqlite3.connect(db)
+            # managed tables hold epoch seconds, compared as integers
+            epoch = schema.is_epoch(con, tbl)
+            bounds = [schema.bound(x, epoch) if epoch else f"'{x}'" for x in dtm]
+            where = ""
+            if len(dtm)==2:
+                where = f"WHERE dtm BETWEEN {bounds[0]} and {bounds[1]}"
+            elif len(dtm)==1:
+                where = f"WHERE dtm >= {bounds[0]}"
+
+            if downsample:
+                origin = 0
+                if bucket:
+                    width = _width(bucket)
+                else:
+                    first, last = con.execute(f"SELECT min(dtm), max(dtm) FROM {tbl} {where}").fetchone()
+                    width = 1
+                    if first is not None:
+                        first, last = schema.to_datetime([first, last], epoch)
+                        width = int((last - first).total_seconds()) // buckets + 1
+                        origin = int(first.timestamp())
+                seconds = "dtm" if epoch else "CAST(strftime('%s', dtm) AS INTEGER)"
+                aggregates = ", ".join(f'avg("{f}") AS "{f}", min("{f}") AS "{f}_min", max("{f}") AS "{f}_max", '
+                                       f'count("{f}") AS "{f}_n"' for f in fields)
+                qry = f"SELECT ({seconds} - {origin}) / {width} * {width} + {origin} AS bucket, {aggregates} " \
+                      f"FROM {tbl} {where} GROUP BY bucket ORDER BY bucket"
+                df = pd.read_sql_query(qry, con)
+                df.insert(0, 'dtm', pd.to_datetime(df.pop('bucket'), unit='s'))
+            else:
+                qry = f"SELECT dtm, {', '.join(fields)} FROM {tbl} {where} ORDER BY dtm"
+                df = pd.read_sql_query(qry, con)
+                df['dtm'] = schema.to_datetime(df['dtm'], epoch)
+            con.close()
+
+        if lttb and len(df) > points:
+            series = df[['dtm', fields[0]]].dropna()
+            keep = decimate_lttb(series['dtm'].to_numpy(dtype='datetime64[s]').astype('int64'),
+                                 series[fields[0]], points)
+            df = df.loc[series.index[keep]].reset_index(drop=True)
         return df
 
     except Exception as err: